@@ -1,13 +1,18 @@
+import hmac
+import threading
+
 import segysdk
-from fastapi import Security
+from fastapi import HTTPException, Security
 from fastapi.security import HTTPBearer
 from fastapi.security.api_key import APIKeyHeader
+from starlette.status import HTTP_403_FORBIDDEN
 
 from core.config import settings
 
 security = HTTPBearer()
 api_key_header = APIKeyHeader(scheme_name="appkey", name="appkey")
 bearer_header = APIKeyHeader(scheme_name="bearer", name="Authorization")
+admin_key_header = APIKeyHeader(scheme_name="admin key", name="x-admin-key", auto_error=False)
 
 
 async def get_bearer(
@@ -23,5 +28,19 @@ async def get_api_key(
     return api_key_header
 
 
+# Admin routes are served to callers sending ADMIN_API_KEY, and to nobody while it is not set
+async def require_admin(
+        admin_key: str = Security(admin_key_header)
+):
+    if not settings.ADMIN_API_KEY or not admin_key or \
+            not hmac.compare_digest(admin_key.encode(), settings.ADMIN_API_KEY.encode()):
+        raise HTTPException(status_code=HTTP_403_FORBIDDEN, detail="Admin routes need the x-admin-key of the service")
+
+
+# segysdk keeps one set of credentials for the process and reads them when a session is
+# created, so configuring them and creating the session happen under this lock
+remote_access_lock = threading.Lock()
+
+
 def configure_remote_access(sdms_bearer_token, sdms_app_key):
     segysdk.segy_configure_remote_access(settings.SDMS_URL, sdms_app_key, sdms_bearer_token)
@@ -4,8 +4,14 @@ from fastapi import HTTPException
 from starlette.requests import Request
 from starlette.responses import JSONResponse
 
+from core.access import revoke_on_denial
+from core.log import traceback_sampled
 
-async def http_error_handler(_: Request, exc: HTTPException) -> JSONResponse:
-    logging.error("Exception occurred", exc_info=True)
+
+async def http_error_handler(request: Request, exc: HTTPException) -> JSONResponse:
+    logging.log(logging.ERROR if exc.status_code >= 500 else logging.WARNING,
+                str(exc.detail), exc_info=exc if traceback_sampled(exc.status_code) else None,
+                extra={'fields': {'status': exc.status_code, 'method': request.method, 'path': request.url.path}})
+    revoke_on_denial(request.headers.get('Authorization'), request.query_params.get('sdpath'), exc.status_code)
 
     return JSONResponse({"errors": [exc.detail]}, status_code=exc.status_code)
@@ -0,0 +1,14 @@
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+
+from core.resilience import CircuitOpenError
+
+
+# also answers MemoryBudgetExceeded, which has a retry_after as well
+async def circuit_open_error_handler(_: Request, exc: CircuitOpenError) -> JSONResponse:
+    return JSONResponse({"errors": [str(exc)]}, status_code=exc.status_code,
+                        headers={"Retry-After": str(int(exc.retry_after) + 1)})
+
+
+async def request_abandoned_error_handler(_: Request, exc: Exception) -> JSONResponse:
+    return JSONResponse({"errors": [str(exc)]}, status_code=exc.status_code)
@@ -0,0 +1,89 @@
+import asyncio
+import math
+
+from starlette.responses import JSONResponse
+
+from core.config import settings
+from core.deadlines import RequestScope, enter_scope, leave_scope
+
+DEADLINE_HEADER = b'x-request-timeout'
+
+# routes streaming long results or scanning whole files get a longer default deadline than single lookups
+STREAMING_ROUTES = ("metadata/batch", "segy/traces", "segy/headerProfile", "openzgy/arbitraryLine", "openzgy/gather")
+
+
+def route_deadline(path: str):
+    if path.startswith(settings.API_PATH + "jobs"):
+        return None
+    if path[len(settings.API_PATH):] in STREAMING_ROUTES:
+        return settings.STREAMING_REQUEST_DEADLINE
+    return settings.REQUEST_DEADLINE
+
+
+# Gives every HTTP request a deadline, from the X-Request-Timeout header in seconds or the route default.
+# Requests whose header is not a finite number are turned down. Once the request body is read, the
+# connection is watched so that the request notices when the client goes away. The body is passed
+# through to the route as it arrives, only its first message is read up front.
+class DeadlineMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        timeout = route_deadline(scope['path'])
+        for name, value in scope.get('headers', []):
+            if name == DEADLINE_HEADER:
+                try:
+                    timeout = float(value)
+                except ValueError:
+                    timeout = math.nan
+                if not math.isfinite(timeout):
+                    response = JSONResponse({"detail": "X-Request-Timeout is a finite number of seconds"},
+                                            status_code=400)
+                    await response(scope, receive, send)
+                    return
+                timeout = max(timeout, 0.0)
+
+        request_scope = RequestScope(timeout)
+        watcher = None
+
+        def body_complete(message):
+            nonlocal watcher
+            if message['type'] == 'http.disconnect':
+                request_scope.mark_disconnected()
+            elif not message.get('more_body', False):
+                watcher = asyncio.ensure_future(self.__watch(receive, request_scope))
+
+        first = await receive()
+        body_complete(first)
+
+        async def receive_body():
+            nonlocal first
+            if first is not None:
+                message, first = first, None
+                return message
+            if watcher is not None or request_scope.disconnected:
+                await request_scope.wait_disconnected()
+                return {'type': 'http.disconnect'}
+            message = await receive()
+            body_complete(message)
+            return message
+
+        token = enter_scope(request_scope)
+        try:
+            await self.app(scope, receive_body, send)
+        finally:
+            leave_scope(token)
+            if watcher:
+                watcher.cancel()
+
+    @staticmethod
+    async def __watch(receive, request_scope):
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                request_scope.mark_disconnected()
+                return
@@ -1,9 +1,14 @@
 from fastapi import APIRouter
 
-from api.routes import route_status, route_segy, route_openzgy
+from api.routes import route_status, route_segy, route_openzgy, route_batch, route_jobs, route_footprints, \
+    route_prefetch
 
 api_router = APIRouter()
 
 api_router.include_router(route_status.router)
 api_router.include_router(route_segy.router)
 api_router.include_router(route_openzgy.router)
+api_router.include_router(route_batch.router)
+api_router.include_router(route_jobs.router)
+api_router.include_router(route_footprints.router)
+api_router.include_router(route_prefetch.router)
@@ -0,0 +1,105 @@
+import asyncio
+import enum
+import itertools
+import json
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.security.api_key import APIKey
+from pydantic import BaseModel
+from starlette.responses import StreamingResponse
+from starlette.status import HTTP_400_BAD_REQUEST, HTTP_500_INTERNAL_SERVER_ERROR
+
+from api.dependencies.authentication import get_bearer, get_api_key
+from api.routes import route_segy, route_openzgy
+from core.access import revoke_on_denial
+from core.config import settings
+from core.deadlines import ClientDisconnected, DeadlineExceeded, deadline_expired
+from core.executor import run_sdk_call
+from core.memory import MemoryBudgetExceeded
+from core.resilience import CircuitOpenError
+
+router = APIRouter()
+
+
+class MetadataKind(str, enum.Enum):
+    segy_revision = "segy/revision"
+    segy_is_3d = "segy/is3D"
+    segy_trace_header_field_count = "segy/traceHeaderFieldCount"
+    segy_textual_header = "segy/textualHeader"
+    segy_extended_textual_headers = "segy/extendedTextualHeaders"
+    segy_binary_header = "segy/binaryHeader"
+    openzgy_headers = "openzgy/headers"
+    openzgy_bingrid = "openzgy/bingrid"
+
+
+READERS = {
+    MetadataKind.segy_revision: route_segy.read_revision,
+    MetadataKind.segy_is_3d: route_segy.read_is_3d,
+    MetadataKind.segy_trace_header_field_count: route_segy.read_trace_header_field_count,
+    MetadataKind.segy_textual_header: route_segy.read_textual_header,
+    MetadataKind.segy_extended_textual_headers: route_segy.read_extended_textual_headers,
+    MetadataKind.segy_binary_header: route_segy.read_binary_header,
+    MetadataKind.openzgy_headers: route_openzgy.read_headers,
+    MetadataKind.openzgy_bingrid: route_openzgy.read_bingrid,
+}
+
+
+class BatchRequest(BaseModel):
+    sdpaths: List[str]
+    kinds: List[MetadataKind]
+    max_concurrency: Optional[int] = None
+
+
+@router.post(settings.API_PATH + "metadata/batch", tags=["BATCH"])
+async def post_metadata_batch(
+        batch: BatchRequest,
+        bearer: APIKey = Depends(get_bearer),
+        api_key: APIKey = Depends(get_api_key)):
+    count = len(batch.sdpaths) * len(batch.kinds)
+    if count > settings.BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=HTTP_400_BAD_REQUEST,
+                            detail=f"A batch is limited to {settings.BATCH_MAX_ITEMS} items, got {count}")
+
+    concurrency = max(min(batch.max_concurrency or settings.BATCH_MAX_CONCURRENCY,
+                          settings.BATCH_MAX_CONCURRENCY), 1)
+    items = ((sdpath, kind) for sdpath in batch.sdpaths for kind in batch.kinds)
+    return StreamingResponse(__stream_results(items, bearer, api_key, concurrency),
+                             media_type="application/x-ndjson")
+
+
+async def __run_item(sdpath, kind, bearer, api_key):
+    item = {"sdpath": sdpath, "kind": kind.value}
+    try:
+        result = await run_sdk_call(READERS[kind], bearer, api_key, sdpath)
+        item.update(status=200, result=result)
+    except HTTPException as he:
+        # the error handler only sees sdpath query parameters, those of the items are revoked here
+        revoke_on_denial(bearer, sdpath, he.status_code)
+        item.update(status=he.status_code, error=he.detail)
+    except (CircuitOpenError, MemoryBudgetExceeded, DeadlineExceeded, ClientDisconnected) as se:
+        item.update(status=se.status_code, error=str(se))
+    except Exception as e:
+        item.update(status=HTTP_500_INTERNAL_SERVER_ERROR, error=str(e))
+    return item
+
+
+# Keeps at most `concurrency` items running and writes one json line per item as it completes,
+# stopping once the request deadline passes or the client disconnects
+async def __stream_results(items, bearer, api_key, concurrency):
+    pending = set()
+    try:
+        while True:
+            if deadline_expired():
+                return
+            for sdpath, kind in itertools.islice(items, concurrency - len(pending)):
+                pending.add(asyncio.ensure_future(__run_item(sdpath, kind, bearer, api_key)))
+            if not pending:
+                return
+
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                yield json.dumps(task.result()) + "\n"
+    finally:
+        for task in pending:
+            task.cancel()
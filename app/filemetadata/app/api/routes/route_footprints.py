@@ -0,0 +1,96 @@
+import re
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.security.api_key import APIKey
+from pydantic import BaseModel
+from starlette.status import HTTP_400_BAD_REQUEST
+
+from api.dependencies.authentication import get_bearer, get_api_key
+from core.access import authorize
+from core.config import settings
+from core.executor import run_sdk_call
+from core.footprints import get_footprint_index
+from core.sdms import SdmsError, SdPath
+
+router = APIRouter()
+
+
+class FootprintQuery(BaseModel):
+    # exactly one of a point, a [min x, min y, max x, max y] box or a polygon in world coordinates
+    point: Optional[List[float]] = None
+    bbox: Optional[List[float]] = None
+    polygon: Optional[List[List[float]]] = None
+    # only volumes whose sdpath starts with this, at least a tenant such as sd://tenant/
+    prefix: str
+    # at most this many sdpaths, no more than FOOTPRINT_QUERY_MAX_RESULTS
+    limit: Optional[int] = None
+
+
+@router.post(settings.API_PATH + "footprints/query", tags=["FOOTPRINTS"])
+async def query_footprints(
+        query: FootprintQuery,
+        bearer: APIKey = Depends(get_bearer),
+        api_key: APIKey = Depends(get_api_key)):
+    shapes = [shape for shape in (query.point, query.bbox, query.polygon) if shape is not None]
+    if len(shapes) != 1:
+        raise HTTPException(status_code=HTTP_400_BAD_REQUEST, detail="Exactly one of point, bbox or polygon is required")
+    if not re.match(r'sd://[^/]+/', query.prefix):
+        raise HTTPException(status_code=HTTP_400_BAD_REQUEST, detail="The prefix names at least a tenant, sd://tenant/")
+    limit = min(query.limit or settings.FOOTPRINT_QUERY_MAX_RESULTS, settings.FOOTPRINT_QUERY_MAX_RESULTS)
+    if limit < 1:
+        raise HTTPException(status_code=HTTP_400_BAD_REQUEST, detail="The limit is at least 1")
+
+    if query.point is not None:
+        if len(query.point) != 2:
+            raise HTTPException(status_code=HTTP_400_BAD_REQUEST, detail="A point is [x, y]")
+        polygon = [query.point]
+    elif query.bbox is not None:
+        if len(query.bbox) != 4:
+            raise HTTPException(status_code=HTTP_400_BAD_REQUEST, detail="A bbox is [min x, min y, max x, max y]")
+        min_x, min_y, max_x, max_y = query.bbox
+        polygon = [[min_x, min_y], [max_x, min_y], [max_x, max_y], [min_x, max_y]]
+    else:
+        if len(query.polygon) < 3 or any(len(point) != 2 for point in query.polygon):
+            raise HTTPException(status_code=HTTP_400_BAD_REQUEST, detail="A polygon is at least three [x, y] points")
+        polygon = query.polygon
+
+    sdpaths = get_footprint_index().query(polygon, query.prefix)
+    if settings.SDMS_URL:
+        readable, truncated = await run_sdk_call(readable_sdpaths, bearer, sdpaths, limit)
+    else:
+        readable, truncated = sdpaths[:limit], len(sdpaths) > limit
+    return {"sdpaths": readable, "truncated": truncated}
+
+
+# The index holds volumes of every tenant, callers only see those they may read. The volumes
+# of each subproject are checked in index order, subprojects at the same time. A subproject
+# stops once it found limit readable volumes, none of its later ones can be among the first
+# limit then. Volumes SDMS no longer has leave the index.
+def readable_sdpaths(bearer, sdpaths, limit):
+    groups = {}
+    for position, sdpath in enumerate(sdpaths):
+        parsed = SdPath.parse(sdpath)
+        groups.setdefault((parsed.tenant, parsed.subproject), []).append((position, sdpath))
+
+    index = get_footprint_index()
+
+    def readable_in(group):
+        readable = []
+        for position, sdpath in group:
+            if len(readable) >= limit:
+                return readable, True
+            try:
+                authorize(bearer, sdpath)
+                readable.append((position, sdpath))
+            except SdmsError as se:
+                if se.status_code == 404:
+                    index.remove(sdpath)
+        return readable, False
+
+    with ThreadPoolExecutor(settings.FOOTPRINT_AUTHORIZE_WORKERS, thread_name_prefix='footprints') as pool:
+        results = list(pool.map(readable_in, groups.values()))
+    readable = sorted(found for group, _ in results for found in group)
+    truncated = len(readable) > limit or any(stopped for _, stopped in results)
+    return [sdpath for _, sdpath in readable[:limit]], truncated
@@ -0,0 +1,178 @@
+import enum
+import functools
+import inspect
+import json
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.security.api_key import APIKey
+from pydantic import BaseModel
+from starlette.responses import StreamingResponse
+from starlette.status import HTTP_202_ACCEPTED, HTTP_400_BAD_REQUEST, HTTP_404_NOT_FOUND, HTTP_409_CONFLICT
+
+from api.dependencies.authentication import get_bearer, get_api_key
+from api.routes import route_segy
+from core.access import authorize
+from core.config import settings
+from core.conversion import BearerExpired, check_bearer, convert_segy_to_zgy
+from core.jobs import get_job_manager, owner_of, JobNotFound, SUCCEEDED
+from core.sdms import SdmsError
+from core.segy import read_file_header, styled_json_around, styled_json_item, to_styled_json
+from core.storage import open_dataset_reader
+
+router = APIRouter()
+
+
+class JobKind(str, enum.Enum):
+    segy_raw_trace_headers = "segy/rawTraceHeaders"
+    segy_scaled_trace_headers = "segy/scaledTraceHeaders"
+    segy_convert_to_zgy = "segy/convertToZgy"
+
+
+TRACE_HEADER_SESSIONS = {
+    JobKind.segy_raw_trace_headers: functools.partial(route_segy.trace_header_session, scaled=False),
+    JobKind.segy_scaled_trace_headers: functools.partial(route_segy.trace_header_session, scaled=True),
+}
+
+
+class JobRequest(BaseModel):
+    kind: JobKind
+    sdpath: str
+    start_trace: int = 1
+    # defaults to every trace from start_trace to the end of the file
+    traces_to_dump: Optional[int] = None
+    # the ZGY dataset written by segy/convertToZgy
+    target_sdpath: Optional[str] = None
+
+
+@router.post(settings.API_PATH + "jobs", tags=["JOBS"], status_code=HTTP_202_ACCEPTED)
+async def post_job(
+        job: JobRequest,
+        bearer: APIKey = Depends(get_bearer),
+        api_key: APIKey = Depends(get_api_key)):
+    if job.start_trace < 1 or (job.traces_to_dump is not None and job.traces_to_dump < 1):
+        raise HTTPException(status_code=HTTP_400_BAD_REQUEST,
+                            detail="start_trace and traces_to_dump must be positive")
+
+    manager = get_job_manager()
+    if job.kind == JobKind.segy_convert_to_zgy:
+        if not job.target_sdpath:
+            raise HTTPException(status_code=HTTP_400_BAD_REQUEST, detail="target_sdpath is required")
+        try:
+            check_bearer(bearer, f"too little to convert {job.sdpath}")
+        except BearerExpired as be:
+            raise HTTPException(status_code=be.status_code, detail=str(be))
+        job_id = manager.submit(job.kind.value, job.sdpath, {"target_sdpath": job.target_sdpath},
+                                convert_segy_to_zgy, bearer, api_key, job.sdpath, job.target_sdpath,
+                                owner=owner_of(bearer))
+        return manager.status(job_id)
+
+    job_id = manager.submit(job.kind.value, job.sdpath, {"start_trace": job.start_trace,
+                                                         "traces_to_dump": job.traces_to_dump},
+                            dump_trace_headers, TRACE_HEADER_SESSIONS[job.kind], bearer, api_key, job.sdpath,
+                            job.start_trace, job.traces_to_dump, owner=owner_of(bearer))
+    return manager.status(job_id)
+
+
+@router.get(settings.API_PATH + "jobs/{job_id}", tags=["JOBS"])
+def get_job(
+        job_id: str,
+        bearer: APIKey = Depends(get_bearer),
+        api_key: APIKey = Depends(get_api_key)):
+    return __owned_job(job_id, bearer)
+
+
+@router.get(settings.API_PATH + "jobs/{job_id}/result", tags=["JOBS"])
+def get_job_result(
+        job_id: str,
+        bearer: APIKey = Depends(get_bearer),
+        api_key: APIKey = Depends(get_api_key)):
+    __owned_job(job_id, bearer)
+    try:
+        status, result = get_job_manager().result(job_id, owner_of(bearer))
+    except JobNotFound as e:
+        raise HTTPException(status_code=HTTP_404_NOT_FOUND, detail=str(e))
+    if status != SUCCEEDED:
+        raise HTTPException(status_code=HTTP_409_CONFLICT, detail=f"Job {job_id} is {status}")
+    if inspect.isgenerator(result):
+        # written piece by piece by the job, the pieces are the response body
+        return StreamingResponse(result, media_type="application/json")
+    return result
+
+
+@router.delete(settings.API_PATH + "jobs/{job_id}", tags=["JOBS"])
+def delete_job(
+        job_id: str,
+        bearer: APIKey = Depends(get_bearer),
+        api_key: APIKey = Depends(get_api_key)):
+    __owned_job(job_id, bearer)
+    try:
+        return {"job_id": job_id, "status": get_job_manager().cancel(job_id, owner_of(bearer))}
+    except JobNotFound as e:
+        raise HTTPException(status_code=HTTP_404_NOT_FOUND, detail=str(e))
+
+
+# The status of a job submitted with the same bearer, once SDMS confirms that the bearer may
+# still read the dataset of the job. Jobs of other callers are answered with 404.
+def __owned_job(job_id, bearer):
+    try:
+        status = get_job_manager().status(job_id, owner_of(bearer))
+        if settings.SDMS_URL:
+            authorize(bearer, status['sdpath'])
+        return status
+    except JobNotFound as e:
+        raise HTTPException(status_code=HTTP_404_NOT_FOUND, detail=str(e))
+    except SdmsError as se:
+        raise HTTPException(status_code=se.status_code, detail=str(se))
+
+
+# Dumps the trace headers chunk by chunk through one segysdk session so that progress is
+# reported and cancellation is honoured between chunks. The traces of each chunk are written
+# to the job store as they are read, the start of the response goes in front once the number
+# of traces is known, so that the store serves the response of a single segysdk call.
+def dump_trace_headers(context, trace_header_session, bearer, api_key, sdpath, start_trace, traces_to_dump):
+    if traces_to_dump is None:
+        traces_to_dump = __traces_after(bearer, sdpath, start_trace)
+    context.progress(0, traces_to_dump)
+
+    first = None
+    written = 0
+    done = 0
+    with trace_header_session(bearer, api_key, sdpath) as read:
+        while done < traces_to_dump:
+            count = min(settings.JOB_TRACES_PER_CHUNK, traces_to_dump - done)
+            chunk = json.loads(read(start_trace + done, count))
+            traces = chunk.pop("TraceData", [])
+            if first is None:
+                first = chunk
+            if traces:
+                context.write(__escaped(''.join(styled_json_item(trace, written + i) for i, trace in enumerate(traces))))
+                written += len(traces)
+            done += count
+            context.progress(done, traces_to_dump)
+            if len(traces) < count:
+                break
+
+    first["Metadata"]["StartTrace"] = start_trace
+    first["Metadata"]["TraceCount"] = written
+    if not written:
+        context.write('{"header":"' + __escaped(to_styled_json(dict(first, TraceData=[]))) + '"}', seq=0)
+        return
+    head, tail = styled_json_around(dict(first, TraceData=[]), "TraceData")
+    context.write('{"header":"' + __escaped(head), seq=0)
+    context.write(__escaped(tail) + '"}')
+
+
+# text as it appears inside a JSON string, pieces escaped one by one join up to the whole
+def __escaped(text):
+    return json.dumps(text, ensure_ascii=False)[1:-1]
+
+
+def __traces_after(bearer, sdpath, start_trace):
+    reader = open_dataset_reader(bearer, sdpath)
+    if reader.size is None:
+        raise ValueError(f"The size of {sdpath} is unknown, traces_to_dump is required")
+    traces = read_file_header(reader).trace_count(reader.size) - start_trace + 1
+    if traces < 1:
+        raise ValueError(f"{sdpath} has no traces from trace {start_trace}")
+    return traces
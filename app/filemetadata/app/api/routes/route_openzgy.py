@@ -5,16 +5,30 @@ import enum
 import math
 import json
 import vector
+from typing import Optional
 
-from fastapi import APIRouter, Depends, HTTPException
+import numpy as np
+from fastapi import APIRouter, Depends, HTTPException, Request
 from fastapi.security.api_key import APIKey
-from starlette.status import HTTP_500_INTERNAL_SERVER_ERROR
+from starlette.responses import Response
+from starlette.status import HTTP_400_BAD_REQUEST, HTTP_500_INTERNAL_SERVER_ERROR
 
 from api.dependencies.authentication import get_bearer, get_api_key, configure_remote_access
+from core.access import authorize
+from core.bricks import densify_polyline, gather_samples, polyline_position_count, read_section
 from core.config import settings
+from core.coordinates import BinGridTransform, CoordinateSystem, transform_cache
+from core.executor import run_sdk_call
+from core.footprints import record_footprint
+from core.memory import memory_budget
+from core.metadata_store import persisted
+from core.resilience import resilient
+from core.sdms import SdmsError
 
 router = APIRouter()
 
+BINARY_POINTS = "application/octet-stream"
+
 def internal_server_error(e: Exception): 
     return HTTPException(status_code=HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
 
@@ -136,49 +150,100 @@ class ZGYToBinGrid:
                 lst.append(m)
             return lst
 
-    def getValusAsJson(self):
+    def getValues(self):
         m = {}
         for attr in P6Bin:
             m[attr.name] = self.getValue(attr)
 
-        return json.dumps(m, indent=2)
+        return m
+
+    def getValusAsJson(self):
+        return json.dumps(self.getValues(), indent=2)
+
+
+# Header properties by response field name. Each one is read from the reader only when it is selected.
+HEADER_FIELDS = {
+    'Guid':                    lambda reader: str(reader.verid),
+    'Size':                    lambda reader: reader.size,
+    'BrickSize':               lambda reader: reader.bricksize,
+    'DataType':                lambda reader: str(reader.datatype),
+    'DataRange':               lambda reader: reader.datarange,
+    'ZUnitDimension':          lambda reader: str(reader.zunitdim),
+    'ZUnitName':               lambda reader: reader.zunitname,
+    'ZUnitFactor':             lambda reader: reader.zunitfactor,
+    'ZStart':                  lambda reader: reader.zstart,
+    'ZIncrement':              lambda reader: reader.zinc,
+    'XYUnitDimension':         lambda reader: str(reader.hunitdim),
+    'XYUnitName':              lambda reader: reader.hunitname,
+    'XYUnitFactor':            lambda reader: reader.hunitfactor,
+    'InlineStart':             lambda reader: reader.annotstart[0],
+    'InlineIncrement':         lambda reader: reader.annotinc[0],
+    'CrosslineStart':          lambda reader: reader.annotstart[1],
+    'CrosslineIncrement':      lambda reader: reader.annotinc[1],
+    'WorldCorners':            lambda reader: reader.corners,
+    'IndexCorners':            lambda reader: reader.indexcorners,
+    'AnnotationCorners':       lambda reader: reader.annotcorners,
+    'AmountOfLevelsOfDetail':  lambda reader: reader.nlods,
+    'BricksPerLevelsOfDetail': lambda reader: reader.brickcount,
+    'Statistics':              lambda reader: __statistics(reader.statistics),
+    'Histogram':               lambda reader: __histogram(reader.histogram),
+}
+
+
+def __statistics(statistics):
+    return {'Count': statistics[0], 'Sum': statistics[1], 'SumOfSquares': statistics[2],
+            'Minimum': statistics[3], 'Maximum': statistics[4]}
+
+
+def __histogram(histogram):
+    return {'Count': histogram[0], 'Minimum': histogram[1], 'Maximum': histogram[2], 'Bins': histogram[3]}
+
+
+def parse_header_fields(fields: Optional[str]):
+    if fields is None:
+        return None
+    selected = [field.strip() for field in fields.split(',') if field.strip()]
+    unknown = [field for field in selected if field not in HEADER_FIELDS]
+    if unknown or not selected:
+        raise HTTPException(status_code=HTTP_400_BAD_REQUEST,
+                            detail=f"Unknown header fields {unknown}, expected some of {list(HEADER_FIELDS)}")
+    return selected
 
 
 @router.get(settings.API_PATH + "openzgy/headers", tags=["OPENZGY"])
 async def get_headers(
         sdpath: str,
+        fields: Optional[str] = None,
+        histogram_bins: bool = True,
+        pretty: bool = False,
         bearer: APIKey = Depends(get_bearer),
         api_key: APIKey = Depends(get_api_key)):
+    return await run_sdk_call(read_headers, bearer, api_key, sdpath, parse_header_fields(fields), histogram_bins,
+                              pretty)
+
+
+def read_headers(bearer, api_key, sdpath, fields=None, histogram_bins=True, pretty=False):
+    if fields is None and histogram_bins:
+        headers = read_header_values(bearer, api_key, sdpath)
+    else:
+        headers = read_header_values(bearer, api_key, sdpath, fields, histogram_bins)
+    # also when the headers come from the cache, the index may not have the volume yet
+    if 'WorldCorners' in headers:
+        record_footprint(sdpath, headers['WorldCorners'])
+    return json.dumps(headers, indent=2 if pretty else None)
+
+
+@persisted("openzgy/headers")
+@resilient("openzgy")
+def read_header_values(bearer, api_key, sdpath, fields=None, histogram_bins=True):
     try:
-        with zgy.ZgyReader(sdpath, iocontext={"sdurl": settings.SDMS_URL, "sdapikey": api_key,
-                                          "sdtoken": bearer}) as reader:
-            headers = {
-                'Guid':                    str(reader.verid),
-                'Size':                    reader.size,
-                'BrickSize':               reader.bricksize,
-                'DataType':                str(reader.datatype),
-                'DataRange':               reader.datarange,
-                'ZUnitDimension':          str(reader.zunitdim),
-                'ZUnitName':               reader.zunitname,
-                'ZUnitFactor':             reader.zunitfactor,
-                'ZStart':                  reader.zstart,
-                'ZIncrement':              reader.zinc,
-                'XYUnitDimension':         str(reader.hunitdim),
-                'XYUnitName':              reader.hunitname,
-                'XYUnitFactor':            reader.hunitfactor,
-                'InlineStart':             reader.annotstart[0],
-                'InlineIncrement':         reader.annotinc[0],
-                'CrosslineStart':          reader.annotstart[1],
-                'CrosslineIncrement':      reader.annotinc[1],
-                'WorldCorners':            reader.corners,
-                'IndexCorners':            reader.indexcorners,
-                'AnnotationCorners':       reader.annotcorners,
-                'AmountOfLevelsOfDetail':  reader.nlods,
-                'BricksPerLevelsOfDetail': reader.brickcount,
-                'Statistics':              {'Count': reader.statistics[0], 'Sum': reader.statistics[1], 'SumOfSquares': reader.statistics[2], 'Minimum': reader.statistics[3],'Maximum': reader.statistics[4]},
-                'Histogram':               {'Count': reader.histogram[0], 'Minimum': reader.histogram[1], 'Maximum':reader.histogram[2], 'Bins': reader.histogram[3]}
-            }
-            return json.dumps(headers, indent=2)
+        with memory_budget.hold('openzgy'), \
+                zgy.ZgyReader(sdpath, iocontext={"sdurl": settings.SDMS_URL, "sdapikey": api_key,
+                                                 "sdtoken": bearer}) as reader:
+            headers = {field: HEADER_FIELDS[field](reader) for field in fields or HEADER_FIELDS}
+            if 'Histogram' in headers and not histogram_bins:
+                headers['Histogram'].pop('Bins')
+            return headers
     except zgy.ZgyError as ze:
         raise zgy_error(ze)
     except Exception as e:
@@ -190,9 +255,26 @@ async def get_bingrid(
         sdpath: str,
         bearer: APIKey = Depends(get_bearer),
         api_key: APIKey = Depends(get_api_key)):
+    return await run_sdk_call(read_bingrid, bearer, api_key, sdpath)
+
+
+def read_bingrid(bearer, api_key, sdpath):
+    values = read_bingrid_values(bearer, api_key, sdpath)
+    # like read_headers, also when the bin grid comes from the cache. The local coordinates go
+    # around the grid from the origin, the index takes the corners in ZGY order.
+    around = values[P6Bin.BinGridLocalCoordinates.name]
+    record_footprint(sdpath, [(around[i]["X"], around[i]["Y"]) for i in (0, 3, 1, 2)])
+    return json.dumps(values, indent=2)
+
+
+# The bin grid as a dict, for the gRPC interface to build its message without parsing JSON
+@persisted("openzgy/bingridValues")
+@resilient("openzgy")
+def read_bingrid_values(bearer, api_key, sdpath):
     try:
-        with zgy.ZgyReader(sdpath, iocontext={"sdurl": settings.SDMS_URL, "sdapikey": api_key,
-                                          "sdtoken": bearer}) as r:        
+        with memory_budget.hold('openzgy'), \
+                zgy.ZgyReader(sdpath, iocontext={"sdurl": settings.SDMS_URL, "sdapikey": api_key,
+                                                 "sdtoken": bearer}) as r:
             inline = Line(r.annotstart[0], r.annotinc[0], r.size[0])
             xline = Line(r.annotstart[1], r.annotinc[1], r.size[1])
             point00 = Point(r.indexcorners[0][0], r.indexcorners[0][1], 
@@ -212,8 +294,184 @@ async def get_bingrid(
                                 r.corners[3][0], r.corners[3][1])
             
             zgyToBinGrid = ZGYToBinGrid(point00, point10, point01, point11, inline, xline)
-            return zgyToBinGrid.getValusAsJson()
+            return zgyToBinGrid.getValues()
+    except zgy.ZgyError as ze:
+        raise zgy_error(ze)
+    except Exception as e:
+        raise internal_server_error(e)
+
+
+@router.post(settings.API_PATH + "openzgy/transform", tags=["OPENZGY"])
+async def post_transform(
+        request: Request,
+        sdpath: str,
+        source: CoordinateSystem,
+        target: CoordinateSystem,
+        bearer: APIKey = Depends(get_bearer),
+        api_key: APIKey = Depends(get_api_key)):
+    binary = request.headers.get('content-type', '').startswith(BINARY_POINTS)
+    return await run_sdk_call(transform_points, bearer, api_key, sdpath, await request.body(), binary, source, target)
+
+
+# Parsing, transforming and serialising large point lists run on an SDK thread, not on the event loop
+def transform_points(bearer, api_key, sdpath, body: bytes, binary: bool, source: CoordinateSystem,
+                     target: CoordinateSystem):
+    points = parse_points(body, binary, max_points=settings.TRANSFORM_MAX_POINTS)
+    transformed = read_transform(bearer, api_key, sdpath).transform(points, source, target)
+    if binary:
+        return Response(transformed.astype('<f8').tobytes(), media_type=BINARY_POINTS)
+    return Response(json.dumps({"points": transformed.tolist()}), media_type="application/json")
+
+
+# Points are either {"points": [[x, y], ...]} or, as application/octet-stream, little endian float64 x y pairs,
+# x y z triplets with three dimensions. More than max_points points are refused.
+def parse_points(body: bytes, binary: bool, dimensions: int = 2, max_points: Optional[int] = None):
+    if binary:
+        if len(body) % (8 * dimensions):
+            raise HTTPException(status_code=HTTP_400_BAD_REQUEST,
+                                detail=f"Binary points are {dimensions} float64 values each")
+        points = np.frombuffer(body, dtype='<f8').reshape(-1, dimensions)
+    else:
+        try:
+            points = np.asarray(json.loads(body)["points"], dtype=np.float64)
+        except (ValueError, KeyError, TypeError) as e:
+            raise HTTPException(status_code=HTTP_400_BAD_REQUEST, detail=f"Invalid points: {e}")
+        if points.size and (points.ndim != 2 or points.shape[1] != dimensions):
+            raise HTTPException(status_code=HTTP_400_BAD_REQUEST,
+                                detail=f"Points are [{', '.join('xyz'[:dimensions])}] lists")
+        points = points.reshape(-1, dimensions)
+    if max_points is not None and len(points) > max_points:
+        raise HTTPException(status_code=HTTP_400_BAD_REQUEST,
+                            detail=f"{len(points)} points, at most {max_points} are taken")
+    return points
+
+
+# Transforms are shared between callers once SDMS confirmed that the caller may read the
+# dataset, without SDMS to ask they are only served back to the bearer that loaded them
+def read_transform(bearer, api_key, sdpath):
+    if not settings.SDMS_URL:
+        return transform_cache.get((bearer, sdpath), lambda: __load_transform(bearer, api_key, sdpath))
+    try:
+        authorize(bearer, sdpath)
+    except SdmsError as se:
+        raise HTTPException(status_code=se.status_code, detail=str(se))
+    return transform_cache.get(sdpath, lambda: __load_transform(bearer, api_key, sdpath))
+
+
+@resilient("openzgy")
+def __load_transform(bearer, api_key, sdpath):
+    try:
+        with memory_budget.hold('openzgy'), \
+                zgy.ZgyReader(sdpath, iocontext={"sdurl": settings.SDMS_URL, "sdapikey": api_key,
+                                                 "sdtoken": bearer}) as reader:
+            return BinGridTransform(reader.indexcorners, reader.annotcorners, reader.corners)
     except zgy.ZgyError as ze:
         raise zgy_error(ze)
     except Exception as e:
         raise internal_server_error(e)
+
+
+@router.post(settings.API_PATH + "openzgy/arbitraryLine", tags=["OPENZGY"])
+async def post_arbitrary_line(
+        request: Request,
+        sdpath: str,
+        source: CoordinateSystem = CoordinateSystem.world,
+        zstart: int = 0,
+        zcount: Optional[int] = None,
+        bearer: APIKey = Depends(get_bearer),
+        api_key: APIKey = Depends(get_api_key)):
+    binary = request.headers.get('content-type', '').startswith(BINARY_POINTS)
+    return await run_sdk_call(arbitrary_line_response, bearer, api_key, sdpath, await request.body(), binary, source,
+                              zstart, zcount)
+
+
+def arbitrary_line_response(bearer, api_key, sdpath, body: bytes, binary: bool, source: CoordinateSystem,
+                            zstart: int, zcount: Optional[int]):
+    vertices = parse_points(body, binary)
+    if len(vertices) < 2:
+        raise HTTPException(status_code=HTTP_400_BAD_REQUEST, detail="A polyline has at least two vertices")
+    traces = read_arbitrary_line(bearer, api_key, sdpath, vertices, source, zstart, zcount)
+    headers = {"X-Trace-Count": str(traces.shape[0]), "X-Samples-Per-Trace": str(traces.shape[1]),
+               "X-Z-Start": str(zstart)}
+    return Response(traces.astype('<f4').tobytes(), media_type=BINARY_POINTS, headers=headers)
+
+
+# Float32 traces along the polyline through the vertices, one about every trace spacing,
+# interpolated from the four traces around each position. NaN where the line leaves the volume.
+@resilient("openzgy")
+def read_arbitrary_line(bearer, api_key, sdpath, vertices, source: CoordinateSystem, zstart: int = 0,
+                        zcount: Optional[int] = None):
+    try:
+        with memory_budget.hold('openzgy'), \
+                zgy.ZgyReader(sdpath, iocontext={"sdurl": settings.SDMS_URL, "sdapikey": api_key,
+                                                 "sdtoken": bearer}) as reader:
+            size = reader.size
+            zcount = size[2] - zstart if zcount is None else zcount
+            if zstart < 0 or zcount < 1 or zstart + zcount > size[2]:
+                raise HTTPException(status_code=HTTP_400_BAD_REQUEST,
+                                    detail=f"Samples {zstart} to {zstart + zcount} are outside 0 to {size[2]}")
+            transform = BinGridTransform(reader.indexcorners, reader.annotcorners, reader.corners)
+            index_vertices = transform.transform(vertices, source, CoordinateSystem.index)
+            try:
+                traces = polyline_position_count(index_vertices)
+            except ValueError as ve:
+                raise HTTPException(status_code=HTTP_400_BAD_REQUEST, detail=str(ve))
+            if traces > settings.ARBITRARY_LINE_MAX_TRACES:
+                raise HTTPException(status_code=HTTP_400_BAD_REQUEST,
+                                    detail=f"The line crosses {traces} traces, at most "
+                                           f"{settings.ARBITRARY_LINE_MAX_TRACES} are returned")
+            return read_section(reader, densify_polyline(index_vertices), zstart, zcount)
+    except HTTPException:
+        raise
+    except zgy.ZgyError as ze:
+        raise zgy_error(ze)
+    except Exception as e:
+        raise internal_server_error(e)
+
+
+@router.post(settings.API_PATH + "openzgy/gather", tags=["OPENZGY"])
+async def post_gather(
+        request: Request,
+        sdpath: str,
+        source: CoordinateSystem = CoordinateSystem.index,
+        lod: int = 0,
+        bearer: APIKey = Depends(get_bearer),
+        api_key: APIKey = Depends(get_api_key)):
+    binary = request.headers.get('content-type', '').startswith(BINARY_POINTS)
+    return await run_sdk_call(gather_response, bearer, api_key, sdpath, await request.body(), binary, source, lod)
+
+
+def gather_response(bearer, api_key, sdpath, body: bytes, binary: bool, source: CoordinateSystem, lod: int):
+    positions = parse_points(body, binary, 3, max_points=settings.GATHER_MAX_POINTS)
+    samples = read_gather(bearer, api_key, sdpath, positions, source, lod)
+    return Response(samples.astype('<f4').tobytes(), media_type=BINARY_POINTS,
+                    headers={"X-Point-Count": str(len(samples))})
+
+
+# Float32 samples at (x, y, z) positions, such as the picks of a horizon or the stations of a
+# well path, in their order and NaN outside the volume. z is a sample index for index positions
+# and in z units otherwise. Each brick holding a position is read once.
+@resilient("openzgy")
+def read_gather(bearer, api_key, sdpath, positions, source: CoordinateSystem, lod: int = 0):
+    try:
+        with memory_budget.hold('openzgy'), \
+                zgy.ZgyReader(sdpath, iocontext={"sdurl": settings.SDMS_URL, "sdapikey": api_key,
+                                                 "sdtoken": bearer}) as reader:
+            if not 0 <= lod < reader.nlods:
+                raise HTTPException(status_code=HTTP_400_BAD_REQUEST,
+                                    detail=f"Level of detail {lod} is outside 0 to {reader.nlods - 1}")
+            index = np.empty_like(positions)
+            if source == CoordinateSystem.index:
+                index[:] = positions
+            else:
+                transform = BinGridTransform(reader.indexcorners, reader.annotcorners, reader.corners)
+                index[:, :2] = transform.transform(positions[:, :2], source, CoordinateSystem.index)
+                index[:, 2] = (positions[:, 2] - reader.zstart) / reader.zinc
+            return gather_samples(reader, index, lod)
+    except HTTPException:
+        raise
+    except zgy.ZgyError as ze:
+        raise zgy_error(ze)
+    except Exception as e:
+        raise internal_server_error(e)
+
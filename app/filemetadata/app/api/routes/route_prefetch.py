@@ -0,0 +1,75 @@
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.security.api_key import APIKey
+from pydantic import BaseModel
+from starlette.status import HTTP_202_ACCEPTED, HTTP_400_BAD_REQUEST
+
+from api.dependencies.authentication import get_bearer, get_api_key, require_admin
+from api.routes.route_batch import READERS, MetadataKind
+from core.config import settings
+from core.executor import run_sdk_call
+from core.prefetch import PRIORITY_REQUESTED, Prefetcher
+from core.sdms import SdmsError
+
+router = APIRouter()
+
+ZGY_KINDS = [MetadataKind.openzgy_headers, MetadataKind.openzgy_bingrid]
+SEGY_KINDS = [kind for kind in MetadataKind if kind.value.startswith("segy/")]
+
+
+def default_kinds(sdpath: str):
+    return ZGY_KINDS if sdpath.lower().endswith(".zgy") else SEGY_KINDS
+
+
+# Reads every kind through the persisted readers, which leave the results in the metadata
+# caches and the dataset record. Failures of one kind do not keep the others from being read.
+def prefetch_dataset(bearer, api_key, sdpath, kinds):
+    errors = []
+    for kind in kinds or default_kinds(sdpath):
+        try:
+            READERS[kind](bearer, api_key, sdpath)
+        except Exception as e:
+            errors.append(f"{kind.value}: {getattr(e, 'detail', e)}")
+    if errors:
+        raise RuntimeError("; ".join(errors))
+
+
+prefetcher = Prefetcher(prefetch_dataset)
+
+
+class PrefetchRequest(BaseModel):
+    sdpaths: List[str] = []
+    # subprojects, sd://tenant/subproject, whose new datasets are prefetched as they are published
+    watch: List[str] = []
+    # the kinds of metadata of each file type when not given
+    kinds: Optional[List[MetadataKind]] = None
+    # lower values are prefetched first
+    priority: int = PRIORITY_REQUESTED
+
+
+# Queues datasets to have their metadata read into the caches in the background, with the
+# bearer of the request, before users open them. Watched subprojects are read by the service.
+@router.post(settings.API_PATH + "admin/prefetch", tags=["ADMIN"], status_code=HTTP_202_ACCEPTED,
+             dependencies=[Depends(require_admin)])
+async def post_prefetch(
+        request: PrefetchRequest,
+        bearer: APIKey = Depends(get_bearer),
+        api_key: APIKey = Depends(get_api_key)):
+    if request.watch and not (settings.SDMS_URL and settings.SERVICE_TOKEN_URL):
+        raise HTTPException(status_code=HTTP_400_BAD_REQUEST,
+                            detail="Watching subprojects needs SDMS_SERVICE_HOST and SERVICE_TOKEN_URL")
+
+    for subproject in request.watch:
+        try:
+            await run_sdk_call(prefetcher.watch, subproject, request.kinds, api_key)
+        except SdmsError as se:
+            raise HTTPException(status_code=se.status_code, detail=str(se))
+    queued = [sdpath for sdpath in request.sdpaths
+              if prefetcher.enqueue(sdpath, request.kinds, bearer, api_key, request.priority)]
+    return dict(prefetcher.status(), accepted=queued)
+
+
+@router.get(settings.API_PATH + "admin/prefetch", tags=["ADMIN"], dependencies=[Depends(require_admin)])
+async def get_prefetch():
+    return prefetcher.status()
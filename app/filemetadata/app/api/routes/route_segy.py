@@ -1,13 +1,29 @@
+import asyncio
+import contextlib
 import json
+import logging
 import re
 import segysdk
+from typing import Optional
 
 from fastapi import APIRouter, Depends, HTTPException
 from fastapi.security.api_key import APIKey
-from starlette.status import HTTP_500_INTERNAL_SERVER_ERROR
+from starlette.responses import StreamingResponse
+from starlette.status import HTTP_400_BAD_REQUEST, HTTP_401_UNAUTHORIZED, HTTP_403_FORBIDDEN, HTTP_404_NOT_FOUND, \
+    HTTP_500_INTERNAL_SERVER_ERROR, HTTP_501_NOT_IMPLEMENTED
 
-from api.dependencies.authentication import get_bearer, get_api_key, configure_remote_access
+from api.dependencies.authentication import get_bearer, get_api_key, configure_remote_access, remote_access_lock
 from core.config import settings
+from core.deadlines import deadline_expired
+from core.executor import run_sdk_call
+from core.header_profile import profile_cache, profile_dataset
+from core.memory import memory_budget
+from core.metadata_store import persisted
+from core.microbatch import trace_header_batcher
+from core.resilience import resilient
+from core.sdms import SdmsError
+from core.segy import decode_traces, find_traces, read_file_header, to_styled_json
+from core.storage import open_dataset_reader, StorageError
 
 router = APIRouter()
 
@@ -28,13 +44,22 @@ async def get_revision(
         sdpath: str,
         bearer: APIKey = Depends(get_bearer),
         api_key: APIKey = Depends(get_api_key)):
-    segy = __create_segy_session(bearer, api_key, sdpath)
-    try:
-        revision = segy.get_revision()
-    except segysdk.SegyException as se:
-        raise segy_error(se)
-    except Exception as e:
-        raise internal_server_error(e)
+    return await run_sdk_call(read_revision, bearer, api_key, sdpath)
+
+@persisted("segy/revision")
+@resilient("segysdk")
+def read_revision(bearer, api_key, sdpath):
+    file_header = __read_file_header(bearer, sdpath)
+    if file_header:
+        return file_header.revision
+
+    with __segy_session(bearer, api_key, sdpath) as segy:
+        try:
+            revision = segy.get_revision()
+        except segysdk.SegyException as se:
+            raise segy_error(se)
+        except Exception as e:
+            raise internal_server_error(e)
 
     return revision
 
@@ -43,13 +68,18 @@ async def get_is_3d(
         sdpath: str,
         bearer: APIKey = Depends(get_bearer),
         api_key: APIKey = Depends(get_api_key)):
-    segy = __create_segy_session(bearer, api_key, sdpath)
-    try:
-        is_3d = segy.is_3d()
-    except segysdk.SegyException as se:
-        raise segy_error(se)
-    except Exception as e:
-        raise internal_server_error(e)
+    return await run_sdk_call(read_is_3d, bearer, api_key, sdpath)
+
+@persisted("segy/is3D")
+@resilient("segysdk")
+def read_is_3d(bearer, api_key, sdpath):
+    with __segy_session(bearer, api_key, sdpath) as segy:
+        try:
+            is_3d = segy.is_3d()
+        except segysdk.SegyException as se:
+            raise segy_error(se)
+        except Exception as e:
+            raise internal_server_error(e)
 
     return is_3d == 1
 
@@ -58,13 +88,18 @@ async def get_trace_header_field_count(
         sdpath: str,
         bearer: APIKey = Depends(get_bearer),
         api_key: APIKey = Depends(get_api_key)):
-    segy = __create_segy_session(bearer, api_key, sdpath)
-    try:
-        count = segy.get_trace_header_field_count()
-    except segysdk.SegyException as se:
-        raise segy_error(se)
-    except Exception as e:
-        raise internal_server_error(e)
+    return await run_sdk_call(read_trace_header_field_count, bearer, api_key, sdpath)
+
+@persisted("segy/traceHeaderFieldCount")
+@resilient("segysdk")
+def read_trace_header_field_count(bearer, api_key, sdpath):
+    with __segy_session(bearer, api_key, sdpath) as segy:
+        try:
+            count = segy.get_trace_header_field_count()
+        except segysdk.SegyException as se:
+            raise segy_error(se)
+        except Exception as e:
+            raise internal_server_error(e)
 
     return count
 
@@ -73,14 +108,23 @@ async def get_textual_header(
         sdpath: str,
         bearer: APIKey = Depends(get_bearer),
         api_key: APIKey = Depends(get_api_key)):
-    segy = __create_segy_session(bearer, api_key, sdpath)
-    try:
-        ascii_headers_as_json = segy.get_ascii_headers_as_json()
-        json_header = json.loads(ascii_headers_as_json)["Textualheader"]
-    except segysdk.SegyException as se:
-        raise segy_error(se)
-    except Exception as e:
-        raise internal_server_error(e)
+    return await run_sdk_call(read_textual_header, bearer, api_key, sdpath)
+
+@persisted("segy/textualHeader")
+@resilient("segysdk")
+def read_textual_header(bearer, api_key, sdpath):
+    file_header = __read_file_header(bearer, sdpath)
+    if file_header:
+        return {"header": f"{file_header.textual_header}"}
+
+    with __segy_session(bearer, api_key, sdpath) as segy:
+        try:
+            ascii_headers_as_json = segy.get_ascii_headers_as_json()
+            json_header = json.loads(ascii_headers_as_json)["Textualheader"]
+        except segysdk.SegyException as se:
+            raise segy_error(se)
+        except Exception as e:
+            raise internal_server_error(e)
 
     return {"header": f"{json_header}"}
 
@@ -89,14 +133,23 @@ async def get_extended_textual_headers(
         sdpath: str,
         bearer: APIKey = Depends(get_bearer),
         api_key: APIKey = Depends(get_api_key)):
-    segy = __create_segy_session(bearer, api_key, sdpath)
-    try:
-        get_extended_ascii_headers_as_json = segy.get_extended_ascii_headers_as_json()
-        json_header = json.loads(get_extended_ascii_headers_as_json)
-    except segysdk.SegyException as se:
-        raise segy_error(se)
-    except Exception as e:
-        raise internal_server_error(e)
+    return await run_sdk_call(read_extended_textual_headers, bearer, api_key, sdpath)
+
+@persisted("segy/extendedTextualHeaders")
+@resilient("segysdk")
+def read_extended_textual_headers(bearer, api_key, sdpath):
+    file_header = __read_file_header(bearer, sdpath)
+    if file_header and file_header.extended_textual_header_count == 0:
+        return {"header": "{}"}
+
+    with __segy_session(bearer, api_key, sdpath) as segy:
+        try:
+            get_extended_ascii_headers_as_json = segy.get_extended_ascii_headers_as_json()
+            json_header = json.loads(get_extended_ascii_headers_as_json)
+        except segysdk.SegyException as se:
+            raise segy_error(se)
+        except Exception as e:
+            raise internal_server_error(e)
 
     return {"header": f"{json_header}"}
 
@@ -105,16 +158,42 @@ async def get_binary_header(
         sdpath: str,
         bearer: APIKey = Depends(get_bearer),
         api_key: APIKey = Depends(get_api_key)):
-    segy = __create_segy_session(bearer, api_key, sdpath)
-    try:
-        header = segy.get_binary_header_as_json()
-    except segysdk.SegyException as se:
-        raise segy_error(se)
-    except Exception as e:
-        raise internal_server_error(e)
+    return await run_sdk_call(read_binary_header, bearer, api_key, sdpath)
+
+@persisted("segy/binaryHeader")
+@resilient("segysdk")
+def read_binary_header(bearer, api_key, sdpath):
+    file_header = __read_file_header(bearer, sdpath)
+    if file_header:
+        return {"header": f"{to_styled_json(file_header.binary_header(sdpath))}"}
+
+    with __segy_session(bearer, api_key, sdpath) as segy:
+        try:
+            header = segy.get_binary_header_as_json()
+        except segysdk.SegyException as se:
+            raise segy_error(se)
+        except Exception as e:
+            raise internal_server_error(e)
 
     return {"header": f"{header}"}
 
+# The binary header as a dict, for the gRPC interface. Only what segysdk reads is parsed,
+# and that once, the result is persisted parsed.
+@persisted("segy/binaryHeaderValues")
+@resilient("segysdk")
+def read_binary_header_values(bearer, api_key, sdpath):
+    file_header = __read_file_header(bearer, sdpath)
+    if file_header:
+        return file_header.binary_header(sdpath)
+
+    with __segy_session(bearer, api_key, sdpath) as segy:
+        try:
+            return json.loads(segy.get_binary_header_as_json())
+        except segysdk.SegyException as se:
+            raise segy_error(se)
+        except Exception as e:
+            raise internal_server_error(e)
+
 @router.get(settings.API_PATH + "segy/rawTraceHeaders", tags=["SEGY"])
 async def get_raw_trace_headers(
         sdpath: str,
@@ -122,13 +201,18 @@ async def get_raw_trace_headers(
         traces_to_dump: int,
         bearer: APIKey = Depends(get_bearer),
         api_key: APIKey = Depends(get_api_key)):
-    segy = __create_segy_session(bearer, api_key, sdpath)
-    try:
-        header = segy.get_raw_trace_headers_as_json(start_trace, traces_to_dump)
-    except segysdk.SegyException as se:
-        raise segy_error(se)
-    except Exception as e:
-        raise internal_server_error(e)
+    return await trace_header_batcher.read(read_raw_trace_headers, bearer, api_key, sdpath, start_trace,
+                                           traces_to_dump)
+
+@resilient("segysdk")
+def read_raw_trace_headers(bearer, api_key, sdpath, start_trace, traces_to_dump):
+    with __segy_session(bearer, api_key, sdpath) as segy:
+        try:
+            header = segy.get_raw_trace_headers_as_json(start_trace, traces_to_dump)
+        except segysdk.SegyException as se:
+            raise segy_error(se)
+        except Exception as e:
+            raise internal_server_error(e)
 
     return {"header": f"{header}"}
 
@@ -139,21 +223,166 @@ async def get_scaled_trace_headers(
         traces_to_dump: int,
         bearer: APIKey = Depends(get_bearer),
         api_key: APIKey = Depends(get_api_key)):
-    segy = __create_segy_session(bearer, api_key, sdpath)
-    try:
-        header = segy.get_scaled_trace_headers_as_json(start_trace, traces_to_dump)
-    except segysdk.SegyException as se:
-        raise segy_error(se)
-    except Exception as e:
-        raise internal_server_error(e)
+    return await trace_header_batcher.read(read_scaled_trace_headers, bearer, api_key, sdpath, start_trace,
+                                           traces_to_dump)
+
+@resilient("segysdk")
+def read_scaled_trace_headers(bearer, api_key, sdpath, start_trace, traces_to_dump):
+    with __segy_session(bearer, api_key, sdpath) as segy:
+        try:
+            header = segy.get_scaled_trace_headers_as_json(start_trace, traces_to_dump)
+        except segysdk.SegyException as se:
+            raise segy_error(se)
+        except Exception as e:
+            raise internal_server_error(e)
 
     return {"header": f"{header}"}
 
+# Yields read(start_trace, traces_to_dump) returning the trace headers as segysdk formats them,
+# for reading many ranges of one dataset through a single session
+@contextlib.contextmanager
+def trace_header_session(bearer, api_key, sdpath, scaled: bool):
+    with __segy_session(bearer, api_key, sdpath) as segy:
+        def read(start_trace, traces_to_dump):
+            try:
+                if scaled:
+                    return segy.get_scaled_trace_headers_as_json(start_trace, traces_to_dump)
+                return segy.get_raw_trace_headers_as_json(start_trace, traces_to_dump)
+            except segysdk.SegyException as se:
+                raise segy_error(se)
+            except Exception as e:
+                raise internal_server_error(e)
+
+        yield read
+
+@router.get(settings.API_PATH + "segy/headerProfile", tags=["SEGY"])
+async def get_header_profile(
+        sdpath: str,
+        bearer: APIKey = Depends(get_bearer),
+        api_key: APIKey = Depends(get_api_key)):
+    return await run_sdk_call(read_header_profile, bearer, api_key, sdpath)
+
+# Per field QC summary of every trace header: value range, distinct count estimate, runs of
+# ascending and descending values and constant or all zero flags. Cached per dataset version.
+@persisted("segy/headerProfile")
+def read_header_profile(bearer, api_key, sdpath):
+    if not settings.SDMS_URL:
+        raise HTTPException(status_code=HTTP_501_NOT_IMPLEMENTED, detail="Header profiles need SDMS_SERVICE_HOST")
+
+    try:
+        reader = open_dataset_reader(bearer, sdpath)
+        if reader.size is None:
+            raise HTTPException(status_code=HTTP_501_NOT_IMPLEMENTED, detail=f"The size of {sdpath} is unknown")
+
+        key = (sdpath, reader.version)
+        profile = profile_cache.get(key)
+        if profile is None:
+            file_header = read_file_header(reader)
+            profile = profile_dataset(reader, file_header, file_header.trace_count(reader.size)).to_json(sdpath)
+            profile_cache.put(key, profile)
+        return profile
+    except (SdmsError, StorageError) as se:
+        raise HTTPException(status_code=se.status_code, detail=str(se))
+    except ValueError as ve:
+        raise HTTPException(status_code=HTTP_501_NOT_IMPLEMENTED, detail=str(ve))
+
+@router.get(settings.API_PATH + "segy/traces", tags=["SEGY"])
+async def get_traces(
+        sdpath: str,
+        start_trace: Optional[int] = None,
+        traces_to_dump: Optional[int] = None,
+        inline: Optional[int] = None,
+        crossline: Optional[int] = None,
+        bearer: APIKey = Depends(get_bearer),
+        api_key: APIKey = Depends(get_api_key)):
+    reader, file_header, first, count = await run_sdk_call(locate_traces, bearer, sdpath, start_trace, traces_to_dump,
+                                                           inline, crossline)
+    headers = {"X-Start-Trace": str(first + 1), "X-Trace-Count": str(count),
+               "X-Samples-Per-Trace": str(file_header.samples_per_trace)}
+    return StreamingResponse(__stream_traces(reader, file_header, first, count),
+                             media_type="application/octet-stream", headers=headers)
+
+# Returns the reader, file header, 0-based first trace and number of traces selected either
+# by a 1-based trace range or by an inline, optionally narrowed down to one crossline
+def locate_traces(bearer, sdpath, start_trace, traces_to_dump, inline, crossline):
+    if inline is None and (start_trace is None or traces_to_dump is None):
+        raise HTTPException(status_code=HTTP_400_BAD_REQUEST,
+                            detail="Either start_trace and traces_to_dump or an inline are required")
+    if inline is None and (start_trace < 1 or traces_to_dump < 1):
+        raise HTTPException(status_code=HTTP_400_BAD_REQUEST,
+                            detail="start_trace and traces_to_dump must be positive")
+    if not settings.SDMS_URL:
+        raise HTTPException(status_code=HTTP_501_NOT_IMPLEMENTED, detail="Trace reads need SDMS_SERVICE_HOST")
+
+    try:
+        reader = open_dataset_reader(bearer, sdpath)
+        if reader.size is None:
+            raise HTTPException(status_code=HTTP_501_NOT_IMPLEMENTED, detail=f"The size of {sdpath} is unknown")
+        file_header = read_file_header(reader)
+        trace_count = file_header.trace_count(reader.size)
+
+        if inline is None:
+            first, count = start_trace - 1, min(traces_to_dump, trace_count - start_trace + 1)
+        else:
+            first, count = find_traces(reader, file_header, trace_count, inline, crossline)
+    except (SdmsError, StorageError) as se:
+        raise HTTPException(status_code=se.status_code, detail=str(se))
+    except ValueError as ve:
+        raise HTTPException(status_code=HTTP_501_NOT_IMPLEMENTED, detail=str(ve))
+
+    if count < 1:
+        raise HTTPException(status_code=HTTP_404_NOT_FOUND, detail=f"No traces of {sdpath} match the selection")
+    return reader, file_header, first, count
+
+# Streams little endian float32 samples trace after trace, reading the next chunk
+# while the current one is converted and sent, until the request deadline passes
+async def __stream_traces(reader, file_header, first, count):
+    per_chunk = max(settings.TRACE_READ_CHUNK_BYTES // file_header.trace_size, 1)
+
+    def read_chunk(start):
+        traces = min(per_chunk, first + count - start)
+        return reader.read(file_header.first_trace_offset + start * file_header.trace_size,
+                           traces * file_header.trace_size)
+
+    pending = asyncio.ensure_future(run_sdk_call(read_chunk, first))
+    try:
+        for start in range(first, first + count, per_chunk):
+            if deadline_expired():
+                return
+            raw = await pending
+            if start + per_chunk < first + count:
+                pending = asyncio.ensure_future(run_sdk_call(read_chunk, start + per_chunk))
+            yield decode_traces(raw, file_header).astype('<f4', copy=False).tobytes()
+    finally:
+        pending.cancel()
+
+# Sessions count against the memory budget of native handles until the block ends
+@contextlib.contextmanager
+def __segy_session(bearer, api_key, sdpath):
+    with memory_budget.hold('segysdk'):
+        yield __create_segy_session(bearer, api_key, sdpath)
+
 def __create_segy_session(bearer, api_key, sdpath):
     try:
-        configure_remote_access(bearer, api_key)
-        return segysdk.create_session(sdpath, '{}')    
+        with remote_access_lock:
+            configure_remote_access(bearer, api_key)
+            return segysdk.create_session(sdpath, '{}')
     except segysdk.SegyException as se:
         raise segy_error(se)
     except Exception as e:
         raise internal_server_error(e)
+
+# Reads the 3600 byte file header with one ranged storage read. Returns None when the
+# native reader is disabled or cannot handle the dataset so that callers use segysdk.
+def __read_file_header(bearer, sdpath):
+    if not settings.NATIVE_SEGY_HEADERS or not settings.SDMS_URL:
+        return None
+    try:
+        return read_file_header(open_dataset_reader(bearer, sdpath))
+    except SdmsError as se:
+        if se.status_code in (HTTP_401_UNAUTHORIZED, HTTP_403_FORBIDDEN, HTTP_404_NOT_FOUND):
+            raise HTTPException(status_code=se.status_code, detail=str(se))
+        logging.warning(f"Native SEG-Y header read of {sdpath} failed, using segysdk: {se}")
+    except Exception as e:
+        logging.warning(f"Native SEG-Y header read of {sdpath} failed, using segysdk: {e}")
+    return None
@@ -1,6 +1,14 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Depends, HTTPException
+from starlette.responses import JSONResponse, PlainTextResponse
+from starlette.status import HTTP_200_OK, HTTP_400_BAD_REQUEST, HTTP_503_SERVICE_UNAVAILABLE
+
+from api.dependencies.authentication import require_admin
 
 from core.config import settings
+from core.executor import call_seconds, sdk_load
+from core.memory import memory_budget, resident_bytes, tracemalloc_top
+from core.metrics import registry
+from core.shared_cache import lookups
 
 router = APIRouter()
 
@@ -8,3 +16,37 @@ router = APIRouter()
 @router.get(settings.API_PATH + "service-status", tags=["General"])
 def get_status():
     return {"status": "ok"}
+
+
+# Not ready while calls wait longer than READINESS_MAX_QUEUE_DELAY for an SDK thread, so that
+# load balancers route around a pod saturated by slow remote reads even at low CPU
+@router.get(settings.API_PATH + "service-readiness", tags=["General"])
+def get_readiness():
+    load = sdk_load()
+    load["ready"] = load["queue_delay_seconds"] <= settings.READINESS_MAX_QUEUE_DELAY
+    load["p95_seconds"] = call_seconds.quantile(0.95)
+    load["cache_hit_ratio"] = cache_hit_ratio()
+    return JSONResponse(load, status_code=HTTP_200_OK if load["ready"] else HTTP_503_SERVICE_UNAVAILABLE)
+
+
+def cache_hit_ratio():
+    hits = sum(lookups.value(tier=tier) for tier in ('near', 'far', 'record'))
+    total = hits + lookups.value(tier='miss')
+    return hits / total if total else None
+
+
+@router.get(settings.API_PATH + "metrics", tags=["General"])
+def get_metrics():
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+
+# Open native handles and their estimated memory, the resident set size of the process and,
+# when tracemalloc traces, the largest Python allocations or their growth since the last call.
+# Snapshots are costly and show source lines of the service, so only admins get them.
+@router.get(settings.API_PATH + "diagnostics/memory", tags=["General"], dependencies=[Depends(require_admin)])
+def get_memory_diagnostics(top: int = 20, compare: bool = False):
+    if not 1 <= top <= settings.DIAGNOSTICS_MAX_TOP:
+        raise HTTPException(status_code=HTTP_400_BAD_REQUEST,
+                            detail=f"top is between 1 and {settings.DIAGNOSTICS_MAX_TOP}")
+    return {"resident_bytes": resident_bytes(), "native": memory_budget.usage(),
+            "tracemalloc": tracemalloc_top(top, compare)}
@@ -0,0 +1,125 @@
+import asyncio
+import functools
+import inspect
+import random
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+
+from client.sdpath import SdmsError
+
+# answers worth another attempt whatever the method, the request was not processed
+THROTTLED = (429, 503)
+# answers worth another attempt when repeating the request does no harm
+RETRIED = (500, 502, 504)
+IDEMPOTENT = ('GET', 'HEAD', 'PUT', 'PATCH', 'DELETE')
+
+
+# Whether the request failed before the connection was made, so that the server cannot have
+# seen it and it can be repeated whatever the method
+def never_sent(e: requests.RequestException) -> bool:
+    if isinstance(e, requests.ConnectTimeout):
+        return True
+    reason = e.args[0] if e.args else None
+    reason = getattr(reason, 'reason', reason)
+    return isinstance(reason, (NewConnectionError, ConnectionRefusedError))
+
+
+# Asyncio front of a pooled keep-alive session. Requests run on as many threads as the pool
+# has connections, retries back off with full jitter on the event loop and a bearer that
+# SDMS rejects is refreshed once per rejection, however many requests saw it.
+class PooledHttpClient:
+    def __init__(self, token, concurrency: int = 16, attempts: int = 4, backoff: float = 0.5,
+                 max_backoff: float = 10.0, timeout: float = 30.0, headers: dict = None):
+        # a bearer string, or a function returning one or an awaitable of one, called again on 401
+        self._token_source = token
+        self._token = None
+        self._token_generation = 0
+        self._token_lock = None
+        self.concurrency = concurrency
+        self.attempts = attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self.headers = dict(headers or {})
+
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=concurrency, pool_maxsize=concurrency)
+        self._session.mount('https://', adapter)
+        self._session.mount('http://', adapter)
+        self._executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='sdms-client')
+        self._slots = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        self.close()
+        return False
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+        self._session.close()
+
+    async def _bearer(self, stale_generation=None):
+        if self._token_lock is None:
+            self._token_lock = asyncio.Lock()
+        async with self._token_lock:
+            if self._token is None or stale_generation == self._token_generation:
+                if callable(self._token_source):
+                    token = self._token_source()
+                    self._token = await token if inspect.isawaitable(token) else token
+                else:
+                    self._token = self._token_source
+                self._token_generation += 1
+            return self._token, self._token_generation
+
+    def _retry_delay(self, attempt: int) -> float:
+        return random.uniform(0, min(self.max_backoff, self.backoff * (2 ** attempt)))
+
+    def _retried(self, method: str, status_code: int) -> bool:
+        return status_code in THROTTLED or (status_code in RETRIED and method in IDEMPOTENT)
+
+    # The answer as JSON, or None when it has no body. Fails with SdmsError once the
+    # attempts are used up or on an answer that another attempt would not change.
+    async def request(self, method: str, url: str, what: str, headers: dict = None, **kwargs):
+        loop = asyncio.get_running_loop()
+        token, generation = await self._bearer()
+        refreshed = False
+        attempt = 0
+        while True:
+            send = functools.partial(self._session.request, method, url, timeout=self.timeout,
+                                     headers=dict(self.headers, Authorization=token, **(headers or {})), **kwargs)
+            try:
+                resp = await loop.run_in_executor(self._executor, send)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                # a request lost on an open connection may have reached the server, so only
+                # idempotent requests repeat it
+                if attempt + 1 >= self.attempts or (method not in IDEMPOTENT and not never_sent(e)):
+                    raise SdmsError(503, f"{what} failed: {e}")
+            else:
+                if resp.status_code == 401 and callable(self._token_source) and not refreshed:
+                    token, generation = await self._bearer(stale_generation=generation)
+                    refreshed = True
+                    continue
+                if resp.status_code < 400:
+                    return resp.json() if resp.content else None
+                if not self._retried(method, resp.status_code) or attempt + 1 >= self.attempts:
+                    raise SdmsError(resp.status_code, f"{what} failed with HTTP {resp.status_code}: {resp.text}")
+
+            await asyncio.sleep(self._retry_delay(attempt))
+            attempt += 1
+
+    # Runs operation(item) for every item, at most concurrency at a time, and returns the
+    # results in the order of the items with the exception in place of each failed one
+    async def bulk(self, operation, items):
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.concurrency)
+
+        async def run(item):
+            async with self._slots:
+                return await operation(item)
+
+        return await asyncio.gather(*(run(item) for item in items), return_exceptions=True)
@@ -0,0 +1,43 @@
+SDPATH_PREFIX = 'sd://'
+
+
+class SdmsError(Exception):
+    def __init__(self, status_code: int, message: str):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+# Tenant, subproject, folder path and name of a seismic store dataset, e.g. sd://tenant/subproject/a/b/name
+class SdPath:
+    def __init__(self, tenant, subproject, path, name):
+        self.tenant = tenant
+        self.subproject = subproject
+        self.path = path
+        self.name = name
+
+    @classmethod
+    def parse(cls, sdpath: str):
+        if not sdpath.startswith(SDPATH_PREFIX):
+            raise SdmsError(400, f"Invalid sdpath {sdpath}")
+
+        parts = sdpath[len(SDPATH_PREFIX):].split('/')
+        if len(parts) < 3 or not all(parts[:2]) or not parts[-1]:
+            raise SdmsError(400, f"Invalid dataset sdpath {sdpath}")
+
+        path = '/' + '/'.join(part for part in parts[2:-1] if part)
+        return cls(parts[0], parts[1], path if path == '/' else path + '/', parts[-1])
+
+    # sd://tenant/subproject, without a dataset
+    @classmethod
+    def parse_subproject(cls, sdpath: str):
+        parts = sdpath[len(SDPATH_PREFIX):].strip('/').split('/') if sdpath.startswith(SDPATH_PREFIX) else []
+        if len(parts) != 2 or not all(parts):
+            raise SdmsError(400, f"Invalid subproject sdpath {sdpath}")
+        return cls(parts[0], parts[1], '/', '')
+
+    @property
+    def subproject_sdpath(self):
+        return f"{SDPATH_PREFIX}{self.tenant}/{self.subproject}"
+
+    def __str__(self):
+        return f"{self.subproject_sdpath}{self.path}{self.name}"
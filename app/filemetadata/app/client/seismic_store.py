@@ -0,0 +1,60 @@
+from client.http import PooledHttpClient
+from client.sdpath import SdPath
+
+
+# Subprojects and datasets of seismic store, e.g.
+#
+#     async with SeismicStoreClient(sdms_url, refresh_token) as sdms:
+#         results = await sdms.create_datasets([(sdpath, {"type": "GENERIC"}) for sdpath in sdpaths])
+#
+# Bulk operations return a result or an SdmsError per item, in the order of the items.
+class SeismicStoreClient(PooledHttpClient):
+    def __init__(self, sdms_url: str, token, api_key: str = None, **kwargs):
+        super().__init__(token, headers={"appkey": api_key} if api_key else None, **kwargs)
+        self.sdms_url = sdms_url.rstrip('/')
+
+    def _subproject_url(self, sdpath: SdPath):
+        return f"{self.sdms_url}/subproject/tenant/{sdpath.tenant}/subproject/{sdpath.subproject}"
+
+    def _dataset_url(self, sdpath: SdPath):
+        return f"{self.sdms_url}/dataset/tenant/{sdpath.tenant}/subproject/{sdpath.subproject}/dataset/{sdpath.name}"
+
+    async def create_subproject(self, sdpath: str, legal_tag: str, body: dict = None):
+        subproject = SdPath.parse_subproject(sdpath)
+        return await self.request('POST', self._subproject_url(subproject), f"Create subproject {sdpath}",
+                                  headers={"ltag": legal_tag}, json=body or {})
+
+    async def delete_subproject(self, sdpath: str):
+        subproject = SdPath.parse_subproject(sdpath)
+        return await self.request('DELETE', self._subproject_url(subproject), f"Delete subproject {sdpath}")
+
+    async def get_dataset(self, sdpath: str, seismicmeta: bool = False):
+        dataset = SdPath.parse(sdpath)
+        params = {'path': dataset.path, 'seismicmeta': str(seismicmeta).lower()}
+        return await self.request('GET', self._dataset_url(dataset), f"Get dataset {sdpath}", params=params)
+
+    async def create_dataset(self, sdpath: str, body: dict = None):
+        dataset = SdPath.parse(sdpath)
+        return await self.request('POST', self._dataset_url(dataset), f"Create dataset {sdpath}",
+                                  params={'path': dataset.path}, json=body or {})
+
+    async def patch_dataset(self, sdpath: str, body: dict):
+        dataset = SdPath.parse(sdpath)
+        return await self.request('PATCH', self._dataset_url(dataset), f"Patch dataset {sdpath}",
+                                  params={'path': dataset.path}, json=body)
+
+    async def delete_dataset(self, sdpath: str):
+        dataset = SdPath.parse(sdpath)
+        return await self.request('DELETE', self._dataset_url(dataset), f"Delete dataset {sdpath}",
+                                  params={'path': dataset.path})
+
+    # (sdpath, body) pairs
+    async def create_datasets(self, datasets):
+        return await self.bulk(lambda dataset: self.create_dataset(*dataset), list(datasets))
+
+    # (sdpath, body) pairs
+    async def patch_datasets(self, datasets):
+        return await self.bulk(lambda dataset: self.patch_dataset(*dataset), list(datasets))
+
+    async def delete_datasets(self, sdpaths):
+        return await self.bulk(self.delete_dataset, list(sdpaths))
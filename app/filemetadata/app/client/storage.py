@@ -0,0 +1,28 @@
+from client.http import PooledHttpClient
+
+# the storage service takes at most this many records in one put
+RECORDS_PER_PUT = 500
+
+
+# Records of the storage service of a data partition. Records are put in batches of
+# RECORDS_PER_PUT, several batches at a time.
+class StorageClient(PooledHttpClient):
+    def __init__(self, storage_url: str, token, partition: str, **kwargs):
+        super().__init__(token, headers={"data-partition-id": partition}, **kwargs)
+        self.storage_url = storage_url.rstrip('/')
+
+    async def get_record(self, record_id: str):
+        return await self.request('GET', f"{self.storage_url}/records/{record_id}", f"Get record {record_id}")
+
+    async def put_records(self, records):
+        records = list(records)
+        batches = [records[first:first + RECORDS_PER_PUT] for first in range(0, len(records), RECORDS_PER_PUT)]
+        return await self.bulk(lambda batch: self.request('PUT', f"{self.storage_url}/records",
+                                                          f"Put {len(batch)} records", json=batch), batches)
+
+    async def delete_record(self, record_id: str):
+        return await self.request('POST', f"{self.storage_url}/records/{record_id}:delete",
+                                  f"Delete record {record_id}", json={})
+
+    async def delete_records(self, record_ids):
+        return await self.bulk(self.delete_record, list(record_ids))
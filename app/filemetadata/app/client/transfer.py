@@ -0,0 +1,187 @@
+import base64
+import hashlib
+import mmap
+import os
+import random
+import re
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from urllib.parse import urlencode
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from client.http import RETRIED, THROTTLED
+
+BLOCK_SIZE = 8 * 1024 * 1024
+
+
+class TransferError(Exception):
+    def __init__(self, status_code: int, message: str):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def _with_query(url: str, **params) -> str:
+    return f"{url}{'&' if '?' in url else '?'}{urlencode(params)}"
+
+
+def _block_id(index: int) -> str:
+    # the ids of the blocks of a blob all have the same length
+    return base64.b64encode(f"{index:08d}".encode()).decode()
+
+
+# Moves objects to and from signed blob urls in blocks of block_size bytes, concurrency of
+# them at a time. Uploads put each block with its MD5 and then commit the block list, so
+# no more than concurrency blocks are in memory. Downloads read byte ranges straight into a
+# memory mapped file. progress(done, total) is called in bytes as blocks complete.
+class BlobTransfer:
+    def __init__(self, block_size: int = BLOCK_SIZE, concurrency: int = 8, attempts: int = 4,
+                 backoff: float = 0.5, timeout: float = 60.0, progress=None):
+        self.block_size = block_size
+        self.concurrency = concurrency
+        self.attempts = attempts
+        self.backoff = backoff
+        self.timeout = timeout
+        self.progress = progress
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=concurrency, pool_maxsize=concurrency)
+        self._session.mount('https://', adapter)
+        self._session.mount('http://', adapter)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self._session.close()
+        return False
+
+    # every request of a transfer can be repeated
+    def _send(self, method: str, url: str, what: str, **kwargs):
+        for attempt in range(self.attempts):
+            try:
+                resp = self._session.request(method, url, timeout=self.timeout, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt + 1 >= self.attempts:
+                    raise TransferError(503, f"{what} failed: {e}")
+            else:
+                if resp.status_code < 400:
+                    return resp
+                if resp.status_code not in THROTTLED + RETRIED or attempt + 1 >= self.attempts:
+                    raise TransferError(resp.status_code, f"{what} failed with HTTP {resp.status_code}: {resp.text}")
+            time.sleep(random.uniform(0, self.backoff * (2 ** attempt)))
+
+    def _report(self, done: int, total: int):
+        if self.progress is not None:
+            self.progress(done, total)
+
+    # source is a file path or bytes. Returns the size and the base64 MD5 of the content.
+    def upload(self, url: str, source) -> dict:
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            return self._upload(url, len(source), lambda offset, size: bytes(source[offset:offset + size]))
+        with open(source, 'rb') as file:
+            return self._upload(url, os.fstat(file.fileno()).st_size, lambda offset, size: file.read(size))
+
+    def _upload(self, url, total, read_block):
+        digest = hashlib.md5()
+        if total <= self.block_size:
+            data = read_block(0, total)
+            digest.update(data)
+            md5 = base64.b64encode(digest.digest()).decode()
+            self._send('PUT', url, "Put blob", data=data,
+                       headers={'x-ms-blob-type': 'BlockBlob', 'Content-MD5': md5,
+                                'Content-Type': 'application/octet-stream'})
+            self._report(total, total)
+            return {"size": total, "md5": md5, "blocks": 1}
+
+        def put_block(index, data):
+            self._send('PUT', _with_query(url, comp='block', blockid=_block_id(index)), f"Put block {index}",
+                       data=data, headers={'Content-MD5': base64.b64encode(hashlib.md5(data).digest()).decode()})
+            return len(data)
+
+        count = -(-total // self.block_size)
+        done = 0
+        with ThreadPoolExecutor(self.concurrency, thread_name_prefix='upload') as pool:
+            pending = set()
+            try:
+                # blocks are read and hashed in order here, at most concurrency are held while they upload
+                for index in range(count):
+                    if len(pending) >= self.concurrency:
+                        finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        done += sum(future.result() for future in finished)
+                        self._report(done, total)
+                    data = read_block(index * self.block_size, min(self.block_size, total - index * self.block_size))
+                    digest.update(data)
+                    pending.add(pool.submit(put_block, index, data))
+                for future in pending:
+                    done += future.result()
+            finally:
+                for future in pending:
+                    future.cancel()
+        self._report(done, total)
+
+        md5 = base64.b64encode(digest.digest()).decode()
+        block_list = ''.join(f"<Latest>{_block_id(index)}</Latest>" for index in range(count))
+        self._send('PUT', _with_query(url, comp='blocklist'), "Put block list",
+                   data=f'<?xml version="1.0" encoding="utf-8"?><BlockList>{block_list}</BlockList>'.encode(),
+                   headers={'x-ms-blob-content-md5': md5, 'x-ms-blob-content-type': 'application/octet-stream'})
+        return {"size": total, "md5": md5, "blocks": count}
+
+    # Writes the object to path and checks it against the MD5 the server keeps, when it has one
+    def download(self, url: str, path: str) -> dict:
+        try:
+            probe = self._send('GET', url, "Get blob size", headers={'Range': 'bytes=0-0'})
+        except TransferError as te:
+            # no range of an empty object is satisfiable
+            if te.status_code != 416:
+                raise
+            open(path, 'wb').close()
+            self._report(0, 0)
+            return self._downloaded(path, 0, None, 0)
+        expected = probe.headers.get('x-ms-blob-content-md5')
+        if probe.status_code != 206:
+            # the server ignores ranges and sent the whole object
+            with open(path, 'wb') as file:
+                file.write(probe.content)
+            self._report(len(probe.content), len(probe.content))
+            return self._downloaded(path, len(probe.content), expected or probe.headers.get('Content-MD5'), 1)
+
+        matched = re.match(r'bytes \d+-\d+/(\d+)', probe.headers.get('Content-Range', ''))
+        if matched is None:
+            raise TransferError(502, f"Get blob size failed, no size in {probe.headers.get('Content-Range')}")
+        total = int(matched.group(1))
+        with open(path, 'wb+') as file:
+            file.truncate(total)
+            with mmap.mmap(file.fileno(), total) as destination:
+                self._read_blocks(url, destination, total)
+        return self._downloaded(path, total, expected, -(-total // self.block_size))
+
+    def _read_blocks(self, url, destination, total):
+        def read_range(offset):
+            end = min(offset + self.block_size, total) - 1
+            resp = self._send('GET', url, f"Get bytes {offset} to {end}", headers={'Range': f'bytes={offset}-{end}'})
+            if len(resp.content) != end - offset + 1:
+                raise TransferError(502, f"Get bytes {offset} to {end} returned {len(resp.content)} bytes")
+            destination[offset:end + 1] = resp.content
+            return len(resp.content)
+
+        done = 0
+        with ThreadPoolExecutor(self.concurrency, thread_name_prefix='download') as pool:
+            futures = [pool.submit(read_range, offset) for offset in range(0, total, self.block_size)]
+            try:
+                for future in futures:
+                    done += future.result()
+                    self._report(done, total)
+            finally:
+                for future in futures:
+                    future.cancel()
+
+    def _downloaded(self, path, total, expected, blocks):
+        digest = hashlib.md5()
+        with open(path, 'rb') as file:
+            for data in iter(lambda: file.read(self.block_size), b''):
+                digest.update(data)
+        md5 = base64.b64encode(digest.digest()).decode()
+        if expected and expected != md5:
+            raise TransferError(502, f"Downloaded content of {path} has MD5 {md5}, the server has {expected}")
+        return {"size": total, "md5": md5, "blocks": blocks}
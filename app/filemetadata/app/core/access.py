@@ -0,0 +1,71 @@
+import hashlib
+
+from core.config import settings
+from core.lru import LruCache
+from core.sdms import SdPath, SdmsError, get_dataset
+
+ALLOWED = 200
+DENIED = (401, 403)
+
+
+# Read access decisions per token and dataset. Grants are kept for ACCESS_CACHE_TTL
+# seconds and denials for ACCESS_CACHE_NEGATIVE_TTL, least recently used ones go first.
+class AccessCache(LruCache):
+    def __init__(self, capacity: int, ttl: float, negative_ttl: float):
+        super().__init__(capacity)
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+
+    @staticmethod
+    def make_key(bearer, sdpath: SdPath):
+        # tokens are not kept in memory in the clear
+        return hashlib.sha256(bearer.encode()).hexdigest(), sdpath.tenant, sdpath.subproject, sdpath.path, sdpath.name
+
+    def put(self, key, status: int):
+        super().put(key, status, self.ttl if status == ALLOWED else self.negative_ttl)
+
+
+access_cache = AccessCache(settings.ACCESS_CACHE_SIZE, settings.ACCESS_CACHE_TTL, settings.ACCESS_CACHE_NEGATIVE_TTL)
+
+
+# Raises the SdmsError SDMS answered with unless the bearer may read the dataset, which SDMS
+# decides from the dataset itself and not only from its subproject. Results cached in the
+# service for every caller are only served after this.
+def authorize(bearer, sdpath: str) -> SdPath:
+    parsed = SdPath.parse(sdpath)
+    status = access_cache.get(AccessCache.make_key(bearer, parsed))
+    if status is None:
+        read_dataset(bearer, parsed)
+    elif status != ALLOWED:
+        raise SdmsError(status, f"No read access to {parsed}")
+    return parsed
+
+
+# The dataset record as the bearer may read it. Whether SDMS let the bearer read it is kept
+# in the access cache, a cached denial is raised without asking SDMS again.
+def read_dataset(bearer, sdpath: SdPath) -> dict:
+    key = AccessCache.make_key(bearer, sdpath)
+    status = access_cache.get(key)
+    if status is not None and status != ALLOWED:
+        raise SdmsError(status, f"No read access to {sdpath}")
+    try:
+        dataset = get_dataset(bearer, sdpath)
+    except SdmsError as se:
+        if se.status_code not in DENIED:
+            raise
+        access_cache.put(key, se.status_code)
+        raise SdmsError(se.status_code, f"No read access to {sdpath}")
+    access_cache.put(key, ALLOWED)
+    return dataset
+
+
+# A 401 or 403 from any backend means a cached grant may be stale, it is dropped at once.
+# Callers pass the sdpath the denied call read, the HTTP error handler only knows the sdpath
+# query parameter, so routes taking sdpaths in their body revoke their grants themselves.
+def revoke_on_denial(bearer, sdpath, status_code):
+    if status_code not in DENIED or not bearer or not sdpath:
+        return
+    try:
+        access_cache.evict(AccessCache.make_key(bearer, SdPath.parse(sdpath)))
+    except SdmsError:
+        pass
@@ -0,0 +1,144 @@
+import fcntl
+import hashlib
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+
+import numpy as np
+
+from core.config import settings
+
+MAGIC = b'SFMBLKC1'
+# magic, block size, slot count
+_HEADER = struct.Struct('<8sQQ')
+HEADER_SIZE = 64
+SLOT_DTYPE = np.dtype([('key', '<u8', (2,)), ('length', '<u4'), ('crc', '<u4'), ('tick', '<u8')])
+
+
+# Fixed size blocks stored in a memory mapped file. The slot table lives in the same
+# file so every worker process on the node that maps it sees the same blocks; flock
+# serialises writers across processes and a lock does the same across threads.
+class BlockCache:
+    def __init__(self, path: str, capacity: int, block_size: int):
+        self.path = path
+        self.block_size = block_size
+        self.nslots = max(capacity // block_size, 1)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.RLock()
+
+        table_size = self.nslots * SLOT_DTYPE.itemsize
+        self._data_offset = HEADER_SIZE + table_size
+        file_size = self._data_offset + self.nslots * block_size
+
+        self._fd = self._open(path, file_size)
+        self._mm = mmap.mmap(self._fd, file_size)
+        self._slots = np.ndarray((self.nslots,), dtype=SLOT_DTYPE, buffer=self._mm, offset=HEADER_SIZE)
+
+    def _open(self, path, file_size):
+        header = _HEADER.pack(MAGIC, self.block_size, self.nslots)
+        while True:
+            fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            try:
+                size = os.fstat(fd).st_size
+                if size == 0:
+                    os.ftruncate(fd, file_size)
+                    os.pwrite(fd, header, 0)
+                    return fd
+                if size == file_size and os.pread(fd, len(header), 0) == header:
+                    return fd
+                # written with another layout: processes still mapping it keep their
+                # copy, this one starts over with a new file
+                os.unlink(path)
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+
+    @staticmethod
+    def make_key(*parts) -> np.ndarray:
+        digest = hashlib.blake2b('\0'.join(map(str, parts)).encode(), digest_size=16).digest()
+        return np.frombuffer(digest, dtype='<u8')
+
+    def _find(self, key):
+        matches = np.flatnonzero((self._slots['key'][:, 0] == key[0]) & (self._slots['key'][:, 1] == key[1])
+                                 & (self._slots['length'] > 0))
+        return int(matches[0]) if len(matches) else None
+
+    def _offset(self, slot):
+        return self._data_offset + slot * self.block_size
+
+    def get(self, key):
+        with self._lock:
+            fcntl.flock(self._fd, fcntl.LOCK_SH)
+            try:
+                slot = self._find(key)
+                if slot is not None:
+                    start = self._offset(slot)
+                    entry = self._slots[slot]
+                    data = self._mm[start:start + int(entry['length'])]
+                    valid = zlib.crc32(data) == int(entry['crc'])
+                    entry['tick'] = time.time_ns()
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+            if slot is None:
+                self.misses += 1
+                return None
+            if not valid:
+                self.misses += 1
+                self._invalidate(key)
+                return None
+
+            self.hits += 1
+            return data
+
+    def put(self, key, data: bytes):
+        if not data or len(data) > self.block_size:
+            return
+        with self._lock:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                slot = self._find(key)
+                if slot is None:
+                    # empty slots have tick 0 so they go before the least recently used block
+                    slot = int(np.argmin(np.where(self._slots['length'] > 0, self._slots['tick'], 0)))
+                entry = self._slots[slot]
+                entry['length'] = 0
+                start = self._offset(slot)
+                self._mm[start:start + len(data)] = data
+                entry['key'] = key
+                entry['crc'] = zlib.crc32(data)
+                entry['tick'] = time.time_ns()
+                entry['length'] = len(data)
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def _invalidate(self, key):
+        with self._lock:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                slot = self._find(key)
+                if slot is not None:
+                    self._slots[slot]['length'] = 0
+                    self._slots[slot]['tick'] = 0
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+
+_block_cache = None
+_block_cache_lock = threading.Lock()
+
+
+def get_block_cache():
+    global _block_cache
+    if not settings.BLOCK_CACHE_PATH:
+        return None
+    with _block_cache_lock:
+        if _block_cache is None:
+            _block_cache = BlockCache(settings.BLOCK_CACHE_PATH, settings.BLOCK_CACHE_SIZE_MB * 1024 * 1024,
+                                      settings.BLOCK_CACHE_BLOCK_SIZE_KB * 1024)
+    return _block_cache
@@ -0,0 +1,155 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from core.config import settings
+from core.deadlines import check_deadline
+
+# brick regions of one request are read concurrently, openzgy reads are thread safe
+_brick_executor = ThreadPoolExecutor(max_workers=settings.ZGY_BRICK_READ_WORKERS, thread_name_prefix='brick')
+
+# index coordinates transformed from annotation or world ones are off by rounding errors this small
+EDGE_TOLERANCE = 1e-9
+
+
+# Positions about one trace apart along a polyline in index space, each vertex included
+def densify_polyline(vertices, step: float = 1.0) -> np.ndarray:
+    vertices = np.asarray(vertices, dtype=np.float64).reshape(-1, 2)
+    if len(vertices) < 2:
+        return vertices
+    positions = []
+    for start, end, count in zip(vertices[:-1], vertices[1:], _segment_counts(vertices, step)):
+        positions.append(start + np.outer(np.arange(count) / count, end - start))
+    positions.append(vertices[-1:])
+    return np.concatenate(positions)
+
+
+# Number of positions densify_polyline returns, without making them, so that the length of
+# a line can be checked before anything is allocated
+def polyline_position_count(vertices, step: float = 1.0) -> int:
+    vertices = np.asarray(vertices, dtype=np.float64).reshape(-1, 2)
+    if not np.all(np.isfinite(vertices)):
+        raise ValueError("Vertices must be finite")
+    if len(vertices) < 2:
+        return len(vertices)
+    return int(_segment_counts(vertices, step).sum()) + 1
+
+
+# lengths a rounding error beyond a whole number of steps, as transformed vertices often are,
+# do not get one more position
+def _segment_counts(vertices, step):
+    lengths = np.hypot(*np.diff(vertices, axis=0).T)
+    return np.maximum(np.ceil(lengths / step - EDGE_TOLERANCE), 1).astype(np.int64)
+
+
+# The traces around each position with their bilinear weights, as flat arrays of trace
+# row, inline index, crossline index and weight. Positions outside the volume get none, those
+# on its edge but for a rounding error are moved onto it.
+def bilinear_neighbours(positions, size):
+    positions = np.asarray(positions, dtype=np.float64).reshape(-1, 2)
+    last = np.asarray(size[:2]) - 1
+    inside = np.all((positions >= -EDGE_TOLERANCE) & (positions <= last + EDGE_TOLERANCE), axis=1)
+    rows = np.flatnonzero(inside)
+    positions = np.clip(positions[inside], 0, last)
+
+    # the lower neighbour stays one below the last trace so that the upper one exists
+    lower = np.minimum(np.floor(positions), np.maximum(np.asarray(size[:2]) - 2, 0)).astype(np.int64)
+    fraction = positions - lower
+    upper = np.minimum(lower + 1, np.asarray(size[:2]) - 1)
+    columns = [(lower[:, 0], lower[:, 1], (1 - fraction[:, 0]) * (1 - fraction[:, 1])),
+               (upper[:, 0], lower[:, 1], fraction[:, 0] * (1 - fraction[:, 1])),
+               (lower[:, 0], upper[:, 1], (1 - fraction[:, 0]) * fraction[:, 1]),
+               (upper[:, 0], upper[:, 1], fraction[:, 0] * fraction[:, 1])]
+    return (np.tile(rows, 4), np.concatenate([c[0] for c in columns]), np.concatenate([c[1] for c in columns]),
+            np.concatenate([c[2] for c in columns]))
+
+
+# Groups samples, or traces when given two coordinates, by the brick or brick column holding
+# them, as {brick key: selection}
+def plan_bricks(coordinates, bricksize):
+    keys = np.stack([index // size for index, size in zip(coordinates, bricksize)], axis=1)
+    unique, grouping = np.unique(keys, axis=0, return_inverse=True)
+    grouping = grouping.reshape(-1)
+    order = np.argsort(grouping, kind='stable')
+    bounds = np.searchsorted(grouping[order], np.arange(len(unique) + 1))
+    return {tuple(int(v) for v in key): order[bounds[n]:bounds[n + 1]] for n, key in enumerate(unique)}
+
+
+def read_region(reader, start, shape, lod: int = 0) -> np.ndarray:
+    buffer = np.zeros(shape, dtype=np.float32)
+    reader.read(tuple(int(v) for v in start), buffer, lod=lod)
+    return buffer
+
+
+# Traces along index positions, bilinearly interpolated between the four traces around each
+# position, for the samples [zstart, zstart + zcount). Each brick column is read once.
+def read_section(reader, positions, zstart: int, zcount: int) -> np.ndarray:
+    size, bricksize = reader.size, reader.bricksize
+    section = np.full((len(positions), zcount), np.nan, dtype=np.float32)
+    rows, inlines, crosslines, weights = bilinear_neighbours(positions, size)
+    if len(rows) == 0:
+        return section
+    section[np.unique(rows)] = 0
+
+    def read_column(key, selection):
+        start = (key[0] * bricksize[0], key[1] * bricksize[1], zstart)
+        shape = (min(bricksize[0], size[0] - start[0]), min(bricksize[1], size[1] - start[1]), zcount)
+        region = read_region(reader, start, shape)
+        values = region[inlines[selection] - start[0], crosslines[selection] - start[1]]
+        return selection, values * weights[selection, None].astype(np.float32)
+
+    futures = [_brick_executor.submit(read_column, key, selection)
+               for key, selection in plan_bricks((inlines, crosslines), bricksize).items()]
+    try:
+        for future in futures:
+            check_deadline()
+            selection, values = future.result()
+            np.add.at(section, rows[selection], values)
+        return section
+    finally:
+        for future in futures:
+            future.cancel()
+
+
+def lod_size(size, lod: int):
+    return tuple(-(-n // (1 << lod)) for n in size)
+
+
+# Samples at index positions (inline, crossline, z) of a level of detail, taken from the
+# nearest trace and linearly interpolated in z, in the order of the positions. Every brick
+# holding a position is read once, with one more sample for positions on its last one.
+def gather_samples(reader, positions, lod: int = 0) -> np.ndarray:
+    positions = np.asarray(positions, dtype=np.float64).reshape(-1, 3) / (1 << lod)
+    size, bricksize = lod_size(reader.size, lod), reader.bricksize
+    samples = np.full(len(positions), np.nan, dtype=np.float32)
+
+    traces = np.rint(positions[:, :2])
+    inside = np.all((traces >= 0) & (traces < np.asarray(size[:2])), axis=1) & \
+        (positions[:, 2] >= 0) & (positions[:, 2] <= size[2] - 1)
+    points = np.flatnonzero(inside)
+    inlines, crosslines = traces[inside].astype(np.int64).T
+    z = positions[inside, 2]
+    lower = np.minimum(np.floor(z), max(size[2] - 2, 0)).astype(np.int64)
+    fraction = (z - lower).astype(np.float32)
+    upper = np.minimum(lower + 1, size[2] - 1)
+
+    def read_brick(key, selection):
+        start = tuple(k * n for k, n in zip(key, bricksize))
+        shape = (min(bricksize[0], size[0] - start[0]), min(bricksize[1], size[1] - start[1]),
+                 min(bricksize[2] + 1, size[2] - start[2]))
+        region = read_region(reader, start, shape, lod)
+        i, j = inlines[selection] - start[0], crosslines[selection] - start[1]
+        return selection, region[i, j, lower[selection] - start[2]] * (1 - fraction[selection]) + \
+            region[i, j, upper[selection] - start[2]] * fraction[selection]
+
+    futures = [_brick_executor.submit(read_brick, key, selection)
+               for key, selection in plan_bricks((inlines, crosslines, lower), bricksize).items()]
+    try:
+        for future in futures:
+            check_deadline()
+            selection, values = future.result()
+            samples[points[selection]] = values
+        return samples
+    finally:
+        for future in futures:
+            future.cancel()
@@ -12,6 +12,148 @@ class Settings:
 
     # This is required for running the service
     SDMS_URL: str = os.getenv('SDMS_SERVICE_HOST')
+    SDMS_REQUEST_TIMEOUT: float = float(os.getenv('SDMS_REQUEST_TIMEOUT', '30'))
+
+    # Estimated native memory of open segysdk sessions and ZGY handles, opens beyond the budget wait
+    # and are then rejected, on the SDK threads after a shorter wait. No limit when the budget is 0. Python
+    # allocations are traced with tracemalloc when TRACEMALLOC_FRAMES is set, diagnostics/memory
+    # lists at most DIAGNOSTICS_MAX_TOP of them.
+    MEMORY_BUDGET_MB: int = int(os.getenv('MEMORY_BUDGET_MB', '0'))
+    MEMORY_BUDGET_WAIT: float = float(os.getenv('MEMORY_BUDGET_WAIT', '10'))
+    MEMORY_BUDGET_SDK_WAIT: float = float(os.getenv('MEMORY_BUDGET_SDK_WAIT', '0.5'))
+    SEGY_SESSION_ESTIMATE_MB: int = int(os.getenv('SEGY_SESSION_ESTIMATE_MB', '64'))
+    ZGY_READER_ESTIMATE_MB: int = int(os.getenv('ZGY_READER_ESTIMATE_MB', '128'))
+    ZGY_WRITER_ESTIMATE_MB: int = int(os.getenv('ZGY_WRITER_ESTIMATE_MB', '512'))
+    TRACEMALLOC_FRAMES: int = int(os.getenv('TRACEMALLOC_FRAMES', '0'))
+    DIAGNOSTICS_MAX_TOP: int = int(os.getenv('DIAGNOSTICS_MAX_TOP', '100'))
+
+    # Records waiting for the log thread before new ones are dropped, and the share of
+    # client and server errors logged with their traceback
+    LOG_QUEUE_SIZE: int = int(os.getenv('LOG_QUEUE_SIZE', '10000'))
+    LOG_TRACEBACK_SAMPLE_4XX: float = float(os.getenv('LOG_TRACEBACK_SAMPLE_4XX', '0.01'))
+    LOG_TRACEBACK_SAMPLE_5XX: float = float(os.getenv('LOG_TRACEBACK_SAMPLE_5XX', '1'))
+
+    # Seconds SDMS read access decisions per token and dataset are trusted, denials for a shorter time
+    ACCESS_CACHE_TTL: float = float(os.getenv('ACCESS_CACHE_TTL', '60'))
+    ACCESS_CACHE_NEGATIVE_TTL: float = float(os.getenv('ACCESS_CACHE_NEGATIVE_TTL', '5'))
+    ACCESS_CACHE_SIZE: int = int(os.getenv('ACCESS_CACHE_SIZE', '10000'))
+
+    # Read SEG-Y file headers with ranged storage reads instead of a segysdk session
+    NATIVE_SEGY_HEADERS: bool = os.getenv('NATIVE_SEGY_HEADERS', 'true').lower() == 'true'
+
+    # Node local block cache for dataset reads, disabled when no path is set
+    BLOCK_CACHE_PATH: str = os.getenv('BLOCK_CACHE_PATH', '')
+    BLOCK_CACHE_SIZE_MB: int = int(os.getenv('BLOCK_CACHE_SIZE_MB', '1024'))
+    BLOCK_CACHE_BLOCK_SIZE_KB: int = int(os.getenv('BLOCK_CACHE_BLOCK_SIZE_KB', '256'))
+
+    # Seconds a request may take unless the client sends X-Request-Timeout, longer for streamed results
+    REQUEST_DEADLINE: float = float(os.getenv('REQUEST_DEADLINE', '120'))
+    STREAMING_REQUEST_DEADLINE: float = float(os.getenv('STREAMING_REQUEST_DEADLINE', '3600'))
+
+    # Threads running blocking SDK calls and the per request fan out of batch calls
+    SDK_WORKER_THREADS: int = int(os.getenv('SDK_WORKER_THREADS', '16'))
+    # service-readiness fails once a call waited this many seconds for a thread
+    READINESS_MAX_QUEUE_DELAY: float = float(os.getenv('READINESS_MAX_QUEUE_DELAY', '2'))
+    BATCH_MAX_CONCURRENCY: int = int(os.getenv('BATCH_MAX_CONCURRENCY', '8'))
+    BATCH_MAX_ITEMS: int = int(os.getenv('BATCH_MAX_ITEMS', '50000'))
+
+    # Duplicate remote SDK reads slower than this percentile of recent reads, never sooner than the delay
+    HEDGE_READS: bool = os.getenv('HEDGE_READS', 'false').lower() == 'true'
+    HEDGE_PERCENTILE: float = float(os.getenv('HEDGE_PERCENTILE', '95'))
+    HEDGE_MIN_DELAY: float = float(os.getenv('HEDGE_MIN_DELAY', '0.2'))
+    HEDGE_MAX_IN_FLIGHT: int = int(os.getenv('HEDGE_MAX_IN_FLIGHT', '4'))
+
+    # Fail reads from a backend fast for a while when too many of its recent reads failed
+    BREAKER_ERROR_RATE: float = float(os.getenv('BREAKER_ERROR_RATE', '0.5'))
+    BREAKER_MIN_CALLS: int = int(os.getenv('BREAKER_MIN_CALLS', '20'))
+    BREAKER_WINDOW: float = float(os.getenv('BREAKER_WINDOW', '30'))
+    BREAKER_OPEN_SECONDS: float = float(os.getenv('BREAKER_OPEN_SECONDS', '30'))
+
+    # Write extracted file metadata back into the SDMS dataset filemetadata under this key. Off by
+    # default, every write is a patch of the dataset record and gives the dataset a new ctag.
+    PERSIST_METADATA: bool = os.getenv('PERSIST_METADATA', 'false').lower() == 'true'
+    PERSISTED_METADATA_KEY: str = os.getenv('PERSISTED_METADATA_KEY', 'extracted')
+
+    # Metadata results shared by all replicas, memory:// for an in-process stand-in or a redis:// URL,
+    # with a small near cache in each replica. Keys carry the dataset version, the TTLs bound memory.
+    SHARED_CACHE_URL: str = os.getenv('SHARED_CACHE_URL', '')
+    SHARED_CACHE_TTL: float = float(os.getenv('SHARED_CACHE_TTL', '86400'))
+    SHARED_CACHE_SIZE: int = int(os.getenv('SHARED_CACHE_SIZE', '100000'))
+    SHARED_CACHE_TIMEOUT: float = float(os.getenv('SHARED_CACHE_TIMEOUT', '0.2'))
+    NEAR_CACHE_TTL: float = float(os.getenv('NEAR_CACHE_TTL', '300'))
+    NEAR_CACHE_SIZE: int = int(os.getenv('NEAR_CACHE_SIZE', '2048'))
+
+    # Bytes of trace data read and converted at a time by segy/traces
+    TRACE_READ_CHUNK_BYTES: int = int(os.getenv('TRACE_READ_CHUNK_BYTES', str(8 * 1024 * 1024)))
+
+    # Seconds trace header requests for the same dataset are collected to merge neighbouring
+    # ranges into one read, not batched when 0, and the largest merged read in traces
+    TRACE_HEADER_BATCH_WINDOW: float = float(os.getenv('TRACE_HEADER_BATCH_WINDOW', '0.01'))
+    TRACE_HEADER_BATCH_MAX_TRACES: int = int(os.getenv('TRACE_HEADER_BATCH_MAX_TRACES', '10000'))
+
+    # Threads reducing trace header chunks for segy/headerProfile and the number of profiles kept in memory
+    HEADER_PROFILE_WORKERS: int = int(os.getenv('HEADER_PROFILE_WORKERS', '4'))
+    HEADER_PROFILE_CACHE_SIZE: int = int(os.getenv('HEADER_PROFILE_CACHE_SIZE', '256'))
+
+    # File the spatial index of volume footprints is kept in, in memory only when not set. Replicas
+    # given the same file on a shared volume share the index. Most sdpaths a footprint query returns
+    # and the subprojects whose volumes are checked for read access at the same time.
+    FOOTPRINT_INDEX_PATH: str = os.getenv('FOOTPRINT_INDEX_PATH', '')
+    FOOTPRINT_QUERY_MAX_RESULTS: int = int(os.getenv('FOOTPRINT_QUERY_MAX_RESULTS', '1000'))
+    FOOTPRINT_AUTHORIZE_WORKERS: int = int(os.getenv('FOOTPRINT_AUTHORIZE_WORKERS', '8'))
+
+    # Per volume coordinate transforms kept in memory and the most points openzgy/transform takes
+    COORDINATE_CACHE_SIZE: int = int(os.getenv('COORDINATE_CACHE_SIZE', '1024'))
+    COORDINATE_CACHE_TTL: float = float(os.getenv('COORDINATE_CACHE_TTL', '300'))
+    TRANSFORM_MAX_POINTS: int = int(os.getenv('TRANSFORM_MAX_POINTS', '1000000'))
+
+    # Admin routes such as admin/prefetch need this key in the x-admin-key header, they are refused without it
+    ADMIN_API_KEY: str = os.getenv('ADMIN_API_KEY', '')
+
+    # OAuth client credentials of the service itself, for background work that outlives the tokens
+    # of the callers who asked for it
+    SERVICE_TOKEN_URL: str = os.getenv('SERVICE_TOKEN_URL', '')
+    SERVICE_CLIENT_ID: str = os.getenv('SERVICE_CLIENT_ID', '')
+    SERVICE_CLIENT_SECRET: str = os.getenv('SERVICE_CLIENT_SECRET', '')
+    SERVICE_TOKEN_SCOPE: str = os.getenv('SERVICE_TOKEN_SCOPE', '')
+
+    # Background prefetch of metadata for new datasets: queued datasets, datasets a second, SDK calls
+    # in flight beyond which it waits, how long it waits, its nice value and the SDMS poll interval
+    PREFETCH_QUEUE_SIZE: int = int(os.getenv('PREFETCH_QUEUE_SIZE', '10000'))
+    PREFETCH_RATE: float = float(os.getenv('PREFETCH_RATE', '2'))
+    PREFETCH_MAX_IN_FLIGHT: int = int(os.getenv('PREFETCH_MAX_IN_FLIGHT', str(max(SDK_WORKER_THREADS // 2, 1))))
+    PREFETCH_YIELD_SECONDS: float = float(os.getenv('PREFETCH_YIELD_SECONDS', '0.5'))
+    PREFETCH_NICE: int = int(os.getenv('PREFETCH_NICE', '10'))
+    PREFETCH_POLL_INTERVAL: float = float(os.getenv('PREFETCH_POLL_INTERVAL', '60'))
+
+    # Threads reading ZGY brick regions of one request, the most traces an arbitrary line returns
+    # and the most positions openzgy/gather samples
+    ZGY_BRICK_READ_WORKERS: int = int(os.getenv('ZGY_BRICK_READ_WORKERS', '8'))
+    ARBITRARY_LINE_MAX_TRACES: int = int(os.getenv('ARBITRARY_LINE_MAX_TRACES', '100000'))
+    GATHER_MAX_POINTS: int = int(os.getenv('GATHER_MAX_POINTS', '5000000'))
+
+    # Background extraction jobs, their sqlite job table and how long finished jobs are kept. The
+    # table is only seen by replicas that open the same file: put it on a volume they share, or
+    # have the load balancer send the polls of a job back to the replica that took it.
+    JOBS_DB_PATH: str = os.getenv('JOBS_DB_PATH', '/var/lib/filemetadata/jobs.db')
+    JOB_WORKERS: int = int(os.getenv('JOB_WORKERS', '4'))
+    JOB_RESULT_TTL: float = float(os.getenv('JOB_RESULT_TTL', '86400'))
+    JOB_TRACES_PER_CHUNK: int = int(os.getenv('JOB_TRACES_PER_CHUNK', '1000'))
+
+    # SEG-Y to ZGY conversion jobs, decoded blocks are spilled to disk for resuming when a path is set.
+    # Spilled blocks left alone this many seconds are removed at startup. Conversions stop once the
+    # bearer of the caller has less than CONVERSION_BEARER_MARGIN seconds left.
+    CONVERSION_WORKERS: int = int(os.getenv('CONVERSION_WORKERS', '4'))
+    CONVERSION_SPILL_PATH: str = os.getenv('CONVERSION_SPILL_PATH', '')
+    CONVERSION_SPILL_MAX_AGE: float = float(os.getenv('CONVERSION_SPILL_MAX_AGE', '86400'))
+    CONVERSION_BEARER_MARGIN: float = float(os.getenv('CONVERSION_BEARER_MARGIN', '300'))
+    CONVERSION_ZFP_SNR: float = float(os.getenv('CONVERSION_ZFP_SNR', '0'))
+
+    # Port of the gRPC interface for high volume metadata clients, not served when 0. Served with
+    # TLS when the PEM certificate chain and private key files are given, in plain text otherwise.
+    GRPC_PORT: int = int(os.getenv('GRPC_PORT', '0'))
+    GRPC_TLS_CERT_FILE: str = os.getenv('GRPC_TLS_CERT_FILE', '')
+    GRPC_TLS_KEY_FILE: str = os.getenv('GRPC_TLS_KEY_FILE', '')
 
 
 settings = Settings()
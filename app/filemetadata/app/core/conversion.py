@@ -0,0 +1,208 @@
+import hashlib
+import os
+import logging
+import shutil
+import struct
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import openzgycpp as zgy
+
+from core.config import settings
+from core.footprints import record_footprint
+from core.memory import memory_budget
+from core.resilience import is_backend_failure
+from core.sdms import bearer_expiry
+from core.segy import decode_traces, find_traces, read_file_header, read_trace_key, INLINE_OFFSET
+from core.storage import open_dataset_reader
+
+BRICK_SIZE = 64
+
+# 0-based offsets of the coordinate scalar and the CDP X and Y in the trace header
+COORDINATE_SCALAR_OFFSET = 70
+CDP_X_OFFSET = 180
+
+
+class BearerExpired(Exception):
+    status_code = 401
+
+
+# Conversions read and write with the bearer of the caller, which cannot be refreshed here,
+# so they stop while it is still valid rather than part way through a write
+def check_bearer(bearer, what: str):
+    expiry = bearer_expiry(bearer)
+    if expiry is not None and expiry - time.time() < settings.CONVERSION_BEARER_MARGIN:
+        raise BearerExpired(f"The bearer expires in {max(expiry - time.time(), 0):.0f} seconds, {what}. "
+                            f"Submit the conversion again with a fresh bearer.")
+
+
+# Regular inline sorted geometry of a SEG-Y file: every inline holds the same crosslines
+class SegyGeometry:
+    def __init__(self, reader, file_header):
+        self.trace_count = file_header.trace_count(reader.size)
+        if self.trace_count < 1:
+            raise ValueError(f"{reader.sdpath} has no traces")
+
+        first_inline, first_crossline = read_trace_key(reader, file_header, 0)
+        self.crosslines = find_traces(reader, file_header, self.trace_count, first_inline)[1]
+        if self.trace_count % self.crosslines:
+            raise ValueError(f"{reader.sdpath} has {self.trace_count} traces, not a multiple of "
+                             f"{self.crosslines} crosslines per inline, only regular geometries are supported")
+        self.inlines = self.trace_count // self.crosslines
+        self.samples = file_header.samples_per_trace
+
+        last_inline, last_crossline = read_trace_key(reader, file_header, self.trace_count - 1)
+        self.annotstart = (first_inline, first_crossline)
+        self.annotinc = ((last_inline - first_inline) // max(self.inlines - 1, 1),
+                         (last_crossline - first_crossline) // max(self.crosslines - 1, 1))
+        self.corners = tuple(read_trace_coordinates(reader, file_header, self.trace_index(inline, crossline))
+                             for inline, crossline in ((0, 0), (self.inlines - 1, 0),
+                                                       (0, self.crosslines - 1),
+                                                       (self.inlines - 1, self.crosslines - 1)))
+
+    def trace_index(self, inline, crossline):
+        return inline * self.crosslines + crossline
+
+    def blocks(self):
+        return [(inline, crossline) for inline in range(0, self.inlines, BRICK_SIZE)
+                for crossline in range(0, self.crosslines, BRICK_SIZE)]
+
+
+def read_trace_coordinates(reader, file_header, index):
+    offset = file_header.first_trace_offset + index * file_header.trace_size
+    raw = reader.read(offset + COORDINATE_SCALAR_OFFSET, INLINE_OFFSET - COORDINATE_SCALAR_OFFSET)
+    scalar = struct.unpack_from(file_header.byte_order + 'h', raw, 0)[0]
+    x, y = struct.unpack_from(file_header.byte_order + 'ii', raw, CDP_X_OFFSET - COORDINATE_SCALAR_OFFSET)
+    factor = 1.0 if scalar == 0 else (scalar if scalar > 0 else 1.0 / -scalar)
+    return x * factor, y * factor
+
+
+# Reads a brick column of up to 64 inlines by 64 crosslines with every sample, one ranged
+# read per inline, and returns it as a float32 array indexed [inline, crossline, sample]
+def read_block(reader, file_header, geometry, inline, crossline):
+    inlines = min(BRICK_SIZE, geometry.inlines - inline)
+    crosslines = min(BRICK_SIZE, geometry.crosslines - crossline)
+    block = np.empty((inlines, crosslines, geometry.samples), dtype=np.float32)
+    for i in range(inlines):
+        offset = file_header.first_trace_offset + \
+            geometry.trace_index(inline + i, crossline) * file_header.trace_size
+        block[i] = decode_traces(reader.read(offset, crosslines * file_header.trace_size), file_header)
+    return block
+
+
+# Decoded blocks spilled to local disk so that a conversion that fails part way through
+# does not read and decode the SEG-Y blocks it already did again when it is resubmitted.
+# They are removed once the conversion succeeds or fails in a way another run would too.
+class BlockSpill:
+    def __init__(self, path, sdpath, generation):
+        self.directory = None
+        if path:
+            key = hashlib.sha1(f"{sdpath}\0{generation}".encode()).hexdigest()
+            self.directory = os.path.join(path, key)
+            os.makedirs(self.directory, exist_ok=True)
+
+    def _file(self, inline, crossline):
+        return os.path.join(self.directory, f"{inline}_{crossline}.npy")
+
+    def load(self, inline, crossline):
+        if self.directory and os.path.exists(self._file(inline, crossline)):
+            return np.load(self._file(inline, crossline))
+        return None
+
+    def save(self, inline, crossline, block):
+        if self.directory:
+            # written under a temporary name so that an interrupted save is never loaded
+            temporary = self._file(inline, crossline) + '.tmp'
+            with open(temporary, 'wb') as f:
+                np.save(f, block)
+            os.replace(temporary, self._file(inline, crossline))
+
+    def remove(self):
+        if self.directory:
+            shutil.rmtree(self.directory, ignore_errors=True)
+
+
+# Removes the spilled blocks of conversions not written to for max_age seconds, such as
+# those never submitted again or stopped with the replica that ran them
+def sweep_spill(path, max_age: float):
+    try:
+        entries = list(os.scandir(path))
+    except OSError:
+        return
+    for entry in entries:
+        try:
+            if entry.is_dir() and time.time() - entry.stat().st_mtime > max_age:
+                shutil.rmtree(entry.path, ignore_errors=True)
+                logging.info(f"Removed stale conversion spill {entry.path}")
+        except OSError as e:
+            logging.warning(f"Conversion spill {entry.path} was not removed: {e}")
+
+
+# Job converting a SEG-Y dataset to ZGY. Brick columns are read and decoded by a pool of
+# threads, at most CONVERSION_WORKERS ahead of the writer, and written in order. The ZGY
+# writer compresses the bricks and builds the levels of detail, statistics and histogram
+# when the file is finalised.
+def convert_segy_to_zgy(context, bearer, api_key, sdpath, target_sdpath):
+    check_bearer(bearer, f"too little to convert {sdpath}")
+    reader = open_dataset_reader(bearer, sdpath)
+    if reader.size is None:
+        raise ValueError(f"The size of {sdpath} is unknown")
+    file_header = read_file_header(reader)
+    geometry = SegyGeometry(reader, file_header)
+    spill = BlockSpill(settings.CONVERSION_SPILL_PATH, sdpath, reader.generation)
+
+    def load_block(block):
+        data = spill.load(*block)
+        if data is None:
+            data = read_block(reader, file_header, geometry, *block)
+            spill.save(*block, data)
+        return data
+
+    blocks = geometry.blocks()
+    # the blocks stay for the next run only when this one failed for a reason that run may not meet
+    keep = False
+    try:
+        context.progress(0, geometry.trace_count)
+        with memory_budget.hold('openzgy-writer'), \
+                zgy.ZgyWriter(target_sdpath,
+                              iocontext={"sdurl": settings.SDMS_URL, "sdapikey": api_key, "sdtoken": bearer},
+                              size=(geometry.inlines, geometry.crosslines, geometry.samples),
+                              datatype=zgy.SampleDataType.float,
+                              compressor=__compressor(),
+                              zunitdim=zgy.UnitDimension.time, zunitname="ms", zunitfactor=0.001,
+                              zstart=0.0, zinc=file_header.binary_values[5] / 1000.0,
+                              annotstart=geometry.annotstart, annotinc=geometry.annotinc,
+                              corners=geometry.corners) as writer, \
+                ThreadPoolExecutor(settings.CONVERSION_WORKERS, thread_name_prefix='convert') as pool:
+            done = 0
+            pending = [pool.submit(load_block, block) for block in blocks[:settings.CONVERSION_WORKERS]]
+            try:
+                for index, block in enumerate(blocks):
+                    check_bearer(bearer, f"{done} of {geometry.trace_count} traces were converted")
+                    data = pending.pop(0).result()
+                    if index + settings.CONVERSION_WORKERS < len(blocks):
+                        pending.append(pool.submit(load_block, blocks[index + settings.CONVERSION_WORKERS]))
+                    writer.write((block[0], block[1], 0), data)
+                    done += data.shape[0] * data.shape[1]
+                    context.progress(done, geometry.trace_count)
+            finally:
+                for future in pending:
+                    future.cancel()
+            writer.finalize()
+    except Exception as e:
+        keep = isinstance(e, BearerExpired) or is_backend_failure(e)
+        raise
+    finally:
+        if not keep:
+            spill.remove()
+
+    record_footprint(target_sdpath, geometry.corners)
+    return {"sdpath": target_sdpath, "size": [geometry.inlines, geometry.crosslines, geometry.samples],
+            "annotstart": list(geometry.annotstart), "annotinc": list(geometry.annotinc)}
+
+
+def __compressor():
+    if settings.CONVERSION_ZFP_SNR > 0:
+        return zgy.ZgyCompressFactory("ZFP", snr=settings.CONVERSION_ZFP_SNR)
+    return None
@@ -0,0 +1,59 @@
+import enum
+
+import numpy as np
+
+from core.config import settings
+from core.lru import LruCache
+
+
+class CoordinateSystem(str, enum.Enum):
+    index = "index"
+    annotation = "annotation"
+    world = "world"
+
+
+# Affine transforms between the index (i, j), annotation (inline, crossline) and world
+# (easting, northing) coordinates of a volume, fitted to the four corners in each system
+class BinGridTransform:
+    def __init__(self, indexcorners, annotcorners, corners):
+        index = np.asarray(indexcorners, dtype=np.float64)[:, :2]
+        self._from_index = {
+            CoordinateSystem.index: np.eye(3),
+            CoordinateSystem.annotation: self.__fit(index, np.asarray(annotcorners, dtype=np.float64)[:, :2]),
+            CoordinateSystem.world: self.__fit(index, np.asarray(corners, dtype=np.float64)[:, :2]),
+        }
+        self._to_index = {system: np.linalg.inv(matrix) for system, matrix in self._from_index.items()}
+
+    @staticmethod
+    def __fit(source, target):
+        # least squares solution of [x y 1] @ M = [u v] over the corners
+        homogeneous = np.hstack([source, np.ones((len(source), 1))])
+        solution = np.linalg.lstsq(homogeneous, target, rcond=None)[0]
+        matrix = np.eye(3)
+        matrix[:2, :] = solution.T
+        return matrix
+
+    def matrix(self, source: CoordinateSystem, target: CoordinateSystem) -> np.ndarray:
+        return self._from_index[target] @ self._to_index[source]
+
+    def transform(self, points, source: CoordinateSystem, target: CoordinateSystem) -> np.ndarray:
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        matrix = self.matrix(source, target)
+        return points @ matrix[:2, :2].T + matrix[:2, 2]
+
+
+# Least recently used transforms, each kept for COORDINATE_CACHE_TTL seconds
+class TransformCache:
+    def __init__(self, capacity: int, ttl: float):
+        self.ttl = ttl
+        self._entries = LruCache(capacity)
+
+    def get(self, key, load):
+        transform = self._entries.get(key)
+        if transform is None:
+            transform = load()
+            self._entries.put(key, transform, self.ttl)
+        return transform
+
+
+transform_cache = TransformCache(settings.COORDINATE_CACHE_SIZE, settings.COORDINATE_CACHE_TTL)
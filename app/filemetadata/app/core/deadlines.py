@@ -0,0 +1,73 @@
+import asyncio
+import contextvars
+import time
+
+
+class DeadlineExceeded(Exception):
+    status_code = 504
+
+    def __init__(self):
+        super().__init__("The request deadline passed before the work finished")
+
+
+class ClientDisconnected(Exception):
+    # nginx's code for a request closed by the client, nobody reads the response anyway
+    status_code = 499
+
+    def __init__(self):
+        super().__init__("The client disconnected before the work finished")
+
+
+# Deadline and disconnect state of the request being served, readable from worker threads
+class RequestScope:
+    def __init__(self, timeout: float = None):
+        self.deadline = None if timeout is None else time.monotonic() + timeout
+        self.disconnected = False
+        self._disconnect = asyncio.Event()
+
+    def remaining(self):
+        return None if self.deadline is None else max(self.deadline - time.monotonic(), 0.0)
+
+    @property
+    def expired(self):
+        return self.disconnected or (self.deadline is not None and time.monotonic() >= self.deadline)
+
+    def mark_disconnected(self):
+        self.disconnected = True
+        self._disconnect.set()
+
+    async def wait_disconnected(self):
+        await self._disconnect.wait()
+
+    def check(self):
+        if self.disconnected:
+            raise ClientDisconnected()
+        if self.deadline is not None and time.monotonic() >= self.deadline:
+            raise DeadlineExceeded()
+
+
+_scope = contextvars.ContextVar('request_scope', default=None)
+
+
+def current_scope() -> RequestScope:
+    return _scope.get()
+
+
+def enter_scope(scope: RequestScope):
+    return _scope.set(scope)
+
+
+def leave_scope(token):
+    _scope.reset(token)
+
+
+# Called between chunks of long running work, raises once nobody waits for its result
+def check_deadline():
+    scope = _scope.get()
+    if scope is not None:
+        scope.check()
+
+
+def deadline_expired() -> bool:
+    scope = _scope.get()
+    return scope is not None and scope.expired
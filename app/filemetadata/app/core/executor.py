@@ -0,0 +1,113 @@
+import asyncio
+import contextvars
+import functools
+import itertools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from core.config import settings
+from core.deadlines import DeadlineExceeded, check_deadline, current_scope
+from core.metrics import registry
+
+# segysdk and openzgy calls block on remote reads, they run here instead of on the event loop
+_executor = ThreadPoolExecutor(max_workers=settings.SDK_WORKER_THREADS, thread_name_prefix='sdk')
+_sdk_thread = threading.local()
+
+in_flight = registry.gauge("filemetadata_sdk_calls_in_flight", "SDK calls running on the SDK threads")
+queued = registry.gauge("filemetadata_sdk_calls_queued", "SDK calls waiting for an SDK thread")
+queue_seconds = registry.histogram("filemetadata_sdk_queue_seconds", "Time SDK calls waited for an SDK thread")
+call_seconds = registry.histogram("filemetadata_sdk_call_seconds", "Duration of SDK calls including the wait")
+
+_load_lock = threading.Lock()
+_tickets = itertools.count()
+# enqueue time of each call that has not started yet
+_waiting = {}
+_running = 0
+
+
+def _publish():
+    in_flight.set(_running)
+    queued.set(len(_waiting))
+
+
+def _enqueue():
+    ticket = next(_tickets)
+    with _load_lock:
+        _waiting[ticket] = time.monotonic()
+        _publish()
+    return ticket
+
+
+def _forget(ticket):
+    # calls cancelled before they started never run
+    with _load_lock:
+        if _waiting.pop(ticket, None) is not None:
+            _publish()
+
+
+def on_sdk_thread() -> bool:
+    return getattr(_sdk_thread, 'active', False)
+
+
+# Threads of other pools running parts of SDK calls, such as hedged reads, count as SDK threads
+def mark_sdk_thread():
+    _sdk_thread.active = True
+
+
+def _run_unless_expired(ticket, fn, args, kwargs):
+    global _running
+    _sdk_thread.active = True
+    started = time.monotonic()
+    with _load_lock:
+        enqueued = _waiting.pop(ticket, started)
+        _running += 1
+        _publish()
+    queue_seconds.observe(started - enqueued)
+    try:
+        # work that waited in the queue past its deadline is dropped before it starts
+        check_deadline()
+        return fn(*args, **kwargs)
+    finally:
+        with _load_lock:
+            _running -= 1
+            _publish()
+        call_seconds.observe(time.monotonic() - enqueued)
+
+
+# Load of the SDK threads: running and waiting calls, and how long the oldest waiting one waits
+def sdk_load():
+    now = time.monotonic()
+    with _load_lock:
+        oldest = min(_waiting.values(), default=now)
+        return {"workers": settings.SDK_WORKER_THREADS, "in_flight": _running, "queued": len(_waiting),
+                "queue_delay_seconds": now - oldest}
+
+
+# Runs fn on the SDK threads with the request scope, so that chunked work sees the deadline,
+# and gives up waiting once the deadline passes or the client disconnects
+async def run_sdk_call(fn, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    ticket = _enqueue()
+    future = loop.run_in_executor(_executor, functools.partial(context.run, _run_unless_expired, ticket, fn, args,
+                                                               kwargs))
+    future.add_done_callback(lambda _: _forget(ticket))
+
+    scope = current_scope()
+    if scope is None:
+        return await future
+
+    disconnect = asyncio.ensure_future(scope.wait_disconnected())
+    try:
+        done, _ = await asyncio.wait({future, disconnect}, timeout=scope.remaining(),
+                                     return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        disconnect.cancel()
+    if future in done:
+        return future.result()
+
+    # a call already running finishes on its SDK thread, nobody waits for it
+    future.cancel()
+    scope.check()
+    raise DeadlineExceeded()
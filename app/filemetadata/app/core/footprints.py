@@ -0,0 +1,225 @@
+import atexit
+import fcntl
+import json
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+
+from core.config import settings
+
+# the index file is rewritten, and read again for the changes of other replicas, at most this often
+SAVE_INTERVAL = 5.0
+
+
+# Footprints of volumes in world coordinates. Queries filter on bounding boxes held in
+# one NumPy array before testing the few remaining polygons exactly. With a path the index
+# is kept in that file, which replicas sharing the volume it is on merge their changes into.
+class FootprintIndex:
+    def __init__(self, path: str = ''):
+        self.path = path
+        self._lock = threading.Lock()
+        self._sdpaths = []
+        self._rows = {}
+        self._polygons = []
+        # grown geometrically, rows past the number of volumes are unused
+        self._boxes = np.empty((16, 4))
+        # changes not written to the file yet, None for removed volumes
+        self._changes = {}
+        self._saved = 0.0
+        self._refreshed = 0.0
+        self._mtime = None
+        if path:
+            with self._lock:
+                self._refresh()
+
+    def __len__(self):
+        return len(self._sdpaths)
+
+    # corners are given like the ZGY corners: origin, last inline, last crossline, opposite corner
+    def update(self, sdpath: str, corners):
+        corners = np.asarray(corners, dtype=np.float64)[:, :2]
+        polygon = corners[[0, 1, 3, 2]] if len(corners) == 4 else corners
+        with self._lock:
+            row = self._rows.get(sdpath)
+            if row is not None and np.array_equal(self._polygons[row], polygon):
+                return
+            self._put(sdpath, polygon)
+            self._changes[sdpath] = polygon
+            self._save()
+
+    def remove(self, sdpath: str):
+        with self._lock:
+            if sdpath in self._rows:
+                self._drop(sdpath)
+            elif not self.path:
+                return
+            self._changes[sdpath] = None
+            self._save()
+
+    def query(self, polygon, prefix: str = ''):
+        polygon = np.atleast_2d(np.asarray(polygon, dtype=np.float64))
+        low, high = polygon.min(axis=0), polygon.max(axis=0)
+        with self._lock:
+            if self.path and time.monotonic() - self._refreshed >= SAVE_INTERVAL:
+                self._refresh()
+            boxes = self._boxes[:len(self._sdpaths)]
+            candidates = np.flatnonzero((boxes[:, 0] <= high[0]) & (boxes[:, 2] >= low[0]) &
+                                        (boxes[:, 1] <= high[1]) & (boxes[:, 3] >= low[1]))
+            found = [(self._sdpaths[row], self._polygons[row]) for row in candidates
+                     if self._sdpaths[row].startswith(prefix)]
+        return sorted(sdpath for sdpath, footprint in found if polygons_intersect(footprint, polygon))
+
+    def flush(self):
+        with self._lock:
+            if self._changes:
+                self._save(force=True)
+
+    def _put(self, sdpath, polygon):
+        row = self._rows.get(sdpath)
+        if row is None:
+            row = len(self._sdpaths)
+            if row == len(self._boxes):
+                boxes = np.empty((2 * len(self._boxes), 4))
+                boxes[:row] = self._boxes
+                self._boxes = boxes
+            self._rows[sdpath] = row
+            self._sdpaths.append(sdpath)
+            self._polygons.append(polygon)
+        else:
+            self._polygons[row] = polygon
+        self._boxes[row, :2] = polygon.min(axis=0)
+        self._boxes[row, 2:] = polygon.max(axis=0)
+
+    def _drop(self, sdpath):
+        # the last volume takes the row of the removed one
+        row = self._rows.pop(sdpath)
+        last = len(self._sdpaths) - 1
+        if row != last:
+            moved = self._sdpaths[last]
+            self._sdpaths[row] = moved
+            self._polygons[row] = self._polygons[last]
+            self._boxes[row] = self._boxes[last]
+            self._rows[moved] = row
+        self._sdpaths.pop()
+        self._polygons.pop()
+
+    def _rebuild(self, footprints: dict):
+        self._sdpaths, self._rows, self._polygons = [], {}, []
+        for sdpath, polygon in footprints.items():
+            if self._changes.get(sdpath, polygon) is not None:
+                self._put(sdpath, np.asarray(polygon, dtype=np.float64))
+        for sdpath, polygon in self._changes.items():
+            if polygon is not None:
+                self._put(sdpath, polygon)
+
+    # reads the file again when another replica wrote it, changes not saved yet are kept
+    def _refresh(self):
+        self._refreshed = time.monotonic()
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError:
+            return
+        if mtime == self._mtime:
+            return
+        footprints = self._read()
+        if footprints is not None:
+            self._mtime = mtime
+            self._rebuild(footprints)
+
+    def _save(self, force=False):
+        if not self.path:
+            self._changes.clear()
+            return
+        if not force and time.monotonic() - self._saved < SAVE_INTERVAL:
+            return
+        with open(self.path + '.lock', 'a') as lock:
+            # replicas take turns, each writes its changes over what the others wrote
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            footprints = (self._read() if os.path.exists(self.path) else None) or {}
+            for sdpath, polygon in self._changes.items():
+                if polygon is None:
+                    footprints.pop(sdpath, None)
+                else:
+                    footprints[sdpath] = polygon.tolist()
+            temporary = f"{self.path}.{os.getpid()}.tmp"
+            with open(temporary, 'w') as f:
+                json.dump(footprints, f)
+            os.replace(temporary, self.path)
+            self._mtime = os.stat(self.path).st_mtime_ns
+        self._changes.clear()
+        self._rebuild(footprints)
+        self._saved = time.monotonic()
+
+    def _read(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            logging.warning(f"Footprint index {self.path} could not be read: {e}")
+            return None
+
+
+def points_in_polygon(points: np.ndarray, polygon: np.ndarray) -> np.ndarray:
+    # even odd rule, points on the boundary count as inside
+    x, y = points[:, 0:1], points[:, 1:2]
+    x1, y1 = polygon[:, 0], polygon[:, 1]
+    x2, y2 = np.roll(x1, -1), np.roll(y1, -1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        crossing = ((y1 > y) != (y2 > y)) & (x < (x2 - x1) * (y - y1) / (y2 - y1) + x1)
+    inside = np.count_nonzero(crossing, axis=1) % 2 == 1
+    return inside | _on_boundary(points, polygon)
+
+
+def _on_boundary(points, polygon):
+    start = polygon[None, :, :]
+    edge = np.roll(polygon, -1, axis=0)[None, :, :] - start
+    offset = points[:, None, :] - start
+    cross = edge[..., 0] * offset[..., 1] - edge[..., 1] * offset[..., 0]
+    dot = (offset * edge).sum(axis=2)
+    return ((np.abs(cross) <= 1e-9 * np.maximum(np.abs(edge).sum(axis=2), 1)) &
+            (dot >= 0) & (dot <= (edge * edge).sum(axis=2))).any(axis=1)
+
+
+def _edges_cross(a, b):
+    a1, a2 = a[:, None, :], np.roll(a, -1, axis=0)[:, None, :]
+    b1, b2 = b[None, :, :], np.roll(b, -1, axis=0)[None, :, :]
+
+    def orientation(p, q, r):
+        return np.sign((q[..., 0] - p[..., 0]) * (r[..., 1] - p[..., 1]) -
+                       (q[..., 1] - p[..., 1]) * (r[..., 0] - p[..., 0]))
+
+    return ((orientation(a1, a2, b1) * orientation(a1, a2, b2) < 0) &
+            (orientation(b1, b2, a1) * orientation(b1, b2, a2) < 0)).any()
+
+
+# The query polygon may also be a single point
+def polygons_intersect(footprint: np.ndarray, polygon: np.ndarray) -> bool:
+    if points_in_polygon(polygon, footprint).any():
+        return True
+    if len(polygon) < 3:
+        return False
+    return bool(points_in_polygon(footprint, polygon).any() or _edges_cross(footprint, polygon))
+
+
+_footprint_index = None
+_footprint_index_lock = threading.Lock()
+
+
+def get_footprint_index():
+    global _footprint_index
+    with _footprint_index_lock:
+        if _footprint_index is None:
+            _footprint_index = FootprintIndex(settings.FOOTPRINT_INDEX_PATH)
+            atexit.register(_footprint_index.flush)
+    return _footprint_index
+
+
+# Called with the corners of every volume whose metadata is extracted, never fails the caller
+def record_footprint(sdpath, corners):
+    try:
+        get_footprint_index().update(sdpath, corners)
+    except Exception as e:
+        logging.warning(f"Footprint of {sdpath} was not indexed: {e}")
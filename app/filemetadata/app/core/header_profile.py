@@ -0,0 +1,131 @@
+import collections
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from core.config import settings
+from core.deadlines import check_deadline
+from core.lru import LruCache
+from core.segy import TRACE_HEADER_FIELDS, SegyFileHeader, trace_header_dtype
+
+# smallest hashes kept per field, distinct counts up to this are exact and beyond it
+# estimated within about 3 percent
+SKETCH_SIZE = 1024
+
+_profile_executor = ThreadPoolExecutor(max_workers=settings.HEADER_PROFILE_WORKERS, thread_name_prefix='profile')
+
+
+def _hash(values: np.ndarray) -> np.ndarray:
+    # the 64 bit finaliser of MurmurHash3, uint64 arithmetic wraps around
+    h = values.astype(np.int64).view(np.uint64)
+    h = (h ^ (h >> np.uint64(33))) * np.uint64(0xff51afd7ed558ccd)
+    h = (h ^ (h >> np.uint64(33))) * np.uint64(0xc4ceb9fe1a85ec53)
+    return h ^ (h >> np.uint64(33))
+
+
+def _sketch(values: np.ndarray) -> np.ndarray:
+    return np.unique(_hash(values))[:SKETCH_SIZE]
+
+
+def distinct_estimate(sketch: np.ndarray) -> int:
+    if len(sketch) < SKETCH_SIZE:
+        return len(sketch)
+    return int(round((SKETCH_SIZE - 1) / ((float(sketch[-1]) + 1) / 2.0 ** 64)))
+
+
+# Summary of the values of one header field over a range of traces, ranges of neighbouring
+# traces are merged in trace order so that runs spanning them are counted once
+class FieldProfile:
+    def __init__(self, values: np.ndarray):
+        values = values.astype(np.int64)
+        steps = np.diff(values)
+        self.count = len(values)
+        self.minimum = int(values.min())
+        self.maximum = int(values.max())
+        self.zeros = int(np.count_nonzero(values == 0))
+        self.first = int(values[0])
+        self.last = int(values[-1])
+        self.ascending_runs = 1 + int(np.count_nonzero(steps < 0))
+        self.descending_runs = 1 + int(np.count_nonzero(steps > 0))
+        self.sketch = _sketch(values)
+
+    def merge(self, following: 'FieldProfile'):
+        self.ascending_runs += following.ascending_runs - (self.last <= following.first)
+        self.descending_runs += following.descending_runs - (self.last >= following.first)
+        self.count += following.count
+        self.minimum = min(self.minimum, following.minimum)
+        self.maximum = max(self.maximum, following.maximum)
+        self.zeros += following.zeros
+        self.last = following.last
+        self.sketch = np.union1d(self.sketch, following.sketch)[:SKETCH_SIZE]
+
+    def to_json(self, name, start, end):
+        return {"Id": name, "Start": start, "End": end, "Min": self.minimum, "Max": self.maximum,
+                "DistinctEstimate": distinct_estimate(self.sketch), "AscendingRuns": self.ascending_runs,
+                "DescendingRuns": self.descending_runs, "Constant": self.minimum == self.maximum,
+                "Zero": self.zeros == self.count}
+
+
+class HeaderProfile:
+    def __init__(self, headers: np.ndarray):
+        self.trace_count = len(headers)
+        self.fields = {name: FieldProfile(headers[name]) for name, _, _ in TRACE_HEADER_FIELDS}
+        # CDP locations as single values, x in the high and y in the low 32 bits
+        locations = (headers['CdpX'].astype(np.int64) << 32) | (headers['CdpY'].astype(np.int64) & 0xffffffff)
+        self.locations = _sketch(locations)
+
+    def merge(self, following: 'HeaderProfile'):
+        self.trace_count += following.trace_count
+        for name, profile in self.fields.items():
+            profile.merge(following.fields[name])
+        self.locations = np.union1d(self.locations, following.locations)[:SKETCH_SIZE]
+
+    def to_json(self, sdpath):
+        return {"TraceCount": self.trace_count,
+                "DistinctCdpLocations": distinct_estimate(self.locations),
+                "Fields": [self.fields[name].to_json(name, start, end) for name, start, end in TRACE_HEADER_FIELDS],
+                "metadata": {"Filenames": [sdpath]}}
+
+
+def profile_traces(raw: bytes, file_header: SegyFileHeader) -> HeaderProfile:
+    return HeaderProfile(np.frombuffer(raw, dtype=trace_header_dtype(file_header)))
+
+
+def _profile_range(reader, file_header: SegyFileHeader, first: int, count: int):
+    offset = file_header.first_trace_offset + first * file_header.trace_size
+    return profile_traces(reader.read(offset, count * file_header.trace_size), file_header)
+
+
+# Reads every trace and reduces its header, TRACE_READ_CHUNK_BYTES of traces at a time on
+# HEADER_PROFILE_WORKERS threads. No more chunks than there are threads are read ahead of
+# the one merged next, the chunk profiles are merged in trace order as they complete.
+def profile_dataset(reader, file_header: SegyFileHeader, trace_count: int) -> HeaderProfile:
+    if trace_count < 1:
+        raise ValueError("The dataset holds no traces")
+
+    per_chunk = max(settings.TRACE_READ_CHUNK_BYTES // file_header.trace_size, 1)
+    firsts = iter(range(0, trace_count, per_chunk))
+    pending = collections.deque()
+    try:
+        profile = None
+        while True:
+            for first in firsts:
+                pending.append(_profile_executor.submit(_profile_range, reader, file_header, first,
+                                                        min(per_chunk, trace_count - first)))
+                if len(pending) >= settings.HEADER_PROFILE_WORKERS:
+                    break
+            if not pending:
+                return profile
+            check_deadline()
+            chunk = pending.popleft().result()
+            if profile is None:
+                profile = chunk
+            else:
+                profile.merge(chunk)
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+# Profiles of recently profiled datasets by sdpath and dataset version
+profile_cache = LruCache(settings.HEADER_PROFILE_CACHE_SIZE)
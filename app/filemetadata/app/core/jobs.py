@@ -0,0 +1,238 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+from core.config import settings
+
+QUEUED = 'queued'
+RUNNING = 'running'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+FINISHED = (SUCCEEDED, FAILED, CANCELLED)
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    sdpath TEXT NOT NULL,
+    params TEXT NOT NULL,
+    status TEXT NOT NULL,
+    done INTEGER NOT NULL DEFAULT 0,
+    total INTEGER,
+    error TEXT,
+    result BLOB,
+    created REAL NOT NULL,
+    started REAL,
+    finished REAL,
+    expires REAL,
+    owner TEXT
+)'''
+
+# pieces of a result written by the job as it goes, served in order of seq
+_CHUNKS_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS job_chunks (
+    job_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    data BLOB NOT NULL,
+    PRIMARY KEY (job_id, seq)
+)'''
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class JobNotFound(Exception):
+    pass
+
+
+# jobs are tied to the token that submitted them, which is not stored in the clear
+def owner_of(bearer) -> str:
+    return hashlib.sha256(bearer.encode()).hexdigest()
+
+
+# Handed to the job function to report progress and notice cancellation between chunks
+class JobContext:
+    def __init__(self, manager, job_id, cancelled: threading.Event):
+        self._manager = manager
+        self.job_id = job_id
+        self._cancelled = cancelled
+        self.written = 0
+        self._seq = 0
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def progress(self, done: int, total: int = None):
+        if self.cancelled:
+            raise JobCancelled()
+        self._manager._update(self.job_id, done=done, total=total)
+
+    # Stores a piece of the result instead of holding it until the job returns. Pieces go
+    # after the previous ones unless seq says otherwise, seq 0 is never taken by default.
+    def write(self, text: str, seq: int = None):
+        if seq is None:
+            self._seq += 1
+            seq = self._seq
+        self._manager._write(self.job_id, seq, text)
+        self.written += 1
+
+
+class JobManager:
+    def __init__(self, db_path: str, workers: int, result_ttl: float):
+        self.result_ttl = result_ttl
+        os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+        self._db = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._db.row_factory = sqlite3.Row
+        self._db_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='job')
+        self._cancel_events = {}
+
+        with self._db_lock:
+            self._db.execute(_SCHEMA)
+            self._db.execute(_CHUNKS_SCHEMA)
+            if 'owner' not in [column['name'] for column in self._db.execute("PRAGMA table_info(jobs)")]:
+                self._db.execute("ALTER TABLE jobs ADD COLUMN owner TEXT")
+            # credentials are never persisted so jobs cut short by a restart cannot go on
+            self._db.execute("UPDATE jobs SET status = ?, error = ?, finished = ?, expires = ? WHERE status IN (?, ?)",
+                             (FAILED, 'Interrupted by a service restart', time.time(), time.time() + result_ttl,
+                              QUEUED, RUNNING))
+
+    def submit(self, kind: str, sdpath: str, params: dict, fn, *args, owner: str = None):
+        self.purge_expired()
+        job_id = uuid.uuid4().hex
+        with self._db_lock:
+            self._db.execute("INSERT INTO jobs (id, kind, sdpath, params, status, created, owner) "
+                             "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                             (job_id, kind, sdpath, json.dumps(params), QUEUED, time.time(), owner))
+        cancelled = threading.Event()
+        self._cancel_events[job_id] = cancelled
+        self._executor.submit(self._run, job_id, cancelled, fn, args)
+        return job_id
+
+    def _run(self, job_id, cancelled, fn, args):
+        try:
+            if cancelled.is_set():
+                raise JobCancelled()
+            self._update(job_id, status=RUNNING, started=time.time())
+            context = JobContext(self, job_id, cancelled)
+            result = fn(context, *args)
+            if context.written:
+                self._finish(job_id, SUCCEEDED)
+            else:
+                self._finish(job_id, SUCCEEDED, result=zlib.compress(json.dumps(result).encode()))
+        except JobCancelled:
+            self._discard(job_id)
+            self._finish(job_id, CANCELLED)
+        except Exception as e:
+            logging.warning(f"Job {job_id} failed: {e}")
+            self._discard(job_id)
+            self._finish(job_id, FAILED, error=str(getattr(e, 'detail', e)))
+        finally:
+            self._cancel_events.pop(job_id, None)
+
+    def _update(self, job_id, **columns):
+        columns = {k: v for k, v in columns.items() if v is not None}
+        assignments = ', '.join(f"{column} = ?" for column in columns)
+        with self._db_lock:
+            self._db.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*columns.values(), job_id))
+
+    def _write(self, job_id, seq, text):
+        with self._db_lock:
+            self._db.execute("INSERT OR REPLACE INTO job_chunks (job_id, seq, data) VALUES (?, ?, ?)",
+                             (job_id, seq, zlib.compress(text.encode())))
+
+    def _discard(self, job_id):
+        with self._db_lock:
+            self._db.execute("DELETE FROM job_chunks WHERE job_id = ?", (job_id,))
+
+    def _finish(self, job_id, status, **columns):
+        now = time.time()
+        self._update(job_id, status=status, finished=now, expires=now + self.result_ttl, **columns)
+
+    # Jobs of other owners look like jobs that do not exist. The owner is only left out
+    # by the service itself.
+    def _row(self, job_id, owner=None):
+        with self._db_lock:
+            row = self._db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None or (row['expires'] is not None and row['expires'] < time.time()) or \
+                (owner is not None and row['owner'] != owner):
+            raise JobNotFound(f"Job {job_id} does not exist or has expired")
+        return row
+
+    def status(self, job_id, owner: str = None):
+        row = self._row(job_id, owner)
+        eta = None
+        if row['status'] == RUNNING and row['total'] and row['done']:
+            elapsed = time.time() - row['started']
+            eta = round(elapsed * (row['total'] - row['done']) / row['done'], 1)
+        return {
+            'job_id': row['id'],
+            'kind': row['kind'],
+            'sdpath': row['sdpath'],
+            'params': json.loads(row['params']),
+            'status': row['status'],
+            'progress': {'done': row['done'], 'total': row['total'], 'eta_seconds': eta},
+            'error': row['error'],
+            'created': row['created'],
+            'started': row['started'],
+            'finished': row['finished'],
+            'expires': row['expires'],
+        }
+
+    # The status and the value the job returned. Results the job wrote piece by piece come
+    # back as an iterator of the pieces, each read from the store when it is reached.
+    def result(self, job_id, owner: str = None):
+        row = self._row(job_id, owner)
+        if row['status'] != SUCCEEDED:
+            return row['status'], None
+        if row['result'] is None:
+            return row['status'], self._pieces(job_id)
+        return row['status'], json.loads(zlib.decompress(row['result']))
+
+    def _pieces(self, job_id):
+        seq = -1
+        while True:
+            with self._db_lock:
+                chunk = self._db.execute("SELECT seq, data FROM job_chunks WHERE job_id = ? AND seq > ? "
+                                         "ORDER BY seq LIMIT 1", (job_id, seq)).fetchone()
+            if chunk is None:
+                return
+            seq = chunk['seq']
+            yield zlib.decompress(chunk['data']).decode()
+
+    def cancel(self, job_id, owner: str = None):
+        row = self._row(job_id, owner)
+        if row['status'] in FINISHED:
+            return row['status']
+        cancelled = self._cancel_events.get(job_id)
+        if cancelled:
+            cancelled.set()
+        return CANCELLED
+
+    def purge_expired(self):
+        now = time.time()
+        with self._db_lock:
+            self._db.execute("DELETE FROM job_chunks WHERE job_id IN (SELECT id FROM jobs WHERE expires < ?)", (now,))
+            self._db.execute("DELETE FROM jobs WHERE expires < ?", (now,))
+
+
+_job_manager = None
+_job_manager_lock = threading.Lock()
+
+
+def get_job_manager():
+    global _job_manager
+    with _job_manager_lock:
+        if _job_manager is None:
+            _job_manager = JobManager(settings.JOBS_DB_PATH, settings.JOB_WORKERS, settings.JOB_RESULT_TTL)
+    return _job_manager
@@ -0,0 +1,87 @@
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+
+from core.config import settings
+from core.metrics import registry
+
+dropped_records = registry.counter("filemetadata_log_records_dropped_total",
+                                   "Log records dropped because the log queue was full")
+suppressed_tracebacks = registry.counter("filemetadata_log_tracebacks_suppressed_total",
+                                         "Error tracebacks left out of the log by sampling")
+
+
+# One JSON object per line. Fields passed as extra={'fields': {...}} are added to the record.
+class CompactFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {"time": self.formatTime(record), "level": record.levelname, "logger": record.name,
+                 "message": record.getMessage()}
+        entry.update(getattr(record, 'fields', None) or {})
+        if record.exc_info:
+            entry["traceback"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+# Hands records to the listener thread without waiting. Records stay in the process, so
+# unlike the stock QueueHandler their tracebacks are formatted by the listener, not the caller.
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record):
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            dropped_records.inc()
+
+
+_listener = None
+_handlers = []
+
+
+# Moves the handlers of the root logger, a stderr handler when there are none, behind a
+# bounded queue drained by a background thread
+def start_logging():
+    global _listener
+    if _listener is not None:
+        return
+
+    root = logging.getLogger()
+    _handlers[:] = root.handlers or [logging.StreamHandler(sys.stderr)]
+    for handler in _handlers:
+        handler.setFormatter(CompactFormatter())
+        root.removeHandler(handler)
+    root.addHandler(NonBlockingQueueHandler(queue.Queue(settings.LOG_QUEUE_SIZE)))
+
+    _listener = logging.handlers.QueueListener(root.handlers[0].queue, *_handlers, respect_handler_level=True)
+    _listener.start()
+
+
+def stop_logging():
+    global _listener
+    if _listener is None:
+        return
+
+    # writes out what is still queued
+    _listener.stop()
+    _listener = None
+    root = logging.getLogger()
+    for handler in [h for h in root.handlers if isinstance(h, NonBlockingQueueHandler)]:
+        root.removeHandler(handler)
+    for handler in _handlers:
+        root.addHandler(handler)
+
+
+# Whether the traceback of an error answered with this status goes into the log. Client
+# errors come in bursts, such as expired tokens, and are mostly logged without one.
+def traceback_sampled(status_code: int) -> bool:
+    rate = settings.LOG_TRACEBACK_SAMPLE_5XX if status_code >= 500 else settings.LOG_TRACEBACK_SAMPLE_4XX
+    if random.random() < rate:
+        return True
+    suppressed_tracebacks.inc(status_class=f"{status_code // 100}xx")
+    return False
@@ -0,0 +1,133 @@
+import contextlib
+import os
+import threading
+import tracemalloc
+
+from core.config import settings
+from core.deadlines import current_scope
+from core.executor import on_sdk_thread
+from core.metrics import registry
+
+MB = 1024 * 1024
+
+open_handles = registry.gauge("filemetadata_native_handles", "Open segysdk sessions and ZGY readers and writers")
+reserved_bytes = registry.gauge("filemetadata_native_reserved_bytes", "Estimated native memory of the open handles")
+queued_opens = registry.counter("filemetadata_native_opens_queued_total", "Opens that waited for memory")
+rejected_opens = registry.counter("filemetadata_native_opens_rejected_total", "Opens rejected for lack of memory")
+
+
+class MemoryBudgetExceeded(Exception):
+    status_code = 503
+
+    def __init__(self, kind: str, retry_after: float):
+        super().__init__(f"No memory left to open a {kind} handle, retry in {int(retry_after) + 1} seconds")
+        self.retry_after = retry_after
+
+
+# Estimated native memory of a handle of each kind, the Python allocator does not see it
+def handle_estimate(kind: str) -> int:
+    return {
+        'segysdk': settings.SEGY_SESSION_ESTIMATE_MB,
+        'openzgy': settings.ZGY_READER_ESTIMATE_MB,
+        'openzgy-writer': settings.ZGY_WRITER_ESTIMATE_MB,
+    }.get(kind, settings.ZGY_READER_ESTIMATE_MB) * MB
+
+
+# Counts native handles and their estimated memory per kind. With a limit, opens that would
+# go beyond it wait up to MEMORY_BUDGET_WAIT seconds, or the rest of the request deadline
+# when that is shorter, for other handles to close and are rejected after that. Opens on the
+# SDK threads wait no longer than sdk_wait. A long wait there would hold a thread that the
+# calls closing handles need, a short one rides out handles about to close. A handle larger
+# than the whole budget is let through once nothing else is open.
+class MemoryBudget:
+    def __init__(self, limit: int, wait: float, sdk_wait: float = settings.MEMORY_BUDGET_SDK_WAIT):
+        self.limit = limit
+        self.wait = wait
+        self.sdk_wait = sdk_wait
+        self.used = 0
+        self.handles = {}
+        self._changed = threading.Condition()
+
+    def acquire(self, kind: str, size: int):
+        with self._changed:
+            if self.limit and not self._fits(size):
+                queued_opens.inc(kind=kind)
+                wait = min(self.wait, self.sdk_wait) if on_sdk_thread() else self.wait
+                scope = current_scope()
+                if scope is not None and scope.remaining() is not None:
+                    wait = min(wait, scope.remaining())
+                if not self._changed.wait_for(lambda: self._fits(size), timeout=wait):
+                    rejected_opens.inc(kind=kind)
+                    raise MemoryBudgetExceeded(kind, self.wait)
+
+            self.used += size
+            count, total = self.handles.get(kind, (0, 0))
+            self.handles[kind] = (count + 1, total + size)
+            self._publish(kind)
+
+    def release(self, kind: str, size: int):
+        with self._changed:
+            self.used -= size
+            count, total = self.handles[kind]
+            self.handles[kind] = (count - 1, total - size)
+            self._publish(kind)
+            self._changed.notify_all()
+
+    @contextlib.contextmanager
+    def hold(self, kind: str):
+        size = handle_estimate(kind)
+        self.acquire(kind, size)
+        try:
+            yield
+        finally:
+            self.release(kind, size)
+
+    def usage(self):
+        with self._changed:
+            return {"limit_bytes": self.limit, "used_bytes": self.used,
+                    "handles": {kind: {"open": count, "bytes": total} for kind, (count, total) in self.handles.items()}}
+
+    def _fits(self, size):
+        return self.used + size <= self.limit or self.used == 0
+
+    def _publish(self, kind):
+        count, total = self.handles[kind]
+        open_handles.set(count, kind=kind)
+        reserved_bytes.set(total, kind=kind)
+
+
+memory_budget = MemoryBudget(settings.MEMORY_BUDGET_MB * MB, settings.MEMORY_BUDGET_WAIT)
+
+
+def resident_bytes():
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        return None
+
+
+def start_tracing():
+    if settings.TRACEMALLOC_FRAMES and not tracemalloc.is_tracing():
+        tracemalloc.start(settings.TRACEMALLOC_FRAMES)
+
+
+_last_snapshot = None
+_snapshot_lock = threading.Lock()
+
+
+# Largest Python allocations by source line, or their growth since the previous snapshot
+def tracemalloc_top(limit: int, compare: bool = False):
+    global _last_snapshot
+    if not tracemalloc.is_tracing():
+        return None
+
+    snapshot = tracemalloc.take_snapshot().filter_traces([tracemalloc.Filter(False, tracemalloc.__file__)])
+    with _snapshot_lock:
+        previous, _last_snapshot = _last_snapshot, snapshot
+    if compare and previous is not None:
+        statistics = snapshot.compare_to(previous, 'lineno')
+        return [{"line": str(stat.traceback[0]), "size_bytes": stat.size, "size_diff_bytes": stat.size_diff,
+                 "count": stat.count, "count_diff": stat.count_diff} for stat in statistics[:limit]]
+    return [{"line": str(stat.traceback[0]), "size_bytes": stat.size, "count": stat.count}
+            for stat in snapshot.statistics('lineno')[:limit]]
@@ -0,0 +1,108 @@
+import functools
+import hashlib
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from core.access import read_dataset
+from core.config import settings
+from core.sdms import SdPath, get_dataset, patch_dataset
+from core.shared_cache import cache_key, get_metadata_cache, lookups
+
+
+# results are written back by one thread of their own, the request that computed them does not wait
+_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='persist')
+
+
+# SDMS regenerates the ctag on every patch, including ours, so results are versioned by the storage
+# location, the file description that the uploader writes and the generation of the stored content
+def dataset_version(dataset: dict, generation: str = '') -> str:
+    filemetadata = {key: value for key, value in (dataset.get('filemetadata') or {}).items()
+                    if key != settings.PERSISTED_METADATA_KEY}
+    described = json.dumps({'gcsurl': dataset.get('gcsurl'), 'filemetadata': filemetadata,
+                            'generation': generation}, sort_keys=True)
+    return hashlib.sha1(described.encode()).hexdigest()
+
+
+# the storage module imports this one, so it is only imported when a version is taken
+def content_version(bearer, sdpath: SdPath, dataset: dict) -> str:
+    from core.storage import DatasetObjectReader
+    generation = DatasetObjectReader(bearer, str(sdpath), dataset).content_generation()
+    return dataset_version(dataset, generation)
+
+
+def stored_results(dataset: dict, version: str) -> dict:
+    stored = (dataset.get('filemetadata') or {}).get(settings.PERSISTED_METADATA_KEY) or {}
+    if stored.get('version') != version:
+        return {}
+    return stored.get('results') or {}
+
+
+# The record is read again just before the patch, computing a result can take long enough for
+# someone else to edit it. The patch replaces the whole filemetadata block, so every other key
+# is sent back as just read, and nothing is written once the file or its description changed.
+def store_result(bearer, sdpath: SdPath, version: str, kind: str, value):
+    try:
+        current = get_dataset(bearer, sdpath)
+        if content_version(bearer, sdpath, current) != version:
+            logging.info(f"Not persisting {kind} of {sdpath}, the dataset was edited while it was computed")
+            return
+        filemetadata = dict(current.get('filemetadata') or {})
+        filemetadata[settings.PERSISTED_METADATA_KEY] = {
+            'version': version,
+            'results': dict(stored_results(current, version), **{kind: value}),
+        }
+        patch_dataset(bearer, sdpath, {'filemetadata': filemetadata})
+    except Exception as e:
+        logging.warning(f"Persisting {kind} of {sdpath} failed: {e}")
+
+
+# Serves the result of `kind` for the current version of the file from the metadata cache
+# tiers, then from the dataset record, and otherwise computes it and writes it through, the
+# write to the record in the background.
+# Any failure to read or write them, such as a caller without write access to the record,
+# only costs the optimisation. The dataset is read through the access cache, so the caller
+# is checked, and a caller denied a moment ago is not sent to SDMS again.
+# Calls with arguments beyond the sdpath select a part of the result and are only cached.
+def persisted(kind: str):
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(bearer, api_key, sdpath, *args):
+            cache = get_metadata_cache()
+            persist = settings.PERSIST_METADATA and not args
+            if not settings.SDMS_URL or not (cache or persist):
+                return fn(bearer, api_key, sdpath, *args)
+
+            version = None
+            try:
+                parsed = SdPath.parse(sdpath)
+                dataset = read_dataset(bearer, parsed)
+                version = content_version(bearer, parsed, dataset)
+                key = cache_key(kind, sdpath, version, args)
+                if cache:
+                    found, value = cache.get(key)
+                    if found:
+                        return value
+                if persist:
+                    results = stored_results(dataset, version)
+                    if kind in results:
+                        lookups.inc(tier='record')
+                        if cache:
+                            cache.put(key, results[kind])
+                        return results[kind]
+            except Exception as e:
+                logging.warning(f"Reading persisted {kind} of {sdpath} failed: {e}")
+
+            value = fn(bearer, api_key, sdpath, *args)
+            lookups.inc(tier='miss')
+            if version is not None:
+                try:
+                    if cache:
+                        cache.put(key, value)
+                except Exception as e:
+                    logging.warning(f"Caching {kind} of {sdpath} failed: {e}")
+                if persist:
+                    _writer.submit(store_result, bearer, parsed, version, kind, value)
+            return value
+        return wrapper
+    return decorator
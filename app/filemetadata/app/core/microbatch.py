@@ -0,0 +1,123 @@
+import asyncio
+import json
+import logging
+
+from core.config import settings
+from core.deadlines import DeadlineExceeded, RequestScope, current_scope, enter_scope, leave_scope
+from core.executor import run_sdk_call
+from core.metrics import registry
+from core.segy import to_styled_json
+
+batched_requests = registry.counter("filemetadata_trace_header_batched_requests_total",
+                                    "Trace header requests served from a merged read")
+merged_reads = registry.counter("filemetadata_trace_header_merged_reads_total",
+                                "Merged trace header reads issued for batched requests")
+
+
+# Cuts the traces of one request out of the trace headers of a larger range, in the
+# layout of the segysdk response for that request alone
+def slice_trace_headers(header: dict, offset: int, start_trace: int, count: int) -> dict:
+    traces = header.get("TraceData", [])[offset:offset + count]
+    metadata = dict(header.get("Metadata", {}), StartTrace=start_trace, TraceCount=len(traces))
+    return {"header": f"{to_styled_json(dict(header, Metadata=metadata, TraceData=traces))}"}
+
+
+# Sorted requests whose ranges overlap or touch, each group spanning at most max_traces
+def merge_ranges(requests, max_traces: int):
+    groups = []
+    end = None
+    for request in sorted(requests, key=lambda request: request[0]):
+        start, count, _ = request
+        if groups and start <= end and max(end, start + count) - groups[-1][0][0] <= max_traces:
+            groups[-1].append(request)
+            end = max(end, start + count)
+        else:
+            groups.append([request])
+            end = start + count
+    return groups
+
+
+# Collects trace header requests of the same reader, bearer and dataset for
+# TRACE_HEADER_BATCH_WINDOW seconds, then serves neighbouring ranges with one read each.
+# A request is read at once when no read of the dataset is running or waiting, so only
+# requests that would queue behind another one wait for the window.
+class TraceHeaderBatcher:
+    def __init__(self):
+        self._pending = {}
+        self._reading = {}
+
+    async def read(self, read, bearer, api_key, sdpath, start_trace: int, traces_to_dump: int):
+        if not settings.TRACE_HEADER_BATCH_WINDOW or start_trace < 1 or \
+                not 0 < traces_to_dump < settings.TRACE_HEADER_BATCH_MAX_TRACES:
+            return await run_sdk_call(read, bearer, api_key, sdpath, start_trace, traces_to_dump)
+
+        key = (read, bearer, api_key, sdpath)
+        if not self._reading.get(key) and key not in self._pending:
+            return await self._read(key, start_trace, traces_to_dump)
+
+        loop = asyncio.get_running_loop()
+        waiting = self._pending.get(key)
+        if waiting is None:
+            waiting = self._pending[key] = []
+            loop.call_later(settings.TRACE_HEADER_BATCH_WINDOW, lambda: asyncio.ensure_future(self._flush(key)))
+        future = loop.create_future()
+        waiting.append((start_trace, traces_to_dump, future))
+
+        # the merged read serves other requests as well and goes on when this one gives up
+        scope = current_scope()
+        remaining = scope.remaining() if scope is not None else None
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), remaining)
+        except asyncio.TimeoutError:
+            raise DeadlineExceeded()
+
+    async def _read(self, key, first, count):
+        read, bearer, api_key, sdpath = key
+        self._reading[key] = self._reading.get(key, 0) + 1
+        try:
+            return await run_sdk_call(read, bearer, api_key, sdpath, first, count)
+        finally:
+            self._reading[key] -= 1
+            if not self._reading[key]:
+                del self._reading[key]
+
+    async def _flush(self, key):
+        groups = merge_ranges(self._pending.pop(key), settings.TRACE_HEADER_BATCH_MAX_TRACES)
+        # not bound to the deadline or connection of the request that opened the batch
+        token = enter_scope(RequestScope(settings.REQUEST_DEADLINE))
+        try:
+            await asyncio.gather(*(self._read_group(key, group) for group in groups))
+        finally:
+            leave_scope(token)
+
+    async def _read_group(self, key, group):
+        if len(group) > 1:
+            first = group[0][0]
+            count = max(start + count for start, count, _ in group) - first
+            merged_reads.inc()
+            try:
+                header = json.loads((await self._read(key, first, count))["header"])
+            except Exception as e:
+                # one bad range does not fail its neighbours, they are read on their own
+                logging.info(f"Merged trace header read of {key[3]} failed, reading {len(group)} ranges apart: {e}")
+            else:
+                batched_requests.inc(len(group))
+                for start, traces, future in group:
+                    if not future.done():
+                        future.set_result(slice_trace_headers(header, start - first, start, traces))
+                return
+
+        await asyncio.gather(*(self._read_alone(key, start, traces, future) for start, traces, future in group))
+
+    async def _read_alone(self, key, start, traces, future):
+        try:
+            result = await self._read(key, start, traces)
+        except Exception as e:
+            if not future.done():
+                future.set_exception(e)
+        else:
+            if not future.done():
+                future.set_result(result)
+
+
+trace_header_batcher = TraceHeaderBatcher()
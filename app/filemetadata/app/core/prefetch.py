@@ -0,0 +1,192 @@
+import heapq
+import itertools
+import logging
+import os
+import threading
+import time
+
+from core.config import settings
+from core.executor import sdk_load
+from core.metrics import registry
+from core.sdms import SdmsError, SdPath, get_service_bearer, list_datasets
+
+# explicitly requested datasets go before those found by polling
+PRIORITY_REQUESTED = 0
+PRIORITY_POLLED = 10
+
+prefetched = registry.counter("filemetadata_prefetch_datasets_total", "Datasets prefetched by outcome")
+yielded = registry.counter("filemetadata_prefetch_yields_total", "Times prefetch waited for interactive calls")
+
+
+# Datasets waiting to be prefetched, lowest priority value first and in order of arrival
+# within a priority. A dataset is queued once, at the best priority it was asked for.
+class PrefetchQueue:
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self._heap = []
+        self._entries = {}
+        self._order = itertools.count()
+        self._changed = threading.Condition()
+
+    def __len__(self):
+        with self._changed:
+            return len(self._entries)
+
+    # False when the queue is full or the dataset is already queued at this priority or a better one
+    def put(self, sdpath: str, item, priority: int) -> bool:
+        with self._changed:
+            queued = self._entries.get(sdpath)
+            if queued is not None and queued[0] <= priority:
+                return False
+            if queued is None and len(self._entries) >= self.capacity:
+                return False
+            # the entry it replaces stays in the heap and is skipped once it comes up
+            entry = [priority, next(self._order), sdpath, item]
+            self._entries[sdpath] = entry
+            heapq.heappush(self._heap, entry)
+            self._changed.notify()
+            return True
+
+    # waits for a dataset and returns its sdpath and item, None once timeout seconds passed
+    def get(self, timeout: float = None):
+        with self._changed:
+            while True:
+                while self._heap:
+                    entry = heapq.heappop(self._heap)
+                    if self._entries.get(entry[2]) is entry:
+                        del self._entries[entry[2]]
+                        return entry[2], entry[3]
+                if not self._changed.wait(timeout):
+                    return None
+
+
+# Spaces out calls to `rate` per second, with bursts of up to `burst` calls
+class RateLimiter:
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+
+    def acquire(self):
+        while True:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+            time.sleep((1 - self._tokens) / self.rate)
+
+
+# Whether interactive calls would have to share the SDK with prefetching right now
+def interactive_busy() -> bool:
+    load = sdk_load()
+    return load["queued"] > 0 or load["in_flight"] >= settings.PREFETCH_MAX_IN_FLIGHT
+
+
+# Warms the metadata caches for datasets before the first user opens them. One background
+# thread at a lowered scheduling priority takes datasets off the queue, at most PREFETCH_RATE
+# a second, and only while the SDK threads are not busy with requests.
+class Prefetcher:
+    def __init__(self, prefetch, capacity: int = settings.PREFETCH_QUEUE_SIZE):
+        # prefetch(bearer, api_key, sdpath, kinds) reads the metadata through the caches
+        self._prefetch = prefetch
+        self.queue = PrefetchQueue(capacity)
+        self._limiter = RateLimiter(settings.PREFETCH_RATE)
+        self._lock = threading.Lock()
+        self._worker = None
+        self._poller = None
+        self._subprojects = {}
+        self.running = None
+
+    # without a bearer the dataset is read with the bearer of the service when its turn comes
+    def enqueue(self, sdpath: str, kinds, bearer, api_key, priority: int = PRIORITY_REQUESTED) -> bool:
+        self._start('_worker', self._work, 'prefetch')
+        return self.queue.put(sdpath, (kinds, bearer, api_key), priority)
+
+    def _start(self, attribute, target, name):
+        with self._lock:
+            if getattr(self, attribute) is None:
+                thread = threading.Thread(target=target, name=name, daemon=True)
+                setattr(self, attribute, thread)
+                thread.start()
+
+    def _work(self):
+        try:
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), settings.PREFETCH_NICE)
+        except (AttributeError, OSError) as e:
+            logging.info(f"Prefetch runs at normal priority: {e}")
+
+        while True:
+            sdpath, (kinds, bearer, api_key) = self.queue.get()
+            while interactive_busy():
+                yielded.inc()
+                time.sleep(settings.PREFETCH_YIELD_SECONDS)
+            self._limiter.acquire()
+            self.running = sdpath
+            try:
+                self._prefetch(bearer or get_service_bearer(), api_key, sdpath, kinds)
+                prefetched.inc(outcome='done')
+            except Exception as e:
+                prefetched.inc(outcome='failed')
+                logging.warning(f"Prefetching {sdpath} failed: {getattr(e, 'detail', e)}")
+            finally:
+                self.running = None
+
+    # Lists the datasets of the subproject every PREFETCH_POLL_INTERVAL seconds and queues those
+    # published or changed since the listing before. Watches outlive the tokens of callers, so
+    # they list and read with the bearer of the service, until the service may no longer read
+    # the subproject.
+    def watch(self, subproject: str, kinds, api_key):
+        parsed = SdPath.parse_subproject(subproject)
+        seen = self.__listing(parsed)
+        with self._lock:
+            self._subprojects[parsed.subproject_sdpath] = (parsed, kinds, api_key, seen)
+        self._start('_poller', self._poll, 'prefetch-poll')
+
+    def watched(self):
+        with self._lock:
+            return sorted(self._subprojects)
+
+    def _poll(self):
+        while True:
+            time.sleep(settings.PREFETCH_POLL_INTERVAL)
+            self.poll()
+
+    def poll(self):
+        with self._lock:
+            watched = list(self._subprojects.items())
+        for name, (parsed, kinds, api_key, seen) in watched:
+            try:
+                try:
+                    listing = self.__listing(parsed)
+                except SdmsError as se:
+                    if se.status_code != 401:
+                        raise
+                    # the service token was revoked or expired early
+                    listing = self.__listing(parsed, refresh=True)
+            except SdmsError as se:
+                if se.status_code in (401, 403):
+                    logging.warning(f"Stopped watching {name}: {se}")
+                    with self._lock:
+                        self._subprojects.pop(name, None)
+                else:
+                    logging.warning(f"Listing {name} failed: {se}")
+                continue
+            for sdpath, _ in sorted(set(listing.items()) - set(seen.items())):
+                self.enqueue(sdpath, kinds, None, api_key, PRIORITY_POLLED)
+            seen.clear()
+            seen.update(listing)
+
+    @staticmethod
+    def __listing(parsed: SdPath, refresh: bool = False):
+        bearer = get_service_bearer(refresh)
+        if bearer is None:
+            raise SdmsError(400, "Watching subprojects needs SERVICE_TOKEN_URL")
+        datasets = list_datasets(bearer, parsed)
+        return {f"{parsed.subproject_sdpath}{dataset.get('path') or '/'}{dataset['name']}":
+                dataset.get('last_modified_date') for dataset in datasets}
+
+    def status(self):
+        return {"queued": len(self.queue), "running": self.running, "watched": self.watched()}
@@ -0,0 +1,245 @@
+import collections
+import contextvars
+import functools
+import inspect
+import re
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from core.config import settings
+from core.deadlines import ClientDisconnected, DeadlineExceeded, current_scope
+from core.executor import mark_sdk_thread, sdk_load
+from core.memory import MemoryBudgetExceeded
+from core.metrics import registry
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+read_seconds = registry.histogram("filemetadata_backend_read_seconds", "Duration of remote SDK reads")
+read_errors = registry.counter("filemetadata_backend_read_errors_total", "Remote SDK reads failing on the backend")
+hedges = registry.counter("filemetadata_backend_hedged_reads_total", "Duplicate reads issued for slow reads")
+hedge_wins = registry.counter("filemetadata_backend_hedge_wins_total", "Duplicate reads finishing first")
+hedges_skipped = registry.counter("filemetadata_backend_hedges_skipped_total",
+                                  "Slow reads not duplicated because the service is busy")
+rejected = registry.counter("filemetadata_backend_rejected_reads_total", "Reads failed fast by an open circuit")
+circuit_state = registry.gauge("filemetadata_backend_circuit_open", "1 while the circuit of a backend is open")
+
+# hedged duplicates run here so that they never wait behind the reads they duplicate
+_hedge_executor = ThreadPoolExecutor(max_workers=settings.SDK_WORKER_THREADS, thread_name_prefix='hedge',
+                                     initializer=mark_sdk_thread)
+_hedges_lock = threading.Lock()
+_hedges_running = 0
+
+# how the SDKs report a backend they could not reach or that answered with a server error
+_BACKEND_MESSAGE = re.compile(r'HTTP 5[0-9][0-9]|timed? ?out|connection|network|socket', re.IGNORECASE)
+
+
+class CircuitOpenError(Exception):
+    status_code = 503
+
+    def __init__(self, backend: str, retry_after: float):
+        super().__init__(f"Reads from {backend} are failing, retry in {int(retry_after) + 1} seconds")
+        self.backend = backend
+        self.retry_after = retry_after
+
+
+# Opens when at least BREAKER_ERROR_RATE of the calls of the last BREAKER_WINDOW seconds
+# failed, fails calls fast for BREAKER_OPEN_SECONDS and then lets a single trial call through.
+# There is one per backend and tenant, as each tenant has its own storage account.
+class CircuitBreaker:
+    def __init__(self, backend: str, tenant: str = None):
+        self.backend = backend
+        self.tenant = tenant
+        self.labels = {'backend': backend, 'tenant': tenant or ''}
+        self.state = CLOSED
+        self._lock = threading.Lock()
+        self._calls = collections.deque()
+        self._opened = 0.0
+        self._trial = False
+
+    def before_call(self):
+        with self._lock:
+            if self.state == CLOSED:
+                return
+            remaining = self._opened + settings.BREAKER_OPEN_SECONDS - time.monotonic()
+            if remaining > 0 or self._trial:
+                rejected.inc(**self.labels)
+                raise CircuitOpenError(self.backend if self.tenant is None else f"{self.backend} for {self.tenant}",
+                                       max(remaining, 0))
+            self.state = HALF_OPEN
+            self._trial = True
+
+    def record(self, failed: bool):
+        now = time.monotonic()
+        with self._lock:
+            if self.state != CLOSED:
+                self._trial = False
+                if failed:
+                    self._open(now)
+                else:
+                    self.state = CLOSED
+                    self._calls.clear()
+                    circuit_state.set(0, **self.labels)
+                return
+
+            self._calls.append((now, failed))
+            while self._calls[0][0] < now - settings.BREAKER_WINDOW:
+                self._calls.popleft()
+            failures = sum(failed for _, failed in self._calls)
+            if len(self._calls) >= settings.BREAKER_MIN_CALLS and \
+                    failures >= settings.BREAKER_ERROR_RATE * len(self._calls):
+                self._open(now)
+
+    def _open(self, now):
+        self.state = OPEN
+        self._opened = now
+        circuit_state.set(1, **self.labels)
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_circuit_breaker(backend: str, tenant: str = None) -> CircuitBreaker:
+    with _breakers_lock:
+        if (backend, tenant) not in _breakers:
+            _breakers[backend, tenant] = CircuitBreaker(backend, tenant)
+        return _breakers[backend, tenant]
+
+
+# Only a backend that could not be reached, timed out or answered with a server error
+# counts. Errors the caller made, such as a missing dataset or no permission, say nothing
+# about the backend, nor do files the SDK cannot parse, deadlines of the request or running
+# out of memory or of the memory budget for native handles of this service. Routes wrap the
+# SDK errors in HTTPException, so the errors they were raised from are looked at too.
+def is_backend_failure(e: Exception) -> bool:
+    while e is not None:
+        if isinstance(e, (MemoryError, MemoryBudgetExceeded, DeadlineExceeded, ClientDisconnected,
+                          CircuitOpenError)):
+            return False
+        if isinstance(e, OSError):
+            return True
+        status_code = getattr(e, 'status_code', None)
+        if status_code is not None and status_code != 500:
+            return status_code > 500
+        if e.__cause__ is None and e.__context__ is None:
+            return bool(_BACKEND_MESSAGE.search(str(e)))
+        e = e.__cause__ or e.__context__
+    return False
+
+
+# the tenant of the sdpath argument of a read, reads of datasets of different tenants go to
+# different storage accounts
+def _tenant(signature, args, kwargs):
+    try:
+        sdpath = signature.bind_partial(*args, **kwargs).arguments.get('sdpath')
+    except TypeError:
+        return None
+    if not isinstance(sdpath, str) or not sdpath.startswith('sd://'):
+        return None
+    return sdpath[len('sd://'):].split('/')[0] or None
+
+
+def hedge_delay(backend: str):
+    observed = read_seconds.quantile(settings.HEDGE_PERCENTILE / 100.0, backend=backend)
+    return max(observed or 0.0, settings.HEDGE_MIN_DELAY)
+
+
+def _timed(backend, fn, args, kwargs):
+    started = time.monotonic()
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        read_seconds.observe(time.monotonic() - started, backend=backend)
+
+
+# A duplicate is one more read for a backend that may already be struggling, there is none
+# while calls wait for an SDK thread or HEDGE_MAX_IN_FLIGHT duplicates are running
+def _start_hedge() -> bool:
+    global _hedges_running
+    with _hedges_lock:
+        if _hedges_running >= settings.HEDGE_MAX_IN_FLIGHT or sdk_load()["queued"] > 0:
+            return False
+        _hedges_running += 1
+        return True
+
+
+def _hedge_done(future):
+    global _hedges_running
+    with _hedges_lock:
+        _hedges_running -= 1
+
+
+# reads run with the request scope of the caller, so they see its deadline and disconnect
+def _submit(backend, fn, args, kwargs):
+    return _hedge_executor.submit(contextvars.copy_context().run, _timed, backend, fn, args, kwargs)
+
+
+# Waits for the first of the futures to finish, for at most timeout seconds and no longer
+# than the request deadline. Raises DeadlineExceeded once the deadline passed.
+def _wait_within_deadline(futures, timeout=None):
+    scope = current_scope()
+    remaining = scope.remaining() if scope is not None else None
+    bounded = remaining is not None and (timeout is None or remaining < timeout)
+    done, pending = wait(futures, timeout=remaining if bounded else timeout, return_when=FIRST_COMPLETED)
+    if not done and bounded:
+        raise DeadlineExceeded()
+    return done, pending
+
+
+def _hedged(backend, fn, args, kwargs):
+    first = _submit(backend, fn, args, kwargs)
+    done, _ = _wait_within_deadline({first}, hedge_delay(backend))
+    if done:
+        return first.result()
+
+    pending = {first}
+    second = None
+    if _start_hedge():
+        hedges.inc(backend=backend)
+        second = _submit(backend, fn, args, kwargs)
+        second.add_done_callback(_hedge_done)
+        pending.add(second)
+    else:
+        hedges_skipped.inc(backend=backend)
+    error = None
+    while pending:
+        done, pending = _wait_within_deadline(pending)
+        for future in done:
+            if future.exception() is None:
+                if future is second:
+                    hedge_wins.inc(backend=backend)
+                return future.result()
+            error = future.exception()
+    raise error
+
+
+# Runs an idempotent remote read behind the circuit breaker of its backend and of the tenant
+# of its sdpath argument. With HEDGE_READS a duplicate is started when the read is slower
+# than the HEDGE_PERCENTILE of recent reads from that backend, and the first one to succeed
+# is used.
+def resilient(backend: str):
+    def decorator(fn):
+        signature = inspect.signature(fn)
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            breaker = get_circuit_breaker(backend, _tenant(signature, args, kwargs))
+            breaker.before_call()
+            try:
+                if settings.HEDGE_READS:
+                    result = _hedged(backend, fn, args, kwargs)
+                else:
+                    result = _timed(backend, fn, args, kwargs)
+            except Exception as e:
+                failed = is_backend_failure(e)
+                if failed:
+                    read_errors.inc(**breaker.labels)
+                breaker.record(failed)
+                raise
+            breaker.record(False)
+            return result
+        return wrapper
+    return decorator
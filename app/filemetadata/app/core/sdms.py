@@ -0,0 +1,123 @@
+import base64
+import json
+import threading
+import time
+
+import requests
+
+from client.sdpath import SdmsError, SdPath as BaseSdPath
+from core.config import settings
+
+# storage credentials are refreshed this many seconds before SDMS says they expire
+TOKEN_EXPIRY_MARGIN = 60
+
+session = requests.Session()
+_token_lock = threading.Lock()
+_storage_tokens = {}
+_service_token = None
+
+
+# The sdpath with the urls of the SDMS the service is configured with
+class SdPath(BaseSdPath):
+    @property
+    def subproject_url(self):
+        return f"{settings.SDMS_URL}/subproject/tenant/{self.tenant}/subproject/{self.subproject}"
+
+    @property
+    def dataset_url(self):
+        return f"{settings.SDMS_URL}/dataset/tenant/{self.tenant}/subproject/{self.subproject}/dataset/{self.name}"
+
+
+def _headers(bearer):
+    return {"Authorization": bearer}
+
+
+def _check(resp, what):
+    if resp.status_code >= 400:
+        raise SdmsError(resp.status_code, f"{what} failed with HTTP {resp.status_code}: {resp.text}")
+
+
+# SDMS answers with 403 unless the bearer is at least a viewer of the subproject
+def get_subproject(bearer, sdpath: SdPath):
+    resp = session.get(sdpath.subproject_url, headers=_headers(bearer), timeout=settings.SDMS_REQUEST_TIMEOUT)
+    _check(resp, f"Get subproject {sdpath.subproject_sdpath}")
+    return resp.json()
+
+
+# every dataset of the subproject of sdpath, with its name, path and modification time
+def list_datasets(bearer, sdpath: SdPath):
+    resp = session.get(f"{settings.SDMS_URL}/dataset/tenant/{sdpath.tenant}/subproject/{sdpath.subproject}",
+                       headers=_headers(bearer), timeout=settings.SDMS_REQUEST_TIMEOUT)
+    _check(resp, f"List datasets of {sdpath.subproject_sdpath}")
+    return resp.json()
+
+
+def get_dataset(bearer, sdpath: SdPath):
+    resp = session.get(sdpath.dataset_url, headers=_headers(bearer), params={'path': sdpath.path},
+                       timeout=settings.SDMS_REQUEST_TIMEOUT)
+    _check(resp, f"Get dataset {sdpath}")
+    return resp.json()
+
+
+def patch_dataset(bearer, sdpath: SdPath, record: dict):
+    resp = session.patch(sdpath.dataset_url, headers=_headers(bearer), params={'path': sdpath.path}, json=record,
+                         timeout=settings.SDMS_REQUEST_TIMEOUT)
+    _check(resp, f"Patch dataset {sdpath}")
+    return resp.json()
+
+
+# Bearer of the service itself from the client credentials grant, cached until shortly before it
+# expires unless refresh is asked for after a 401. None when SERVICE_TOKEN_URL is not set.
+def get_service_bearer(refresh: bool = False):
+    global _service_token
+    if not settings.SERVICE_TOKEN_URL:
+        return None
+    with _token_lock:
+        cached = _service_token
+    if cached and cached[1] > time.monotonic() and not refresh:
+        return cached[0]
+
+    resp = session.post(settings.SERVICE_TOKEN_URL, data={'grant_type': 'client_credentials',
+                                                          'client_id': settings.SERVICE_CLIENT_ID,
+                                                          'client_secret': settings.SERVICE_CLIENT_SECRET,
+                                                          'scope': settings.SERVICE_TOKEN_SCOPE},
+                        timeout=settings.SDMS_REQUEST_TIMEOUT)
+    _check(resp, "Get service token")
+    token = resp.json()
+
+    bearer = f"Bearer {token['access_token']}"
+    with _token_lock:
+        _service_token = (bearer, time.monotonic() + max(int(token.get('expires_in', 0)) - TOKEN_EXPIRY_MARGIN, 0))
+    return bearer
+
+
+# Expiry of a JWT bearer in seconds since the epoch, read without checking the signature.
+# None when the bearer is not a JWT or does not expire.
+def bearer_expiry(bearer):
+    try:
+        payload = bearer.split(' ')[-1].split('.')[1]
+        return float(json.loads(base64.urlsafe_b64decode(payload + '=' * (-len(payload) % 4)))['exp'])
+    except (AttributeError, IndexError, KeyError, TypeError, ValueError):
+        return None
+
+
+def get_storage_access_token(bearer, sdpath: SdPath):
+    key = (bearer, sdpath.tenant, sdpath.subproject)
+    with _token_lock:
+        cached = _storage_tokens.get(key)
+    if cached and cached[1] > time.monotonic():
+        return cached[0]
+
+    resp = session.get(f"{settings.SDMS_URL}/utility/gcs-access-token", headers=_headers(bearer),
+                       params={'sdpath': sdpath.subproject_sdpath, 'readonly': 'true'},
+                       timeout=settings.SDMS_REQUEST_TIMEOUT)
+    _check(resp, f"Get storage access token for {sdpath.subproject_sdpath}")
+    token = resp.json()
+
+    now = time.monotonic()
+    expires_at = now + max(int(token.get('expires_in', 0)) - TOKEN_EXPIRY_MARGIN, 0)
+    with _token_lock:
+        for expired in [k for k, v in _storage_tokens.items() if v[1] <= now]:
+            del _storage_tokens[expired]
+        _storage_tokens[key] = (token, expires_at)
+    return token
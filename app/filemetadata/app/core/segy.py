@@ -0,0 +1,349 @@
+import json
+import struct
+
+import numpy as np
+
+TEXTUAL_HEADER_SIZE = 3200
+BINARY_HEADER_SIZE = 400
+FILE_HEADER_SIZE = TEXTUAL_HEADER_SIZE + BINARY_HEADER_SIZE
+TRACE_HEADER_SIZE = 240
+CARD_SIZE = 80
+
+# (Id, Start, End) with 1-based inclusive byte positions, as reported by segysdk
+BINARY_HEADER_FIELDS = [
+    ("JobIdentificationNumber", 3201, 3204),
+    ("LineNumber", 3205, 3208),
+    ("ReelNumber", 3209, 3212),
+    ("DataTracesPerEnsemble", 3213, 3214),
+    ("NumberOfAuxillaryTracesPerEnsemble", 3215, 3216),
+    ("SampleInterval", 3217, 3218),
+    ("SampleIntervalField", 3219, 3220),
+    ("SamplesPerTrace", 3221, 3222),
+    ("SampleIntervalField", 3223, 3224),
+    ("DataSampleFormatCode", 3225, 3226),
+    ("EnsembleFold", 3227, 3228),
+    ("TraceSortingCode", 3229, 3230),
+    ("VerticalSumCode", 3231, 3232),
+    ("SweepFrequencyStart", 3233, 3234),
+    ("SweepFrequencyEnd", 3235, 3236),
+    ("SweepLength", 3237, 3238),
+    ("SweepTypeCode", 3239, 3240),
+    ("TraceNumberSweepChannel", 3241, 3242),
+    ("SweepTraceTaperLengthStart", 3243, 3244),
+    ("SweepTraceTaperLengthEnd", 3245, 3246),
+    ("TaperType", 3247, 3248),
+    ("CorrelatedDataTraces", 3249, 3250),
+    ("BinaryGainRecovered", 3251, 3252),
+    ("AmplitudeRecoveryMethod", 3253, 3254),
+    ("MeasurementSystem", 3255, 3256),
+    ("ImpulseSignalPolarity", 3257, 3258),
+    ("VibratorPolarityCode", 3259, 3260),
+]
+
+# bytes 3201-3260 hold the fields above back to back, 3501-3506 the revision,
+# fixed length trace flag and number of extended textual headers
+_BINARY_HEADER = {order: struct.Struct(order + '3i24h') for order in '><'}
+_REVISION_HEADER = {order: struct.Struct(order + 'Hhh') for order in '><'}
+_REVISION_OFFSET = 3500
+
+# bytes per sample of the sample format codes defined by SEG-Y rev 2
+SAMPLE_SIZES = {1: 4, 2: 4, 3: 2, 5: 4, 6: 8, 8: 1, 9: 8, 10: 4, 11: 2, 12: 8, 15: 3, 16: 1}
+SAMPLE_FORMATS = set(SAMPLE_SIZES)
+
+# numpy types of the sample formats that need no conversion beyond byte order,
+# 1 (IBM float) and 15 (3 byte integer) are decoded separately
+SAMPLE_DTYPES = {2: 'i4', 3: 'i2', 5: 'f4', 6: 'f8', 8: 'i1', 9: 'i8', 10: 'u4', 11: 'u2', 12: 'u8', 16: 'u1'}
+
+# (Id, Start, End) of the SEG-Y rev 1 trace header fields, 1-based inclusive byte positions
+# within the trace header. Bytes 219-224 and the unassigned bytes 233-240 are left out. The
+# ids are those of the ColumnHeaders of segysdk, fields it does not list keep their rev 1 names.
+TRACE_HEADER_FIELDS = [
+    ("TraceSequenceLine", 1, 4),
+    ("TraceSequenceFile", 5, 8),
+    ("FieldRecordNumber", 9, 12),
+    ("TraceNumberField", 13, 16),
+    ("EnergySourcePointNumber", 17, 20),
+    ("EnsembleNumber", 21, 24),
+    ("TraceNumberEnsemble", 25, 28),
+    ("TraceIdentificationCode", 29, 30),
+    ("NumberVerticallySummedTraces", 31, 32),
+    ("NumberHorizontallyStackedTraces", 33, 34),
+    ("DataUse", 35, 36),
+    ("Offset", 37, 40),
+    ("ReceiverGroupElevation", 41, 44),
+    ("SurfaceElevationAtSource", 45, 48),
+    ("SourceDepthBelowSurface", 49, 52),
+    ("DatumElevationAtReceiverGroup", 53, 56),
+    ("DatumElevationAtSource", 57, 60),
+    ("WaterDepthAtSource", 61, 64),
+    ("WaterDepthArtReceiverGroup", 65, 68),
+    ("ScalarForElevations", 69, 70),
+    ("ScalarForCoordinates", 71, 72),
+    ("SourceCoordinateX", 73, 76),
+    ("SourceCoordinateY", 77, 80),
+    ("ReceiverCoordinateX", 81, 84),
+    ("ReceiverCoordinateY", 85, 88),
+    ("CoordinateUnits", 89, 90),
+    ("WeatheringVelocity", 91, 92),
+    ("SubweatheringVelocity", 93, 94),
+    ("UpholeTimeSource", 95, 96),
+    ("UpholeTimeReceiverGroup", 97, 98),
+    ("StaticCorrectionSource", 99, 100),
+    ("StaticCorrectionReceiverGroup", 101, 102),
+    ("TotalStaticApplied", 103, 104),
+    ("HeaderToTimeBreakLagTime", 105, 106),
+    ("TimeBreakToShotLagTime", 107, 108),
+    ("ShotToRecordingLagTime", 109, 110),
+    ("MuteTimeStart", 111, 112),
+    ("MuteTimeEnd", 113, 114),
+    ("SamplesPerTrace", 115, 116),
+    ("SampleInterval", 117, 118),
+    ("GainTypeInstrument", 119, 120),
+    ("GainConstantInstrument", 121, 122),
+    ("GainInstrumentInitial", 123, 124),
+    ("Correlated", 125, 126),
+    ("SweepFrequencyStart", 127, 128),
+    ("SweepFrequencyEnd", 129, 130),
+    ("SweepLength", 131, 132),
+    ("SweepType", 133, 134),
+    ("SweepTraceTaperLengthStart", 135, 136),
+    ("SweepTraceTaperLengthEnd", 137, 138),
+    ("TaperType", 139, 140),
+    ("AliasFilterFrequency", 141, 142),
+    ("AliasFilterSlope", 143, 144),
+    ("NotchFilterFrequency", 145, 146),
+    ("NotchFilterSlope", 147, 148),
+    ("LowCutFrequency", 149, 150),
+    ("HighCutFrequency", 151, 152),
+    ("LowCutSlope", 153, 154),
+    ("HighCutSlope", 155, 156),
+    ("Year", 157, 158),
+    ("DayOfYear", 159, 160),
+    ("Hour", 161, 162),
+    ("Minute", 163, 164),
+    ("Second", 165, 166),
+    ("TimeBasisCode", 167, 168),
+    ("TraceWeightingFactor", 169, 170),
+    ("GeophoneGroupNumberOfRollSwitchP1", 171, 172),
+    ("GeophoneGroupNumberOfFirstTrace", 173, 174),
+    ("GeophoneGroupNumberOfLastTrace", 175, 176),
+    ("GapSize", 177, 178),
+    ("Overtravel", 179, 180),
+    ("CdpX", 181, 184),
+    ("CdpY", 185, 188),
+    ("InlineNumber", 189, 192),
+    ("CrosslineNumber", 193, 196),
+    ("ShotPoint", 197, 200),
+    ("ShotPointScalar", 201, 202),
+    ("TraceValueMeasurementUnit", 203, 204),
+    ("TransductionConstantMantissa", 205, 208),
+    ("TransductionConstantExponent", 209, 210),
+    ("TransductionUnits", 211, 212),
+    ("DeviceTraceIdentifier", 213, 214),
+    ("TimeScalar", 215, 216),
+    ("SourceType", 217, 218),
+    ("SourceMeasurementMantissa", 225, 228),
+    ("SourceMeasurementExponent", 229, 230),
+    ("SourceMeasurementUnit", 231, 232),
+]
+
+# 0-based offsets of the inline and crossline numbers in the trace header
+INLINE_OFFSET = 188
+CROSSLINE_OFFSET = 192
+
+_EBCDIC = np.frombuffer(bytes(range(256)).decode('cp037').encode('utf-32-le'), dtype='<u4')
+_ASCII = np.arange(256, dtype='<u4')
+_EBCDIC_SPACE = 0x40
+_ASCII_SPACE = 0x20
+
+
+def decode_textual_header(raw: bytes) -> str:
+    codes = np.frombuffer(raw, dtype=np.uint8)
+    is_ebcdic = np.count_nonzero(codes == _EBCDIC_SPACE) > np.count_nonzero(codes == _ASCII_SPACE)
+    table = _EBCDIC if is_ebcdic else _ASCII
+    return table[codes].tobytes().decode('utf-32-le')
+
+
+class SegyFileHeader:
+    def __init__(self, raw: bytes):
+        if len(raw) < FILE_HEADER_SIZE:
+            raise ValueError(f"SEG-Y file header needs {FILE_HEADER_SIZE} bytes, got {len(raw)}")
+
+        self.textual_header = decode_textual_header(raw[:TEXTUAL_HEADER_SIZE])
+        self.byte_order = self.__detect_byte_order(raw)
+        self.binary_values = _BINARY_HEADER[self.byte_order].unpack_from(raw, TEXTUAL_HEADER_SIZE)
+        self.revision_number, self.fixed_length_traces, self.extended_textual_header_count = \
+            _REVISION_HEADER[self.byte_order].unpack_from(raw, _REVISION_OFFSET)
+
+    @staticmethod
+    def __detect_byte_order(raw):
+        # the sample format code is small and non zero, byte swapped it is a multiple of 256
+        offset = TEXTUAL_HEADER_SIZE + 24
+        if struct.unpack_from('>h', raw, offset)[0] not in SAMPLE_FORMATS and \
+                struct.unpack_from('<h', raw, offset)[0] in SAMPLE_FORMATS:
+            return '<'
+        return '>'
+
+    @property
+    def revision(self):
+        # major revision in the high byte: 0x0100 is rev 1.0
+        return self.revision_number >> 8
+
+    @property
+    def samples_per_trace(self):
+        return self.binary_values[7]
+
+    @property
+    def sample_format(self):
+        return self.binary_values[9]
+
+    @property
+    def trace_size(self):
+        if self.sample_format not in SAMPLE_SIZES:
+            raise ValueError(f"Unsupported SEG-Y sample format code {self.sample_format}")
+        return TRACE_HEADER_SIZE + self.samples_per_trace * SAMPLE_SIZES[self.sample_format]
+
+    @property
+    def first_trace_offset(self):
+        if self.extended_textual_header_count < 0:
+            raise ValueError("A variable number of extended textual headers is not supported")
+        return FILE_HEADER_SIZE + self.extended_textual_header_count * TEXTUAL_HEADER_SIZE
+
+    def trace_count(self, file_size: int):
+        return (int(file_size) - self.first_trace_offset) // self.trace_size
+
+    def binary_header(self, sdpath):
+        headers = [{"End": end, "Id": name, "Start": start, "Value": float(value)}
+                   for (name, start, end), value in zip(BINARY_HEADER_FIELDS, self.binary_values)]
+        headers.append({"End": 3502, "Id": "SEGYFormatRevisionNumber", "Start": 3501,
+                        "Value": float(self.revision_number)})
+        return {"BinaryHeaders": headers, "metadata": {"Filenames": [sdpath], "SegyRevision": self.revision}}
+
+
+def read_file_header(reader) -> SegyFileHeader:
+    return SegyFileHeader(reader.read(0, FILE_HEADER_SIZE))
+
+
+def ibm_to_float32(words: np.ndarray) -> np.ndarray:
+    # sign bit, base 16 exponent biased by 64 and a 24 bit fraction
+    words = words.astype(np.uint32, copy=False)
+    exponent = ((words >> 24) & 0x7f).astype(np.int32)
+    values = np.ldexp((words & 0x00ffffff).astype(np.float64), 4 * (exponent - 64) - 24)
+    values[(words >> 31) == 1] *= -1
+    return values.astype(np.float32)
+
+
+# Converts whole traces, headers included, to a (traces, samples) float32 array
+def decode_traces(raw: bytes, file_header: SegyFileHeader) -> np.ndarray:
+    trace_size = file_header.trace_size
+    samples = np.frombuffer(raw, dtype=np.uint8).reshape(-1, trace_size)[:, TRACE_HEADER_SIZE:]
+    samples = np.ascontiguousarray(samples)
+    order = file_header.byte_order
+
+    if file_header.sample_format == 1:
+        return ibm_to_float32(samples.view(order + 'u4'))
+    if file_header.sample_format == 15:
+        triplets = samples.reshape(len(samples), -1, 3).astype(np.int32)
+        high, low = (0, 2) if order == '>' else (2, 0)
+        values = (triplets[..., high] << 16) | (triplets[..., 1] << 8) | triplets[..., low]
+        return np.where(values >= 1 << 23, values - (1 << 24), values).astype(np.float32)
+    return samples.view(order + SAMPLE_DTYPES[file_header.sample_format]).astype(np.float32)
+
+
+# Structured view of the headers of whole traces, one signed integer column per field
+def trace_header_dtype(file_header: SegyFileHeader) -> np.dtype:
+    return np.dtype({
+        'names': [name for name, _, _ in TRACE_HEADER_FIELDS],
+        'formats': [file_header.byte_order + ('i4' if end - start == 3 else 'i2')
+                    for _, start, end in TRACE_HEADER_FIELDS],
+        'offsets': [start - 1 for _, start, _ in TRACE_HEADER_FIELDS],
+        'itemsize': file_header.trace_size,
+    })
+
+
+def read_trace_key(reader, file_header: SegyFileHeader, index: int):
+    offset = file_header.first_trace_offset + index * file_header.trace_size + INLINE_OFFSET
+    return struct.unpack(file_header.byte_order + 'ii', reader.read(offset, 8))
+
+
+# Finds the 0-based first trace and the number of traces of an inline, or of a single
+# inline and crossline, with binary searches over trace headers. The file has to be
+# sorted by inline and then crossline as most post stack SEG-Y files are.
+def find_traces(reader, file_header: SegyFileHeader, trace_count: int, inline: int, crossline: int = None):
+    low_key = (inline, -2 ** 31 if crossline is None else crossline)
+    high_key = (inline, 2 ** 31 if crossline is None else crossline)
+    first = _bisect(trace_count, lambda index: read_trace_key(reader, file_header, index) < low_key)
+    end = _bisect(trace_count, lambda index: read_trace_key(reader, file_header, index) <= high_key, first)
+    return first, end - first
+
+
+def _bisect(count, is_before, low=0):
+    high = count
+    while low < high:
+        middle = (low + high) // 2
+        if is_before(middle):
+            low = middle + 1
+        else:
+            high = middle
+    return low
+
+
+# Serialises like the jsoncpp StreamWriterBuilder used by segysdk: tab indentation,
+# sorted keys, every non empty array on multiple lines and a trailing new line.
+def to_styled_json(value) -> str:
+    out = []
+    _write_styled(value, out, '', True)
+    out.append('\n')
+    return ''.join(out)
+
+
+# to_styled_json(value) split around the items of the top level list value[key], so that
+# a long list can be written one item at a time: head, styled_json_item(item, i) ..., tail.
+# The list needs at least one item, an empty one is written "[]" by to_styled_json.
+def styled_json_around(value, key):
+    marker = '\x00items\x00'
+    text = to_styled_json(dict(value, **{key: [marker]}))
+    head, tail = text.split('\n\t\t' + json.dumps(marker))
+    return head, tail
+
+
+def styled_json_item(item, index: int) -> str:
+    out = [('' if index == 0 else ',') + '\n\t\t']
+    _write_styled(item, out, '\t\t', True)
+    return ''.join(out)
+
+
+def _write_styled(value, out, indent, indented):
+    if isinstance(value, dict):
+        if not value:
+            out.append('{}')
+            return
+        out.append('{' if indented else '\n' + indent + '{')
+        child_indent = indent + '\t'
+        for i, key in enumerate(sorted(value)):
+            out.append(('' if i == 0 else ',') + '\n' + child_indent + json.dumps(key) + ' : ')
+            _write_styled(value[key], out, child_indent, False)
+        out.append('\n' + indent + '}')
+    elif isinstance(value, (list, tuple)):
+        if not value:
+            out.append('[]')
+            return
+        out.append('[' if indented else '\n' + indent + '[')
+        child_indent = indent + '\t'
+        for i, item in enumerate(value):
+            out.append(('' if i == 0 else ',') + '\n' + child_indent)
+            _write_styled(item, out, child_indent, True)
+        out.append('\n' + indent + ']')
+    else:
+        out.append(_styled_scalar(value))
+
+
+def _styled_scalar(value):
+    if isinstance(value, bool) or value is None:
+        return json.dumps(value)
+    if isinstance(value, float):
+        text = '%.17g' % value
+        return text if any(c in text for c in '.en') else text + '.0'
+    if isinstance(value, int):
+        return str(value)
+    return json.dumps(value)
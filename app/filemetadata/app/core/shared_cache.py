@@ -0,0 +1,104 @@
+import hashlib
+import json
+import logging
+import threading
+import zlib
+
+from core.config import settings
+from core.lru import LruCache
+from core.metrics import registry
+
+# bumped whenever the layout of cached results changes, older entries are then never read
+FORMAT_VERSION = 1
+
+lookups = registry.counter("filemetadata_metadata_cache_lookups_total",
+                           "Metadata lookups by the tier that answered them, miss when computed")
+
+
+def cache_key(kind: str, sdpath: str, version: str, args=()) -> str:
+    described = json.dumps([sdpath, version, list(args)], separators=(',', ':'))
+    return f"filemetadata:v{FORMAT_VERSION}:{kind}:{hashlib.sha1(described.encode()).hexdigest()}"
+
+
+def encode(value) -> bytes:
+    return zlib.compress(json.dumps(value, separators=(',', ':')).encode())
+
+
+def decode(data: bytes):
+    return json.loads(zlib.decompress(data))
+
+
+# Bundled stand-in for a shared cache, also the near tier in front of one
+class LocalCacheBackend(LruCache):
+    def set(self, key: str, data: bytes, ttl: float):
+        self.put(key, data, ttl)
+
+
+# Redis, or anything speaking its protocol. An unreachable server only costs the hits.
+class RedisCacheBackend:
+    def __init__(self, url: str):
+        import redis
+        self._client = redis.Redis.from_url(url, socket_timeout=settings.SHARED_CACHE_TIMEOUT,
+                                            socket_connect_timeout=settings.SHARED_CACHE_TIMEOUT)
+
+    def get(self, key: str):
+        try:
+            return self._client.get(key)
+        except Exception as e:
+            logging.warning(f"Shared cache read failed: {e}")
+            return None
+
+    def set(self, key: str, data: bytes, ttl: float):
+        try:
+            self._client.set(key, data, ex=max(int(ttl), 1))
+        except Exception as e:
+            logging.warning(f"Shared cache write failed: {e}")
+
+
+# A small near tier in each replica in front of the far tier all replicas share
+class TieredCache:
+    def __init__(self, near: LocalCacheBackend, far):
+        self.near = near
+        self.far = far
+
+    def get(self, key: str):
+        data = self.near.get(key)
+        if data is not None:
+            lookups.inc(tier='near')
+            return True, decode(data)
+
+        data = self.far.get(key)
+        if data is not None:
+            lookups.inc(tier='far')
+            self.near.set(key, data, settings.NEAR_CACHE_TTL)
+            return True, decode(data)
+        return False, None
+
+    def put(self, key: str, value):
+        data = encode(value)
+        self.near.set(key, data, settings.NEAR_CACHE_TTL)
+        self.far.set(key, data, settings.SHARED_CACHE_TTL)
+
+
+def create_backend(url: str):
+    if url.startswith('memory://'):
+        return LocalCacheBackend(settings.SHARED_CACHE_SIZE)
+    if url.startswith(('redis://', 'rediss://', 'unix://')):
+        return RedisCacheBackend(url)
+    raise ValueError(f"Unsupported SHARED_CACHE_URL {url}")
+
+
+_metadata_cache = None
+_metadata_cache_lock = threading.Lock()
+
+
+# None unless SHARED_CACHE_URL is set
+def get_metadata_cache():
+    global _metadata_cache
+    if not settings.SHARED_CACHE_URL:
+        return None
+    with _metadata_cache_lock:
+        if _metadata_cache is None:
+            _metadata_cache = TieredCache(LocalCacheBackend(settings.NEAR_CACHE_SIZE),
+                                          create_backend(settings.SHARED_CACHE_URL))
+        return _metadata_cache
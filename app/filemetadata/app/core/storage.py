@@ -0,0 +1,176 @@
+import re
+from urllib.parse import urlsplit, urlunsplit
+
+from core import sdms
+from core.block_cache import BlockCache, get_block_cache
+from core.config import settings
+from core.metadata_store import dataset_version
+
+GCS_URL = "https://storage.googleapis.com"
+
+CONTENT_RANGE = re.compile(r'bytes (?:\d+-\d+|\*)/(\d+)')
+
+
+class StorageError(Exception):
+    def __init__(self, status_code: int, message: str):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+# Reads byte ranges of a dataset straight from the storage objects behind it
+class DatasetObjectReader:
+    def __init__(self, bearer, sdpath: str, dataset: dict = None):
+        self.sdpath = sdms.SdPath.parse(sdpath)
+        dataset = dataset or sdms.get_dataset(bearer, self.sdpath)
+        filemetadata = dataset.get('filemetadata') or {}
+
+        self.gcsurl = dataset['gcsurl']
+        self.generation = dataset.get('ctag', '')
+        self.version = dataset_version(dataset)
+        self.nobjects = int(filemetadata.get('nobjects', 1))
+        self.size = filemetadata.get('size')
+        self._object_sizes = {}
+
+        self._bearer = bearer
+        self._token = None
+        self._refresh_credentials()
+
+    # SDMS hands out new storage credentials shortly before the old ones expire, reads of long
+    # jobs outlive them. The bearer they are asked for with is not refreshed here.
+    def _refresh_credentials(self):
+        token = sdms.get_storage_access_token(self._bearer, self.sdpath)
+        if token is self._token:
+            return
+        token_type = token.get('token_type', '').lower()
+        if token_type == 'sasurl':
+            self._storage_url = urlsplit(token['access_token'])
+            self._auth_headers = {}
+        elif token_type == 'bearer':
+            self._storage_url = urlsplit(GCS_URL)
+            self._auth_headers = {'Authorization': f"Bearer {token['access_token']}"}
+        else:
+            raise StorageError(501, f"Unsupported storage credentials type {token.get('token_type')}")
+        self._token = token
+
+    def object_url(self, index: int):
+        url = self._storage_url
+        return urlunsplit((url.scheme, url.netloc, f"/{self.gcsurl}/{index}", url.query, ''))
+
+    # The ETag of the first storage object. Objects are written whole and every rewrite of a file
+    # writes its first object, so the ETag changes whenever the content does.
+    def content_generation(self) -> str:
+        self._refresh_credentials()
+        resp = sdms.session.head(self.object_url(0), headers=self._auth_headers, timeout=settings.SDMS_REQUEST_TIMEOUT)
+        if resp.status_code != 200:
+            raise StorageError(resp.status_code, f"Head of {self.sdpath} failed with HTTP {resp.status_code}")
+        return resp.headers.get('ETag', '')
+
+    def read(self, offset: int, length: int) -> bytes:
+        chunks = []
+        start = 0
+        index = 0
+        while length > 0 and index < self.nobjects:
+            size = self._object_sizes.get(index)
+            if size is None or offset < start + size:
+                data, size = self._read_object(index, offset - start, length)
+                self._object_sizes[index] = size
+                chunks.append(data)
+                offset += len(data)
+                length -= len(data)
+            start += size
+            index += 1
+
+        if length > 0:
+            raise StorageError(416, f"Range ends {length} bytes past the end of {self.sdpath}")
+        return b''.join(chunks)
+
+    def _read_object(self, index, offset, length):
+        self._refresh_credentials()
+        headers = dict(self._auth_headers, Range=f"bytes={offset}-{offset + length - 1}")
+        resp = sdms.session.get(self.object_url(index), headers=headers, timeout=settings.SDMS_REQUEST_TIMEOUT)
+
+        matched = CONTENT_RANGE.match(resp.headers.get('Content-Range', ''))
+        if resp.status_code == 206 and matched:
+            return resp.content, int(matched.group(1))
+        if resp.status_code == 200:
+            # the storage ignored the range and sent the whole object
+            return resp.content[offset:offset + length], len(resp.content)
+        if resp.status_code == 416 and matched:
+            return b'', int(matched.group(1))
+
+        raise StorageError(resp.status_code,
+                           f"Read of {self.sdpath} object {index} failed with HTTP {resp.status_code}")
+
+
+# Splits reads into cache blocks keyed by sdpath, dataset generation and block index,
+# fetching each run of missing blocks with a single read of the underlying reader.
+class CachedDatasetReader:
+    def __init__(self, reader, cache: BlockCache):
+        self.reader = reader
+        self.cache = cache
+        self.sdpath = reader.sdpath
+        self.size = reader.size
+
+    def __getattr__(self, name):
+        return getattr(self.reader, name)
+
+    # The ETag of the first storage object. Objects are written whole and every rewrite of a file
+    # writes its first object, so the ETag changes whenever the content does.
+    def content_generation(self) -> str:
+        self._refresh_credentials()
+        resp = sdms.session.head(self.object_url(0), headers=self._auth_headers, timeout=settings.SDMS_REQUEST_TIMEOUT)
+        if resp.status_code != 200:
+            raise StorageError(resp.status_code, f"Head of {self.sdpath} failed with HTTP {resp.status_code}")
+        return resp.headers.get('ETag', '')
+
+    def read(self, offset: int, length: int) -> bytes:
+        if self.size is None:
+            return self.reader.read(offset, length)
+
+        block_size = self.cache.block_size
+        first = offset // block_size
+        last = (offset + length - 1) // block_size
+        blocks = {}
+        missing = []
+        for index in range(first, last + 1):
+            data = self.cache.get(self._key(index))
+            if data is None:
+                missing.append(index)
+            else:
+                blocks[index] = data
+
+        for run in _runs(missing):
+            start = run[0] * block_size
+            end = min((run[-1] + 1) * block_size, int(self.size))
+            data = self.reader.read(start, end - start)
+            for index in run:
+                block = data[(index - run[0]) * block_size:(index - run[0] + 1) * block_size]
+                self.cache.put(self._key(index), block)
+                blocks[index] = block
+
+        joined = b''.join(blocks[index] for index in range(first, last + 1))
+        skip = offset - first * block_size
+        data = joined[skip:skip + length]
+        if len(data) < length:
+            raise StorageError(416, f"Range ends {length - len(data)} bytes past the end of {self.sdpath}")
+        return data
+
+    def _key(self, index):
+        return BlockCache.make_key(self.sdpath, self.reader.generation, index)
+
+
+def _runs(indices):
+    run = []
+    for index in indices:
+        if run and index != run[-1] + 1:
+            yield run
+            run = []
+        run.append(index)
+    if run:
+        yield run
+
+
+def open_dataset_reader(bearer, sdpath: str):
+    reader = DatasetObjectReader(bearer, sdpath)
+    cache = get_block_cache()
+    return CachedDatasetReader(reader, cache) if cache else reader
@@ -1,7 +1,11 @@
 import logging
+import os
+import tempfile
 
 import requests
 
+from client.transfer import BlobTransfer
+
 
 class StorageClient:
 
@@ -38,14 +42,15 @@ class StorageClient:
 
     @staticmethod
     def store_blob(url, file):
-        headers = {'Content-Type': 'application/octet-stream', 'x-ms-blob-type': 'BlockBlob'}
-        resp = requests.put(url=url, data=file, headers=headers)
+        with BlobTransfer() as transfer:
+            uploaded = transfer.upload(url, file)
 
-        resp.raise_for_status()
+        logging.info(f"stored blob size = {uploaded['size']} md5 = {uploaded['md5']}")
 
     @staticmethod
     def get_blob(url):
-        resp = requests.get(url=url)
-        resp.raise_for_status()
-
-        return resp.content
+        with tempfile.TemporaryDirectory() as directory, BlobTransfer() as transfer:
+            path = os.path.join(directory, 'blob')
+            transfer.download(url, path)
+            with open(path, 'rb') as blob:
+                return blob.read()
@@ -8,9 +8,15 @@ from fastapi.staticfiles import StaticFiles
 from starlette.exceptions import HTTPException
 
 from api.errors.http_error import http_error_handler
+from api.errors.service_error import circuit_open_error_handler, request_abandoned_error_handler
 from api.errors.validation_error import http422_error_handler
+from api.middleware.deadline import DeadlineMiddleware
 from api.routes.base import api_router
 from core.config import settings
+from core.deadlines import ClientDisconnected, DeadlineExceeded
+from core.log import start_logging, stop_logging
+from core.memory import MemoryBudgetExceeded, start_tracing
+from core.resilience import CircuitOpenError
 
 def start_application():
     application = FastAPI(title=settings.PROJECT_TITLE, version=settings.PROJECT_VERSION,
@@ -18,6 +24,10 @@ def start_application():
 
     application.add_exception_handler(HTTPException, http_error_handler)
     application.add_exception_handler(RequestValidationError, http422_error_handler)
+    application.add_exception_handler(CircuitOpenError, circuit_open_error_handler)
+    application.add_exception_handler(MemoryBudgetExceeded, circuit_open_error_handler)
+    application.add_exception_handler(DeadlineExceeded, request_abandoned_error_handler)
+    application.add_exception_handler(ClientDisconnected, request_abandoned_error_handler)
 
     application.include_router(api_router)
     application.mount(settings.API_PATH + "static", StaticFiles(directory="static"), name="static")
@@ -26,6 +36,7 @@ def start_application():
         CORSMiddleware,
         expose_headers=["Content-Security-Policy"]
     )
+    application.add_middleware(DeadlineMiddleware)
 
     return application
 
@@ -33,6 +44,37 @@ def start_application():
 app = start_application()
 
 
+@app.on_event("startup")
+async def start_log_thread():
+    start_logging()
+    start_tracing()
+
+
+@app.on_event("shutdown")
+async def stop_log_thread():
+    stop_logging()
+
+
+@app.on_event("startup")
+async def sweep_conversion_spill():
+    if settings.CONVERSION_SPILL_PATH:
+        from core.conversion import sweep_spill
+        sweep_spill(settings.CONVERSION_SPILL_PATH, settings.CONVERSION_SPILL_MAX_AGE)
+
+
+@app.on_event("startup")
+async def start_grpc_server():
+    if settings.GRPC_PORT:
+        from rpc.server import start_server
+        app.state.grpc_server = await start_server(settings.GRPC_PORT)
+
+
+@app.on_event("shutdown")
+async def stop_grpc_server():
+    if getattr(app.state, 'grpc_server', None):
+        await app.state.grpc_server.stop(grace=5)
+
+
 @app.get(settings.API_PATH + "swagger-ui.html", include_in_schema=False)
 async def custom_swagger_ui_html():
     return get_swagger_ui_html(
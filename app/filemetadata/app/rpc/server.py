@@ -0,0 +1,177 @@
+import json
+import logging
+
+import grpc
+from fastapi import HTTPException
+
+from api.routes import route_openzgy, route_segy
+from core.access import revoke_on_denial
+from core.config import settings
+from core.deadlines import ClientDisconnected, DeadlineExceeded, RequestScope, enter_scope, leave_scope
+from core.executor import run_sdk_call
+from core.memory import MemoryBudgetExceeded
+from core.resilience import CircuitOpenError
+from rpc import filemetadata_pb2 as pb
+from rpc import filemetadata_pb2_grpc
+
+# gRPC status of the HTTP status codes the routes raise
+STATUS_CODES = {
+    400: grpc.StatusCode.INVALID_ARGUMENT,
+    401: grpc.StatusCode.UNAUTHENTICATED,
+    403: grpc.StatusCode.PERMISSION_DENIED,
+    404: grpc.StatusCode.NOT_FOUND,
+    416: grpc.StatusCode.OUT_OF_RANGE,
+    499: grpc.StatusCode.CANCELLED,
+    501: grpc.StatusCode.UNIMPLEMENTED,
+    503: grpc.StatusCode.UNAVAILABLE,
+    504: grpc.StatusCode.DEADLINE_EXCEEDED,
+}
+
+
+def _points(points):
+    return [pb.Point(x=point[0], y=point[1]) for point in points]
+
+
+def zgy_headers_message(headers: dict) -> pb.ZgyHeaders:
+    message = pb.ZgyHeaders()
+    scalars = {'Guid': 'guid', 'DataType': 'data_type', 'ZUnitDimension': 'z_unit_dimension',
+               'ZUnitName': 'z_unit_name', 'ZUnitFactor': 'z_unit_factor', 'ZStart': 'z_start',
+               'ZIncrement': 'z_increment', 'XYUnitDimension': 'xy_unit_dimension', 'XYUnitName': 'xy_unit_name',
+               'XYUnitFactor': 'xy_unit_factor', 'InlineStart': 'inline_start', 'InlineIncrement': 'inline_increment',
+               'CrosslineStart': 'crossline_start', 'CrosslineIncrement': 'crossline_increment',
+               'AmountOfLevelsOfDetail': 'levels_of_detail'}
+    for field, attribute in scalars.items():
+        if field in headers:
+            setattr(message, attribute, headers[field])
+    for field, attribute in (('Size', 'size'), ('BrickSize', 'brick_size'), ('DataRange', 'data_range')):
+        getattr(message, attribute).extend(headers.get(field, []))
+    for field, attribute in (('WorldCorners', 'world_corners'), ('IndexCorners', 'index_corners'),
+                             ('AnnotationCorners', 'annotation_corners')):
+        getattr(message, attribute).extend(_points(headers.get(field, [])))
+    message.bricks_per_level_of_detail.extend(pb.BrickCount(bricks=bricks)
+                                              for bricks in headers.get('BricksPerLevelsOfDetail', []))
+    if 'Statistics' in headers:
+        statistics = headers['Statistics']
+        message.statistics.CopyFrom(pb.ZgyStatistics(count=statistics['Count'], sum=statistics['Sum'],
+                                                     sum_of_squares=statistics['SumOfSquares'],
+                                                     minimum=statistics['Minimum'], maximum=statistics['Maximum']))
+    if 'Histogram' in headers:
+        histogram = headers['Histogram']
+        message.histogram.CopyFrom(pb.ZgyHistogram(count=histogram['Count'], minimum=histogram['Minimum'],
+                                                   maximum=histogram['Maximum'], bins=histogram.get('Bins', [])))
+    return message
+
+
+def zgy_bingrid_message(bingrid: dict) -> pb.ZgyBinGrid:
+    return pb.ZgyBinGrid(
+        origin_i=bingrid['P6BinGridOriginI'], origin_j=bingrid['P6BinGridOriginJ'],
+        origin_easting=bingrid['P6BinGridOriginEasting'], origin_northing=bingrid['P6BinGridOriginNorthing'],
+        node_increment_on_i_axis=bingrid['P6BinNodeIncrementOnIaxis'],
+        node_increment_on_j_axis=bingrid['P6BinNodeIncrementOnJaxis'],
+        bin_width_on_i_axis=bingrid['P6BinWidthOnIaxis'], bin_width_on_j_axis=bingrid['P6BinWidthOnJaxis'],
+        transformation_method=bingrid['P6TransformationMethod'],
+        map_grid_bearing_of_bin_grid_j_axis=bingrid['P6MapGridBearingOfBinGridJaxis'],
+        bin_grid_local_coordinates=[pb.Point(x=point['X'], y=point['Y'])
+                                    for point in bingrid['BinGridLocalCoordinates']])
+
+
+def segy_binary_header_message(header: dict) -> pb.SegyBinaryHeader:
+    return pb.SegyBinaryHeader(
+        fields=[pb.HeaderField(id=field['Id'], start=field['Start'], end=field['End'], value=field['Value'])
+                for field in header['BinaryHeaders']],
+        segy_revision=header['metadata']['SegyRevision'])
+
+
+def trace_header_chunk_message(header: dict, first: bool) -> pb.TraceHeaderChunk:
+    columns = [pb.ColumnHeader(id=column['Id'], start=column['Start'], end=column['End'])
+               for column in header['Metadata']['ColumnHeaders']] if first else []
+    return pb.TraceHeaderChunk(columns=columns,
+                               traces=[pb.TraceHeader(trace_no=trace['TraceNo'], values=trace['Traces'])
+                                       for trace in header.get('TraceData', [])])
+
+
+# Serves the same read functions as the REST routes, so sessions, caches, persisted
+# results, circuit breakers and deadlines are shared between both interfaces
+class FileMetadataServicer(filemetadata_pb2_grpc.FileMetadataServicer):
+
+    async def _call(self, context, fn, sdpath, *args):
+        metadata = dict(context.invocation_metadata())
+        bearer = metadata.get('authorization')
+        if not bearer:
+            await context.abort(grpc.StatusCode.UNAUTHENTICATED, "The authorization metadata is required")
+
+        token = enter_scope(RequestScope(context.time_remaining() or settings.REQUEST_DEADLINE))
+        try:
+            return await run_sdk_call(fn, bearer, metadata.get('appkey', 'DEFAULT_API_KEY'), sdpath, *args)
+        except HTTPException as he:
+            revoke_on_denial(bearer, sdpath, he.status_code)
+            await context.abort(STATUS_CODES.get(he.status_code, grpc.StatusCode.INTERNAL), str(he.detail))
+        except (CircuitOpenError, MemoryBudgetExceeded, DeadlineExceeded, ClientDisconnected) as se:
+            await context.abort(STATUS_CODES[se.status_code], str(se))
+        finally:
+            leave_scope(token)
+
+    async def GetSegyRevision(self, request, context):
+        return pb.IntValue(value=await self._call(context, route_segy.read_revision, request.sdpath))
+
+    async def GetSegyIs3D(self, request, context):
+        return pb.BoolValue(value=await self._call(context, route_segy.read_is_3d, request.sdpath))
+
+    async def GetSegyTraceHeaderFieldCount(self, request, context):
+        return pb.IntValue(value=await self._call(context, route_segy.read_trace_header_field_count,
+                                                  request.sdpath))
+
+    async def GetSegyTextualHeader(self, request, context):
+        header = await self._call(context, route_segy.read_textual_header, request.sdpath)
+        return pb.TextValue(value=header['header'])
+
+    async def GetSegyBinaryHeader(self, request, context):
+        header = await self._call(context, route_segy.read_binary_header_values, request.sdpath)
+        return segy_binary_header_message(header)
+
+    async def StreamSegyTraceHeaders(self, request, context):
+        if request.start_trace < 1 or request.traces_to_dump < 1:
+            await context.abort(grpc.StatusCode.INVALID_ARGUMENT, "start_trace and traces_to_dump must be positive")
+        read = route_segy.read_scaled_trace_headers if request.scaled else route_segy.read_raw_trace_headers
+
+        done = 0
+        while done < request.traces_to_dump:
+            count = min(settings.JOB_TRACES_PER_CHUNK, request.traces_to_dump - done)
+            header = await self._call(context, read, request.sdpath, request.start_trace + done, count)
+            chunk = json.loads(header['header'])
+            yield trace_header_chunk_message(chunk, done == 0)
+            done += count
+            if len(chunk.get('TraceData', [])) < count:
+                return
+
+    async def GetZgyHeaders(self, request, context):
+        fields = list(request.fields) or None
+        if fields:
+            try:
+                route_openzgy.parse_header_fields(','.join(fields))
+            except HTTPException as he:
+                await context.abort(grpc.StatusCode.INVALID_ARGUMENT, str(he.detail))
+        if fields is None and not request.exclude_histogram_bins:
+            headers = await self._call(context, route_openzgy.read_header_values, request.sdpath)
+        else:
+            headers = await self._call(context, route_openzgy.read_header_values, request.sdpath, fields,
+                                       not request.exclude_histogram_bins)
+        return zgy_headers_message(headers)
+
+    async def GetZgyBinGrid(self, request, context):
+        bingrid = await self._call(context, route_openzgy.read_bingrid_values, request.sdpath)
+        return zgy_bingrid_message(bingrid)
+
+
+async def start_server(port: int):
+    server = grpc.aio.server(options=[('grpc.max_send_message_length', 64 * 1024 * 1024)])
+    filemetadata_pb2_grpc.add_FileMetadataServicer_to_server(FileMetadataServicer(), server)
+    if settings.GRPC_TLS_CERT_FILE:
+        with open(settings.GRPC_TLS_KEY_FILE, 'rb') as key, open(settings.GRPC_TLS_CERT_FILE, 'rb') as cert:
+            credentials = grpc.ssl_server_credentials([(key.read(), cert.read())])
+        server.add_secure_port(f"[::]:{port}", credentials)
+    else:
+        server.add_insecure_port(f"[::]:{port}")
+    await server.start()
+    logging.info(f"gRPC server listening on port {port}{' with TLS' if settings.GRPC_TLS_CERT_FILE else ''}")
+    return server
@@ -0,0 +1,96 @@
+import re
+import time
+import unittest
+from unittest import mock
+
+import requests_mock
+
+from core import access
+from core.access import AccessCache, authorize, read_dataset, revoke_on_denial
+from core.config import settings
+from core.sdms import SdPath, SdmsError
+
+SDMS_URL = "https://sdms.unit-tests.com/api/v3"
+DATASET_URL = re.compile(re.escape(SDMS_URL + "/dataset/tenant/opendes/subproject/test/dataset/"))
+
+
+class AccessTest(unittest.TestCase):
+
+    def setUp(self):
+        patcher = mock.patch.object(settings, 'SDMS_URL', SDMS_URL)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        cache = mock.patch.object(access, 'access_cache', AccessCache(100, 60, 5))
+        cache.start()
+        self.addCleanup(cache.stop)
+
+    def test_grant_is_cached(self):
+        with requests_mock.Mocker() as mocker:
+            mocker.get(DATASET_URL, json={'name': 'a.zgy'})
+            authorize('Bearer token', 'sd://opendes/test/a.zgy')
+            authorize('Bearer token', 'sd://opendes/test/a.zgy')
+            assert mocker.call_count == 1
+            assert mocker.last_request.path.endswith('/dataset/a.zgy')
+
+            # other datasets of the subproject and other tokens are checked on their own
+            authorize('Bearer token', 'sd://opendes/test/folder/a.zgy')
+            assert mocker.last_request.qs['path'] == ['/folder/']
+            authorize('Bearer other', 'sd://opendes/test/a.zgy')
+            assert mocker.call_count == 3
+
+    def test_denial_is_cached_for_a_shorter_time(self):
+        with requests_mock.Mocker() as mocker:
+            mocker.get(DATASET_URL, status_code=403, text='forbidden')
+            with self.assertRaises(SdmsError) as raised:
+                authorize('Bearer token', 'sd://opendes/test/a.zgy')
+            assert raised.exception.status_code == 403
+            with self.assertRaises(SdmsError):
+                authorize('Bearer token', 'sd://opendes/test/a.zgy')
+            assert mocker.call_count == 1
+
+            with mock.patch('time.monotonic', return_value=time.monotonic() + 6), self.assertRaises(SdmsError):
+                authorize('Bearer token', 'sd://opendes/test/a.zgy')
+            assert mocker.call_count == 2
+
+    def test_dataset_reads_share_the_decisions(self):
+        sdpath = SdPath.parse('sd://opendes/test/a.zgy')
+        with requests_mock.Mocker() as mocker:
+            mocker.get(DATASET_URL, json={'name': 'a.zgy'})
+            assert read_dataset('Bearer token', sdpath) == {'name': 'a.zgy'}
+            authorize('Bearer token', 'sd://opendes/test/a.zgy')
+            assert mocker.call_count == 1
+
+            mocker.get(DATASET_URL, status_code=403, text='forbidden')
+            with self.assertRaises(SdmsError):
+                read_dataset('Bearer other', sdpath)
+            with self.assertRaises(SdmsError):
+                read_dataset('Bearer other', sdpath)
+            assert mocker.call_count == 2
+
+    def test_other_failures_are_not_cached(self):
+        with requests_mock.Mocker() as mocker:
+            mocker.get(DATASET_URL, status_code=502, text='bad gateway')
+            for _ in range(2):
+                with self.assertRaises(SdmsError):
+                    authorize('Bearer token', 'sd://opendes/test/a.zgy')
+            assert mocker.call_count == 2
+
+    def test_denial_revokes_grant(self):
+        with requests_mock.Mocker() as mocker:
+            mocker.get(DATASET_URL, json={'name': 'test'})
+            authorize('Bearer token', 'sd://opendes/test/a.zgy')
+            revoke_on_denial('Bearer token', 'sd://opendes/test/a.zgy', 404)
+            authorize('Bearer token', 'sd://opendes/test/a.zgy')
+            assert mocker.call_count == 1
+
+            revoke_on_denial('Bearer token', 'sd://opendes/test/a.zgy', 403)
+            authorize('Bearer token', 'sd://opendes/test/a.zgy')
+            assert mocker.call_count == 2
+
+    def test_tokens_are_hashed(self):
+        key = AccessCache.make_key('Bearer token', SdPath.parse('sd://opendes/test/a.zgy'))
+        assert 'Bearer token' not in key and key[1:] == ('opendes', 'test', '/', 'a.zgy')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+import os
+import tempfile
+import unittest
+
+from core.block_cache import BlockCache
+from core.storage import CachedDatasetReader, StorageError
+
+CONTENT = bytes(range(256)) * 10
+
+
+class FakeReader:
+
+    def __init__(self, content, generation='ctag1'):
+        self.sdpath = 'sd://opendes/test/example.sgy'
+        self.size = len(content)
+        self.generation = generation
+        self.content = content
+        self.reads = []
+
+    def read(self, offset, length):
+        self.reads.append((offset, length))
+        return self.content[offset:offset + length]
+
+
+class BlockCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, 'blocks.cache')
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_put_get(self):
+        cache = BlockCache(self.path, 4 * 100, 100)
+        key = BlockCache.make_key('sd://a/b/c', 'ctag', 0)
+        assert cache.get(key) is None
+        cache.put(key, b'abc')
+        assert cache.get(key) == b'abc'
+        assert (cache.hits, cache.misses) == (1, 1)
+
+    def test_shared_between_instances(self):
+        key = BlockCache.make_key('sd://a/b/c', 'ctag', 0)
+        BlockCache(self.path, 4 * 100, 100).put(key, b'shared')
+        assert BlockCache(self.path, 4 * 100, 100).get(key) == b'shared'
+
+    def test_other_layout_starts_empty(self):
+        key = BlockCache.make_key('sd://a/b/c', 'ctag', 0)
+        BlockCache(self.path, 4 * 100, 100).put(key, b'old')
+        assert BlockCache(self.path, 8 * 100, 100).get(key) is None
+
+    def test_least_recently_used_block_is_evicted(self):
+        cache = BlockCache(self.path, 2 * 100, 100)
+        first, second, third = (BlockCache.make_key('sd://a/b/c', 'ctag', i) for i in range(3))
+        cache.put(first, b'1')
+        cache.put(second, b'2')
+        cache.get(first)
+        cache.put(third, b'3')
+        assert cache.get(first) == b'1'
+        assert cache.get(second) is None
+        assert cache.get(third) == b'3'
+
+    def test_corrupted_block_is_dropped(self):
+        cache = BlockCache(self.path, 2 * 100, 100)
+        key = BlockCache.make_key('sd://a/b/c', 'ctag', 0)
+        cache.put(key, b'good data')
+        cache._mm[cache._offset(cache._find(key))] = ord('X')
+        assert cache.get(key) is None
+        assert cache._find(key) is None
+
+    def test_cached_reader(self):
+        cache = BlockCache(self.path, 64 * 100, 100)
+        reader = FakeReader(CONTENT)
+        cached = CachedDatasetReader(reader, cache)
+
+        assert cached.read(50, 300) == CONTENT[50:350]
+        assert reader.reads == [(0, 400)]
+        assert cached.read(120, 200) == CONTENT[120:320]
+        assert cached.read(2500, 60) == CONTENT[2500:2560]
+        assert reader.reads == [(0, 400), (2500, 60)]
+        with self.assertRaises(StorageError):
+            cached.read(2550, 20)
+
+    def test_new_generation_is_not_served_stale_blocks(self):
+        cache = BlockCache(self.path, 64 * 100, 100)
+        CachedDatasetReader(FakeReader(CONTENT), cache).read(0, 100)
+
+        reader = FakeReader(CONTENT[::-1], generation='ctag2')
+        assert CachedDatasetReader(reader, cache).read(0, 100) == CONTENT[::-1][:100]
+        assert reader.reads == [(0, 100)]
@@ -0,0 +1,94 @@
+import unittest
+
+import numpy as np
+
+from core.bricks import bilinear_neighbours, densify_polyline, gather_samples, plan_bricks, \
+    polyline_position_count, read_section
+
+
+class MemoryZgyReader:
+
+    def __init__(self, data, bricksize=(4, 4, 4)):
+        self.data = data
+        self.size = data.shape
+        self.bricksize = bricksize
+        self.reads = []
+
+    def read(self, start, buffer, lod=0):
+        self.reads.append((start, buffer.shape, lod))
+        region = tuple(slice(s, s + n) for s, n in zip(start, buffer.shape))
+        # levels of detail decimated instead of low pass filtered
+        buffer[...] = self.data[::1 << lod, ::1 << lod, ::1 << lod][region]
+
+
+def make_volume(size=(10, 12, 5)):
+    # every sample holds 100 * inline + crossline, so interpolated traces are easy to predict
+    i, j, _ = np.meshgrid(*(np.arange(n) for n in size), indexing='ij')
+    return (100 * i + j).astype(np.float32)
+
+
+class BricksTest(unittest.TestCase):
+
+    def test_densify_polyline(self):
+        positions = densify_polyline([[0, 0], [3, 0], [3, 2]])
+        assert positions.tolist() == [[0, 0], [1, 0], [2, 0], [3, 0], [3, 1], [3, 2]]
+        assert polyline_position_count([[0, 0], [3, 0], [3, 2]]) == len(positions)
+        assert polyline_position_count([[0, 0], [1e15, 1e15]]) > 1e15
+        # a rounding error past a whole number of traces adds none
+        assert polyline_position_count([[0, 0], [3, 4 + 1e-12]]) == 6
+        with self.assertRaises(ValueError):
+            polyline_position_count([[0, 0], [float('inf'), 0]])
+
+    def test_neighbour_weights(self):
+        rows, inlines, crosslines, weights = bilinear_neighbours([[1.25, 2.5], [9, 11], [-1, 0]], (10, 12, 5))
+        assert sorted(set(rows.tolist())) == [0, 1]
+        for row in (0, 1):
+            assert np.isclose(weights[rows == row].sum(), 1)
+        # the last trace is reached from the one below it
+        assert inlines[rows == 1].max() == 9 and inlines[rows == 1].min() == 8
+
+    def test_rounding_errors_stay_on_the_edge(self):
+        rows, inlines, crosslines, weights = bilinear_neighbours([[-1e-14, 0], [9, 11 + 1e-12]], (10, 12, 5))
+        assert sorted(set(rows.tolist())) == [0, 1]
+        assert inlines.min() == 0 and crosslines.max() == 11
+
+    def test_brick_columns(self):
+        plan = plan_bricks((np.array([0, 3, 4, 9]), np.array([0, 1, 0, 5])), (4, 4, 4))
+        assert {key: selection.tolist() for key, selection in plan.items()} == \
+            {(0, 0): [0, 1], (1, 0): [2], (2, 1): [3]}
+
+    def test_section(self):
+        reader = MemoryZgyReader(make_volume())
+        section = read_section(reader, densify_polyline([[0.5, 0], [0.5, 10]]), 1, 3)
+        assert section.shape == (11, 3)
+        assert np.allclose(section[:, 0], 50 + np.arange(11))
+        # one read per brick column the line touches
+        assert len(reader.reads) == 3
+        assert all(shape[2] == 3 and start[2] == 1 for start, shape, _ in reader.reads)
+
+    def test_positions_outside_are_nan(self):
+        section = read_section(MemoryZgyReader(make_volume()), np.array([[2.0, 2.0], [20.0, 2.0]]), 0, 5)
+        assert np.allclose(section[0], 202)
+        assert np.isnan(section[1]).all()
+
+    def test_gather(self):
+        volume = make_volume((10, 12, 10)) + np.arange(10, dtype=np.float32)
+        reader = MemoryZgyReader(volume)
+        positions = [[2, 3, 3.5], [2.4, 3, 1.25], [9, 11, 9], [0, 0, 10.5], [6, 7, 4]]
+        samples = gather_samples(reader, positions)
+        assert np.allclose(samples[[0, 1, 2, 4]], [206.5, 204.25, 920, 611])
+        assert np.isnan(samples[3])
+        # z 3.5 reaches into the next brick with the extra sample, so each brick is read once
+        assert len(reader.reads) == 3
+
+    def test_gather_level_of_detail(self):
+        reader = MemoryZgyReader(make_volume((5, 6, 5)))
+        samples = gather_samples(reader, [[4, 4, 0], [4, 6, 0]], lod=1)
+        assert np.allclose(samples[0], 404)
+        # crossline 6 is past the 3 crosslines of the first level of detail
+        assert np.isnan(samples[1])
+        assert reader.reads[0][2] == 1
+
+
+if __name__ == '__main__':
+    unittest.main()
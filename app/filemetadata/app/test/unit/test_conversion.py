@@ -0,0 +1,155 @@
+import sys
+from unittest.mock import Mock, MagicMock
+
+sys.modules['openzgycpp'] = Mock()
+
+import base64
+import json
+import os
+import struct
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from core.conversion import convert_segy_to_zgy, sweep_spill, BearerExpired, BlockSpill, SegyGeometry, BRICK_SIZE
+from core.sdms import bearer_expiry
+from core.segy import SegyFileHeader
+from unit.test_segy import make_file_header, make_trace, MemoryReader
+
+INLINES = 70
+CROSSLINES = 3
+
+
+def make_segy():
+    traces = []
+    for inline in range(INLINES):
+        for crossline in range(CROSSLINES):
+            trace = bytearray(make_trace(100 + 2 * inline, 10 + crossline, [inline, crossline]))
+            struct.pack_into('>h', trace, 70, -10)
+            struct.pack_into('>ii', trace, 180, 1000 * inline, 500 * crossline)
+            traces.append(bytes(trace))
+    return make_file_header(sample_format=5, samples_per_trace=2) + b''.join(traces)
+
+
+def make_bearer(expiry):
+    claims = base64.urlsafe_b64encode(json.dumps({'exp': expiry}).encode()).decode().rstrip('=')
+    return f"Bearer header.{claims}.signature"
+
+
+class DatasetReader(MemoryReader):
+
+    def __init__(self, content):
+        super().__init__(content)
+        self.sdpath = 'sd://opendes/test/example.sgy'
+        self.generation = 'ctag1'
+
+
+class ConversionTest(unittest.TestCase):
+
+    def setUp(self):
+        self.reader = DatasetReader(make_segy())
+        self.dir = tempfile.TemporaryDirectory()
+        patchers = [mock.patch('core.conversion.open_dataset_reader', return_value=self.reader),
+                    mock.patch('core.conversion.settings.CONVERSION_SPILL_PATH', self.dir.name)]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_geometry(self):
+        geometry = SegyGeometry(self.reader, SegyFileHeader(self.reader.content))
+        assert (geometry.inlines, geometry.crosslines, geometry.samples) == (INLINES, CROSSLINES, 2)
+        assert geometry.annotstart == (100, 10)
+        assert geometry.annotinc == (2, 1)
+        assert geometry.corners[3] == (100.0 * (INLINES - 1), 100.0)
+
+    def test_convert(self):
+        writer = MagicMock()
+        writer.__enter__.return_value = writer
+        with mock.patch('core.conversion.zgy.ZgyWriter', return_value=writer) as zgy_writer:
+            result = convert_segy_to_zgy(Mock(), 'Bearer token', 'key', self.reader.sdpath, 'sd://opendes/test/a.zgy')
+
+        assert result['size'] == [INLINES, CROSSLINES, 2]
+        assert zgy_writer.call_args.kwargs['size'] == (INLINES, CROSSLINES, 2)
+        writes = {call.args[0]: call.args[1] for call in writer.write.call_args_list}
+        assert sorted(writes) == [(0, 0, 0), (BRICK_SIZE, 0, 0)]
+        assert writes[(BRICK_SIZE, 0, 0)].shape == (INLINES - BRICK_SIZE, CROSSLINES, 2)
+        assert writes[(BRICK_SIZE, 0, 0)][1, 2].tolist() == [BRICK_SIZE + 1, 2]
+        writer.finalize.assert_called_once()
+        assert os.listdir(self.dir.name) == []
+
+    def test_failed_run_resumes_from_spilled_blocks(self):
+        writer = MagicMock()
+        writer.__enter__.return_value = writer
+        writer.write.side_effect = [None, IOError("lost connection")]
+        with mock.patch('core.conversion.zgy.ZgyWriter', return_value=writer), self.assertRaises(IOError):
+            convert_segy_to_zgy(Mock(), 'Bearer token', 'key', self.reader.sdpath, 'sd://opendes/test/a.zgy')
+
+        spill = BlockSpill(self.dir.name, self.reader.sdpath, self.reader.generation)
+        assert spill.load(0, 0).shape == (BRICK_SIZE, CROSSLINES, 2)
+
+        writer.write.side_effect = None
+        with mock.patch('core.conversion.read_block') as read_block, \
+                mock.patch('core.conversion.zgy.ZgyWriter', return_value=writer):
+            convert_segy_to_zgy(Mock(), 'Bearer token', 'key', self.reader.sdpath, 'sd://opendes/test/a.zgy')
+        read_block.assert_not_called()
+
+
+class SpillTest(unittest.TestCase):
+
+    def setUp(self):
+        self.reader = DatasetReader(make_segy())
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+        patchers = [mock.patch('core.conversion.open_dataset_reader', return_value=self.reader),
+                    mock.patch('core.conversion.settings.CONVERSION_SPILL_PATH', self.dir.name)]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.writer = MagicMock()
+        self.writer.__enter__.return_value = self.writer
+
+    def convert(self, bearer='Bearer token'):
+        with mock.patch('core.conversion.zgy.ZgyWriter', return_value=self.writer):
+            return convert_segy_to_zgy(Mock(), bearer, 'key', self.reader.sdpath, 'sd://opendes/test/a.zgy')
+
+    def test_failure_another_run_would_meet_removes_the_blocks(self):
+        self.writer.write.side_effect = [None, ValueError("bad sample")]
+        with self.assertRaises(ValueError):
+            self.convert()
+        assert os.listdir(self.dir.name) == []
+
+    def test_expiring_bearer_stops_the_conversion(self):
+        expiry = time.time() + 60
+        with self.assertRaises(BearerExpired):
+            self.convert(make_bearer(expiry))
+        self.writer.write.assert_not_called()
+
+        # the bearer runs out between two brick columns
+        with mock.patch('core.conversion.time.time', side_effect=[expiry - 1000, expiry - 1000, expiry - 10,
+                                                                  expiry - 10]), \
+                self.assertRaises(BearerExpired) as raised:
+            self.convert(make_bearer(expiry))
+        assert f"{BRICK_SIZE * CROSSLINES} of {INLINES * CROSSLINES} traces were converted" in str(raised.exception)
+        assert self.writer.write.call_count == 1
+        spill = BlockSpill(self.dir.name, self.reader.sdpath, self.reader.generation)
+        assert spill.load(0, 0) is not None
+
+    def test_bearer_expiry(self):
+        assert bearer_expiry(make_bearer(1234)) == 1234
+        assert bearer_expiry('Bearer opaque') is None
+        assert bearer_expiry(None) is None
+
+    def test_sweep(self):
+        stale, recent = (os.path.join(self.dir.name, name) for name in ('stale', 'recent'))
+        for path in (stale, recent):
+            os.makedirs(path)
+        os.utime(stale, (time.time() - 7200, time.time() - 7200))
+        sweep_spill(self.dir.name, 3600)
+        assert os.listdir(self.dir.name) == ['recent']
+        sweep_spill(os.path.join(self.dir.name, 'missing'), 3600)
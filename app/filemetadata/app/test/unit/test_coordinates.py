@@ -0,0 +1,56 @@
+import unittest
+from unittest.mock import Mock
+
+import numpy as np
+
+from core.coordinates import BinGridTransform, CoordinateSystem, TransformCache
+
+INDEX_CORNERS = [(0, 0), (99, 0), (0, 49), (99, 49)]
+ANNOT_CORNERS = [(1000, 2000), (1198, 2000), (1000, 2049), (1198, 2049)]
+# 12.5 m bins rotated by 30 degrees from an origin at (400000, 6500000)
+ANGLE = np.radians(30)
+AXES = np.array([[np.cos(ANGLE), np.sin(ANGLE)], [-np.sin(ANGLE), np.cos(ANGLE)]]) * 12.5
+WORLD_CORNERS = [tuple(np.array([400000.0, 6500000.0]) + np.array(corner) @ AXES) for corner in INDEX_CORNERS]
+
+
+class BinGridTransformTest(unittest.TestCase):
+
+    def setUp(self):
+        self.transform = BinGridTransform(INDEX_CORNERS, ANNOT_CORNERS, WORLD_CORNERS)
+
+    def test_corners_map_onto_each_other(self):
+        annotation = self.transform.transform(ANNOT_CORNERS, CoordinateSystem.annotation, CoordinateSystem.world)
+        assert np.allclose(annotation, WORLD_CORNERS)
+        index = self.transform.transform(WORLD_CORNERS, CoordinateSystem.world, CoordinateSystem.index)
+        assert np.allclose(index, INDEX_CORNERS)
+
+    def test_interior_points(self):
+        points = self.transform.transform([(1100, 2010), (1002, 2001)], CoordinateSystem.annotation,
+                                          CoordinateSystem.index)
+        assert np.allclose(points, [(50, 10), (1, 1)])
+
+    def test_round_trip_of_many_points(self):
+        points = np.random.default_rng(1).uniform(0, 100, (100000, 2))
+        world = self.transform.transform(points, CoordinateSystem.index, CoordinateSystem.world)
+        back = self.transform.transform(world, CoordinateSystem.world, CoordinateSystem.index)
+        assert np.allclose(back, points)
+
+
+class TransformCacheTest(unittest.TestCase):
+
+    def test_loaded_once_and_evicted(self):
+        cache = TransformCache(2, 60)
+        load = Mock(side_effect=lambda: object())
+        first = cache.get('a', load)
+        assert cache.get('a', load) is first
+        cache.get('b', load)
+        cache.get('c', load)
+        assert cache.get('a', load) is not first
+        assert load.call_count == 4
+
+    def test_expired(self):
+        cache = TransformCache(2, 0)
+        load = Mock(side_effect=lambda: object())
+        cache.get('a', load)
+        cache.get('a', load)
+        assert load.call_count == 2
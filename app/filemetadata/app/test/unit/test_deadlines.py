@@ -0,0 +1,130 @@
+import asyncio
+import threading
+import time
+import unittest
+
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+
+from api.errors.service_error import request_abandoned_error_handler
+from api.middleware.deadline import DeadlineMiddleware, route_deadline
+from core.config import settings
+from core.deadlines import DeadlineExceeded, RequestScope, check_deadline, enter_scope, leave_scope
+from core.executor import run_sdk_call
+
+app = FastAPI()
+app.add_exception_handler(DeadlineExceeded, request_abandoned_error_handler)
+app.add_middleware(DeadlineMiddleware)
+client = TestClient(app)
+
+calls = []
+release = threading.Event()
+
+
+def slow_read(chunks):
+    for chunk in range(chunks):
+        check_deadline()
+        calls.append(chunk)
+        time.sleep(0.05)
+    return len(calls)
+
+
+@app.get("/slow")
+async def slow(chunks: int):
+    return await run_sdk_call(slow_read, chunks)
+
+
+@app.post("/echo")
+async def echo(request: Request):
+    return {"length": len(await request.body())}
+
+
+class DeadlineTest(unittest.TestCase):
+
+    def setUp(self):
+        calls.clear()
+
+    def test_within_deadline(self):
+        response = client.get("/slow?chunks=2", headers={"X-Request-Timeout": "5"})
+        assert response.status_code == 200
+        assert response.json() == 2
+
+    def test_deadline_exceeded(self):
+        response = client.get("/slow?chunks=100", headers={"X-Request-Timeout": "0.1"})
+        assert response.status_code == 504
+        # the worker stops at the next chunk boundary
+        time.sleep(0.1)
+        assert len(calls) < 10
+
+    def test_expired_work_never_starts(self):
+        response = client.get("/slow?chunks=1", headers={"X-Request-Timeout": "0"})
+        assert response.status_code == 504
+        time.sleep(0.05)
+        assert calls == []
+
+    def test_timeout_must_be_finite(self):
+        for value in ("nan", "inf", "-inf", "soon"):
+            response = client.get("/slow?chunks=1", headers={"X-Request-Timeout": value})
+            assert response.status_code == 400
+        assert calls == []
+
+    def test_gives_up_when_the_wait_times_out(self):
+        # the wait can end a moment before the clock of the scope reaches the deadline
+        scope = RequestScope(60)
+        scope.remaining = lambda: 0.01
+        finished = threading.Event()
+
+        async def call():
+            token = enter_scope(scope)
+            try:
+                return await run_sdk_call(finished.wait, 5)
+            finally:
+                leave_scope(token)
+
+        started = time.monotonic()
+        try:
+            with self.assertRaises(DeadlineExceeded):
+                asyncio.run(call())
+            assert time.monotonic() - started < 4
+        finally:
+            finished.set()
+
+    def test_request_body_is_replayed(self):
+        response = client.post("/echo", data=b"x" * 100000)
+        assert response.json() == {"length": 100000}
+
+    def test_request_body_is_passed_through(self):
+        chunks = [{'type': 'http.request', 'body': b'x' * 10, 'more_body': True},
+                  {'type': 'http.request', 'body': b'y' * 10, 'more_body': True},
+                  {'type': 'http.request', 'body': b'z' * 10, 'more_body': False}]
+        read = []
+
+        async def receive():
+            if chunks:
+                read.append(chunks[0])
+                return chunks.pop(0)
+            await asyncio.Event().wait()
+
+        # how many messages the middleware had read each time the route asked for the next one
+        asked = []
+
+        async def route(scope, receive, send):
+            while True:
+                asked.append(len(read))
+                if not (await receive())['more_body']:
+                    return
+
+        asyncio.run(DeadlineMiddleware(route)({'type': 'http', 'path': '/echo', 'headers': []}, receive, None))
+        assert asked == [1, 1, 2]
+        assert len(read) == 3
+
+    def test_route_defaults(self):
+        assert route_deadline(settings.API_PATH + "segy/revision") == settings.REQUEST_DEADLINE
+        assert route_deadline(settings.API_PATH + "segy/traces") == settings.STREAMING_REQUEST_DEADLINE
+        assert route_deadline(settings.API_PATH + "jobs/abc") is None
+
+    def test_disconnected_scope(self):
+        scope = RequestScope(None)
+        assert not scope.expired
+        scope.mark_disconnected()
+        assert scope.expired
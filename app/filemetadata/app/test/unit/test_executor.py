@@ -0,0 +1,56 @@
+import asyncio
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+from core.deadlines import DeadlineExceeded, RequestScope, enter_scope, leave_scope
+from core.executor import run_sdk_call, sdk_load
+
+
+class SdkLoadTest(unittest.TestCase):
+
+    def test_expired_call_is_not_counted(self):
+        calls = []
+
+        async def call():
+            token = enter_scope(RequestScope(0))
+            try:
+                return await run_sdk_call(calls.append, 1)
+            finally:
+                leave_scope(token)
+
+        with self.assertRaises(DeadlineExceeded):
+            asyncio.run(call())
+        time.sleep(0.05)
+        assert calls == []
+        # the dropped call does not count as queued
+        assert sdk_load()["queued"] == 0
+        assert sdk_load()["in_flight"] == 0
+
+    def test_running_and_waiting_calls(self):
+        release = threading.Event()
+
+        async def calls():
+            return await asyncio.gather(*(run_sdk_call(release.wait, 5) for _ in range(3)))
+
+        with mock.patch('core.executor._executor', ThreadPoolExecutor(max_workers=2)):
+            thread = threading.Thread(target=lambda: asyncio.run(calls()))
+            thread.start()
+            try:
+                for _ in range(100):
+                    if sdk_load()["in_flight"] == 2:
+                        break
+                    time.sleep(0.01)
+                load = sdk_load()
+                assert (load["in_flight"], load["queued"]) == (2, 1)
+                assert load["queue_delay_seconds"] >= 0
+            finally:
+                release.set()
+                thread.join()
+        assert (sdk_load()["in_flight"], sdk_load()["queued"]) == (0, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
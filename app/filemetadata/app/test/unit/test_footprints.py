@@ -0,0 +1,164 @@
+import sys
+from unittest.mock import Mock
+
+sys.modules['segysdk'] = Mock()
+sys.modules['openzgycpp'] = Mock()
+
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+from api.routes.route_footprints import router
+from core.config import Settings
+from core.footprints import FootprintIndex
+from core.sdms import SdmsError
+from unit.util import apply_test_settings
+
+client = TestClient(router)
+TEST_HEADERS = {
+    'appkey': 'xvz1evFS4wEEPTGEFPHBog',
+    'Authorization': 'Bearer unit-tests',
+}
+
+# ZGY corner order: origin, last inline, last crossline, opposite corner
+SQUARE = [(0, 0), (10, 0), (0, 10), (10, 10)]
+ROTATED = [(20, 10), (30, 20), (10, 20), (20, 30)]
+
+
+class FootprintIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.index = FootprintIndex()
+        self.index.update('sd://opendes/a/square.zgy', SQUARE)
+        self.index.update('sd://opendes/b/rotated.zgy', ROTATED)
+
+    def test_point(self):
+        assert self.index.query([(5, 5)]) == ['sd://opendes/a/square.zgy']
+        assert self.index.query([(10, 10)]) == ['sd://opendes/a/square.zgy']
+        # inside the bounding box of the rotated footprint but outside the footprint
+        assert self.index.query([(12, 12)]) == []
+        assert self.index.query([(20, 20)]) == ['sd://opendes/b/rotated.zgy']
+
+    def test_polygon(self):
+        assert self.index.query([(8, 8), (25, 8), (25, 12), (8, 12)]) == ['sd://opendes/a/square.zgy',
+                                                                          'sd://opendes/b/rotated.zgy']
+        # edges cross without any corner inside the other polygon
+        assert self.index.query([(-5, 4), (15, 4), (15, 6), (-5, 6)]) == ['sd://opendes/a/square.zgy']
+        # a query polygon inside a footprint
+        assert self.index.query([(1, 1), (2, 1), (2, 2)]) == ['sd://opendes/a/square.zgy']
+
+    def test_prefix(self):
+        assert self.index.query([(8, 8), (25, 8), (25, 12), (8, 12)], 'sd://opendes/b/') == \
+            ['sd://opendes/b/rotated.zgy']
+
+    def test_update_and_remove(self):
+        self.index.update('sd://opendes/a/square.zgy', [(100, 100), (110, 100), (100, 110), (110, 110)])
+        assert self.index.query([(5, 5)]) == []
+        self.index.remove('sd://opendes/b/rotated.zgy')
+        assert self.index.query([(20, 20)]) == []
+        assert len(self.index) == 1
+
+    def test_persisted(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'footprints.json')
+            index = FootprintIndex(path)
+            index.update('sd://opendes/a/square.zgy', SQUARE)
+            index.update('sd://opendes/b/rotated.zgy', ROTATED)
+            assert FootprintIndex(path).query([(20, 20)]) == []
+            index.flush()
+            assert FootprintIndex(path).query([(5, 5)]) == ['sd://opendes/a/square.zgy']
+
+    def test_many_volumes(self):
+        index = FootprintIndex()
+        for i in range(2000):
+            index.update(f'sd://opendes/a/{i:05d}.zgy', [(x + i * 5, y) for x, y in SQUARE])
+        assert index.query([(12, 5)]) == ['sd://opendes/a/00001.zgy', 'sd://opendes/a/00002.zgy']
+
+    def test_remove_keeps_the_other_rows(self):
+        index = FootprintIndex()
+        for i in range(40):
+            index.update(f'sd://opendes/a/{i:05d}.zgy', [(x + i * 20, y) for x, y in SQUARE])
+        for i in range(0, 40, 3):
+            index.remove(f'sd://opendes/a/{i:05d}.zgy')
+        for i in range(40):
+            expected = [] if i % 3 == 0 else [f'sd://opendes/a/{i:05d}.zgy']
+            assert index.query([(i * 20 + 5, 5)]) == expected
+
+    def test_replicas_share_the_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'footprints.json')
+            first, second = FootprintIndex(path), FootprintIndex(path)
+            first.update('sd://opendes/a/square.zgy', SQUARE)
+            second.update('sd://opendes/b/rotated.zgy', ROTATED)
+            # the second replica writes over the file without losing the volume of the first
+            assert FootprintIndex(path).query([(8, 8), (25, 8), (25, 12), (8, 12)]) == \
+                ['sd://opendes/a/square.zgy', 'sd://opendes/b/rotated.zgy']
+            second.remove('sd://opendes/a/square.zgy')
+            second.flush()
+            assert FootprintIndex(path).query([(5, 5)]) == []
+            with mock.patch('core.footprints.SAVE_INTERVAL', 0):
+                assert first.query([(5, 5)]) == []
+                assert first.query([(20, 20)]) == ['sd://opendes/b/rotated.zgy']
+
+
+class RouteFootprintsTest(unittest.TestCase):
+
+    def setUp(self):
+        apply_test_settings()
+        self.url = Settings.BASE_URL + Settings.API_PATH + "footprints/query"
+        self.index = FootprintIndex()
+        for name in ('a', 'b', 'c'):
+            self.index.update(f'sd://opendes/test/{name}.zgy', SQUARE)
+        self.patch = mock.patch('api.routes.route_footprints.get_footprint_index', return_value=self.index)
+        self.patch.start()
+
+    def tearDown(self):
+        self.patch.stop()
+
+    def test_prefix_names_a_tenant(self):
+        for prefix in ('', 'sd://', 'sd://opendes'):
+            with self.assertRaises(HTTPException) as context:
+                client.post(self.url, json={'point': [5, 5], 'prefix': prefix}, headers=TEST_HEADERS)
+            assert context.exception.status_code == 400
+
+    def test_limit(self):
+        resp = client.post(self.url, json={'point': [5, 5], 'prefix': 'sd://opendes/', 'limit': 2},
+                           headers=TEST_HEADERS)
+        assert resp.json() == {'sdpaths': ['sd://opendes/test/a.zgy', 'sd://opendes/test/b.zgy'], 'truncated': True}
+        with mock.patch('api.routes.route_footprints.settings.FOOTPRINT_QUERY_MAX_RESULTS', 1):
+            resp = client.post(self.url, json={'point': [5, 5], 'prefix': 'sd://opendes/'}, headers=TEST_HEADERS)
+        assert resp.json()['sdpaths'] == ['sd://opendes/test/a.zgy']
+
+    def test_deleted_volumes_leave_the_index(self):
+        def authorize(bearer, sdpath):
+            if sdpath.endswith('a.zgy'):
+                raise SdmsError(404, "Dataset not found")
+            if sdpath.endswith('b.zgy'):
+                raise SdmsError(403, "No read access")
+
+        with mock.patch('api.routes.route_footprints.settings.SDMS_URL', 'https://sdms.unit-tests.com/api/v3'), \
+                mock.patch('api.routes.route_footprints.authorize', side_effect=authorize):
+            resp = client.post(self.url, json={'point': [5, 5], 'prefix': 'sd://opendes/'}, headers=TEST_HEADERS)
+        assert resp.json() == {'sdpaths': ['sd://opendes/test/c.zgy'], 'truncated': False}
+        assert self.index.query([(5, 5)]) == ['sd://opendes/test/b.zgy', 'sd://opendes/test/c.zgy']
+
+    def test_subprojects_are_checked_apart(self):
+        for sdpath in ('sd://opendes/other/d.zgy', 'sd://opendes/other/e.zgy'):
+            self.index.update(sdpath, SQUARE)
+        checked = []
+
+        def authorize(bearer, sdpath):
+            checked.append(sdpath)
+            if '/test/' in sdpath:
+                raise SdmsError(403, "No read access")
+
+        with mock.patch('api.routes.route_footprints.settings.SDMS_URL', 'https://sdms.unit-tests.com/api/v3'), \
+                mock.patch('api.routes.route_footprints.authorize', side_effect=authorize):
+            resp = client.post(self.url, json={'point': [5, 5], 'prefix': 'sd://opendes/', 'limit': 1},
+                               headers=TEST_HEADERS)
+        assert resp.json() == {'sdpaths': ['sd://opendes/other/d.zgy'], 'truncated': True}
+        # the second subproject stopped after its first readable volume
+        assert 'sd://opendes/other/e.zgy' not in checked
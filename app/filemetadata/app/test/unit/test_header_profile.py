@@ -0,0 +1,112 @@
+import struct
+import unittest
+from concurrent.futures import Future
+from unittest import mock
+
+import numpy as np
+
+from core.config import settings
+from core.header_profile import SKETCH_SIZE, FieldProfile, distinct_estimate, profile_dataset
+from core.segy import SegyFileHeader
+from unit.test_segy import MemoryReader, make_file_header, make_trace
+
+
+# runs submitted work at once and counts the chunks submitted but not merged yet
+class CountingExecutor:
+    def __init__(self):
+        self.submitted = 0
+        self.pending = 0
+        self.most_pending = 0
+
+    def submit(self, fn, *args):
+        self.submitted += 1
+        self.pending += 1
+        self.most_pending = max(self.most_pending, self.pending)
+        future = Future()
+        future.set_result(fn(*args))
+        return CountedFuture(self, future)
+
+
+class CountedFuture:
+    def __init__(self, executor, future):
+        self.executor = executor
+        self.future = future
+
+    def result(self):
+        self.executor.pending -= 1
+        return self.future.result()
+
+    def cancel(self):
+        return self.future.cancel()
+
+
+def make_survey(inlines, crosslines, byte_order='>'):
+    traces = []
+    for inline in inlines:
+        for crossline in crosslines:
+            trace = bytearray(make_trace(inline, crossline, [0.0], byte_order))
+            # CdpX and CdpY, with every location repeated on the last inline
+            struct.pack_into(byte_order + 'ii', trace, 180, crossline * 25, min(inline, inlines[-2]) * 25)
+            # SourceGroupScalar
+            struct.pack_into(byte_order + 'h', trace, 70, -100)
+            traces.append(bytes(trace))
+    return make_file_header(byte_order=byte_order, sample_format=5, samples_per_trace=1) + b''.join(traces)
+
+
+class HeaderProfileTest(unittest.TestCase):
+
+    def profile(self, content, chunk_bytes=settings.TRACE_READ_CHUNK_BYTES):
+        file_header = SegyFileHeader(content)
+        reader = MemoryReader(content)
+        with mock.patch.object(settings, 'TRACE_READ_CHUNK_BYTES', chunk_bytes):
+            return profile_dataset(reader, file_header, file_header.trace_count(reader.size)).to_json("sd://a/b/c")
+
+    def test_fields(self):
+        profile = self.profile(make_survey(range(100, 110), range(20, 30)))
+        fields = {field['Id']: field for field in profile['Fields']}
+        assert profile['TraceCount'] == 100
+
+        assert (fields['InlineNumber']['Min'], fields['InlineNumber']['Max']) == (100, 109)
+        assert fields['InlineNumber']['AscendingRuns'] == 1
+        assert fields['InlineNumber']['DistinctEstimate'] == 10
+        assert fields['CrosslineNumber']['AscendingRuns'] == 10
+        assert fields['ScalarForCoordinates']['Constant'] and not fields['ScalarForCoordinates']['Zero']
+        assert fields['ScalarForCoordinates']['Min'] == -100
+        assert fields['Offset']['Zero'] and fields['Offset']['Constant']
+        assert profile['DistinctCdpLocations'] == 90
+
+    def test_chunks_merge_to_the_same_profile(self):
+        content = make_survey(range(100, 110), range(20, 30), '<')
+        trace_size = SegyFileHeader(content).trace_size
+        assert self.profile(content, 7 * trace_size) == self.profile(content)
+
+    def test_chunks_read_ahead_are_bounded(self):
+        content = make_survey(range(100, 110), range(20, 30))
+        file_header = SegyFileHeader(content)
+        executor = CountingExecutor()
+        with mock.patch.multiple(settings, TRACE_READ_CHUNK_BYTES=file_header.trace_size, HEADER_PROFILE_WORKERS=3), \
+                mock.patch('core.header_profile._profile_executor', executor):
+            profile = profile_dataset(MemoryReader(content), file_header, 100)
+        assert profile.trace_count == 100
+        assert executor.submitted == 100 and executor.most_pending == 3
+
+    def test_runs_across_chunks(self):
+        first = FieldProfile(np.array([1, 2, 3]))
+        first.merge(FieldProfile(np.array([3, 4, 1])))
+        assert (first.ascending_runs, first.descending_runs) == (2, 4)
+        assert (first.minimum, first.maximum, first.count) == (1, 4, 6)
+
+    def test_distinct_estimate(self):
+        exact = FieldProfile(np.arange(SKETCH_SIZE - 1))
+        assert distinct_estimate(exact.sketch) == SKETCH_SIZE - 1
+
+        estimated = FieldProfile(np.arange(100000) % 50000)
+        assert abs(distinct_estimate(estimated.sketch) - 50000) < 50000 * 0.1
+
+    def test_empty_dataset(self):
+        with self.assertRaises(ValueError):
+            self.profile(make_file_header(sample_format=5, samples_per_trace=1))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,233 @@
+import sys
+from unittest.mock import Mock
+
+sys.modules['segysdk'] = Mock()
+sys.modules['openzgycpp'] = Mock()
+
+import base64
+import contextlib
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+from api.routes.route_jobs import dump_trace_headers, router
+from core.config import Settings
+from core.jobs import JobManager, JobNotFound, owner_of, CANCELLED, FAILED, SUCCEEDED
+from core.sdms import SdmsError
+from core.segy import to_styled_json
+from unit.util import apply_test_settings
+
+client = TestClient(router)
+
+
+def wait_for(manager, job_id, timeout=5):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        status = manager.status(job_id)
+        if status['status'] in (SUCCEEDED, FAILED, CANCELLED):
+            return status
+        time.sleep(0.01)
+    raise AssertionError(f"Job {job_id} did not finish")
+
+
+def read_trace_headers(start_trace, traces_to_dump, sdpath='sd://a/b/c'):
+    last = min(start_trace + traces_to_dump, 26)
+    return json.dumps({
+        "Metadata": {"ColumnHeaders": [{"End": 4, "Id": "TraceSequenceLine", "Start": 1}],
+                     "StartTrace": start_trace, "TraceCount": traces_to_dump},
+        "TraceData": [{"TraceNo": i, "Traces": [i]} for i in range(start_trace, last)],
+        "metadata": {"Filenames": [sdpath], "SegyRevision": 0}})
+
+
+# counts the sessions opened, every chunk of a dump is read through the same one
+class FakeSessions:
+    def __init__(self):
+        self.opened = 0
+
+    @contextlib.contextmanager
+    def __call__(self, bearer, api_key, sdpath):
+        self.opened += 1
+        yield lambda start_trace, traces_to_dump: read_trace_headers(start_trace, traces_to_dump, sdpath)
+
+
+class JobManagerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, 'jobs.db')
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_job_result_and_progress(self):
+        manager = JobManager(self.path, 2, 60)
+
+        def job(context, total):
+            for done in range(total + 1):
+                context.progress(done, total)
+            return {"answer": total}
+
+        job_id = manager.submit('test', 'sd://a/b/c', {}, job, 3)
+        status = wait_for(manager, job_id)
+        assert status['status'] == SUCCEEDED
+        assert status['progress']['done'] == 3 and status['progress']['total'] == 3
+        assert manager.result(job_id) == (SUCCEEDED, {"answer": 3})
+
+    def test_failed_job(self):
+        manager = JobManager(self.path, 1, 60)
+
+        def job(context):
+            raise ValueError("broken")
+
+        status = wait_for(manager, manager.submit('test', 'sd://a/b/c', {}, job))
+        assert status['status'] == FAILED
+        assert status['error'] == "broken"
+
+    def test_cancel_between_chunks(self):
+        manager = JobManager(self.path, 1, 60)
+        started = threading.Event()
+
+        def job(context):
+            started.set()
+            while True:
+                context.progress(0, 1)
+                time.sleep(0.01)
+
+        job_id = manager.submit('test', 'sd://a/b/c', {}, job)
+        started.wait(5)
+        assert manager.cancel(job_id) == CANCELLED
+        assert wait_for(manager, job_id)['status'] == CANCELLED
+
+    def test_finished_jobs_expire(self):
+        manager = JobManager(self.path, 1, 60)
+        job_id = manager.submit('test', 'sd://a/b/c', {}, lambda context: 1)
+        wait_for(manager, job_id)
+        with mock.patch('core.jobs.time.time', return_value=time.time() + 120):
+            with self.assertRaises(JobNotFound):
+                manager.status(job_id)
+
+    def test_restart_fails_unfinished_jobs(self):
+        manager = JobManager(self.path, 1, 60)
+        blocker = threading.Event()
+        job_id = manager.submit('test', 'sd://a/b/c', {}, lambda context: blocker.wait(5))
+
+        status = JobManager(self.path, 1, 60).status(job_id)
+        blocker.set()
+        assert status['status'] == FAILED
+
+    def test_jobs_of_other_owners_are_not_found(self):
+        manager = JobManager(self.path, 1, 60)
+        job_id = manager.submit('test', 'sd://a/b/c', {}, lambda context: 1, owner=owner_of('Bearer a'))
+        wait_for(manager, job_id)
+        assert manager.status(job_id, owner_of('Bearer a'))['status'] == SUCCEEDED
+        with self.assertRaises(JobNotFound):
+            manager.status(job_id, owner_of('Bearer b'))
+        with self.assertRaises(JobNotFound):
+            manager.result(job_id, owner_of('Bearer b'))
+        with self.assertRaises(JobNotFound):
+            manager.cancel(job_id, owner_of('Bearer b'))
+
+    def test_written_pieces_are_the_result(self):
+        manager = JobManager(self.path, 1, 60)
+
+        def job(context):
+            context.write('b')
+            context.write('c')
+            context.write('a', seq=0)
+
+        job_id = manager.submit('test', 'sd://a/b/c', {}, job)
+        wait_for(manager, job_id)
+        status, pieces = manager.result(job_id)
+        assert status == SUCCEEDED and ''.join(pieces) == 'abc'
+
+
+class DumpTraceHeadersTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.manager = JobManager(os.path.join(self.dir.name, 'jobs.db'), 1, 60)
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def dump(self, sessions, start_trace, traces_to_dump):
+        job_id = self.manager.submit('segy/rawTraceHeaders', 'sd://a/b/c', {}, dump_trace_headers, sessions,
+                                     'bearer', 'key', 'sd://a/b/c', start_trace, traces_to_dump)
+        status = wait_for(self.manager, job_id)
+        assert status['status'] == SUCCEEDED, status['error']
+        return status, json.loads(''.join(self.manager.result(job_id)[1]))
+
+    @mock.patch('api.routes.route_jobs.settings.JOB_TRACES_PER_CHUNK', 10)
+    def test_chunks_are_merged(self):
+        sessions = FakeSessions()
+        status, result = self.dump(sessions, 3, 40)
+        header = json.loads(result["header"])
+        assert header["Metadata"]["StartTrace"] == 3
+        assert header["Metadata"]["TraceCount"] == 23
+        assert [trace["TraceNo"] for trace in header["TraceData"]] == list(range(3, 26))
+        assert status['progress']['done'] == 30 and status['progress']['total'] == 40
+        assert result["header"].startswith('{\n\t"Metadata" : \n\t{')
+        assert sessions.opened == 1
+
+    @mock.patch('api.routes.route_jobs.settings.JOB_TRACES_PER_CHUNK', 10)
+    def test_same_text_as_one_call(self):
+        expected = json.loads(read_trace_headers(1, 25))
+        expected["Metadata"]["StartTrace"], expected["Metadata"]["TraceCount"] = 1, 25
+        _, result = self.dump(FakeSessions(), 1, 25)
+        assert result["header"] == to_styled_json(expected)
+
+    def test_no_traces(self):
+        _, result = self.dump(FakeSessions(), 30, 5)
+        header = json.loads(result["header"])
+        assert header["TraceData"] == [] and header["Metadata"]["TraceCount"] == 0
+
+
+class RouteJobsTest(unittest.TestCase):
+
+    def setUp(self):
+        apply_test_settings()
+        self.dir = tempfile.TemporaryDirectory()
+        self.manager = JobManager(os.path.join(self.dir.name, 'jobs.db'), 1, 60)
+        self.patch = mock.patch('api.routes.route_jobs.get_job_manager', return_value=self.manager)
+        self.patch.start()
+
+    def tearDown(self):
+        self.patch.stop()
+        self.dir.cleanup()
+
+    def test_only_the_submitter_sees_the_job(self):
+        job_id = self.manager.submit('test', 'sd://a/b/c', {}, lambda context: {"answer": 1},
+                                     owner=owner_of('Bearer a'))
+        wait_for(self.manager, job_id)
+        url = Settings.BASE_URL + Settings.API_PATH + f"jobs/{job_id}"
+
+        assert client.get(url + "/result", headers={'Authorization': 'Bearer a'}).json() == {"answer": 1}
+        for request, path in ((client.get, url), (client.delete, url), (client.get, url + "/result")):
+            with self.assertRaises(HTTPException) as context:
+                request(path, headers={'Authorization': 'Bearer b'})
+            assert context.exception.status_code == 404
+
+    def test_access_is_checked_again(self):
+        job_id = self.manager.submit('test', 'sd://a/b/c', {}, lambda context: 1, owner=owner_of('Bearer a'))
+        wait_for(self.manager, job_id)
+        url = Settings.BASE_URL + Settings.API_PATH + f"jobs/{job_id}"
+        with mock.patch('api.routes.route_jobs.settings.SDMS_URL', 'https://sdms.unit-tests.com/api/v3'), \
+                mock.patch('api.routes.route_jobs.authorize', side_effect=SdmsError(403, "No read access")):
+            with self.assertRaises(HTTPException) as context:
+                client.get(url, headers={'Authorization': 'Bearer a'})
+        assert context.exception.status_code == 403
+
+    def test_conversion_needs_a_bearer_lasting_long_enough(self):
+        claims = base64.urlsafe_b64encode(json.dumps({'exp': time.time() + 10}).encode()).decode().rstrip('=')
+        with self.assertRaises(HTTPException) as context:
+            client.post(Settings.BASE_URL + Settings.API_PATH + "jobs",
+                        json={'kind': 'segy/convertToZgy', 'sdpath': 'sd://a/b/c.segy',
+                              'target_sdpath': 'sd://a/b/c.zgy'},
+                        headers={'Authorization': f'Bearer header.{claims}.signature'})
+        assert context.exception.status_code == 401
@@ -0,0 +1,56 @@
+import json
+import logging
+import queue
+import unittest
+from unittest import mock
+
+from core.config import settings
+from core.log import CompactFormatter, NonBlockingQueueHandler, dropped_records, suppressed_tracebacks, \
+    traceback_sampled
+
+
+def make_record(exc_info=None, **fields):
+    return logging.makeLogRecord({'name': 'test', 'levelno': logging.WARNING, 'levelname': 'WARNING',
+                                  'msg': "read of %s failed", 'args': ('sd://a/b/c',), 'exc_info': exc_info,
+                                  'fields': fields})
+
+
+class LogTest(unittest.TestCase):
+
+    def test_compact_records(self):
+        entry = json.loads(CompactFormatter().format(make_record(status=404, path='/segy/revision')))
+        assert entry['message'] == "read of sd://a/b/c failed"
+        assert entry['level'] == 'WARNING' and entry['status'] == 404
+        assert 'traceback' not in entry
+
+    def test_traceback_is_formatted_by_the_listener(self):
+        try:
+            raise ValueError("broken")
+        except ValueError as e:
+            record = make_record(exc_info=(type(e), e, e.__traceback__))
+
+        records = queue.Queue()
+        NonBlockingQueueHandler(records).handle(record)
+        queued = records.get_nowait()
+        assert queued.exc_info is not None and queued.exc_text is None
+        assert "ValueError: broken" in json.loads(CompactFormatter().format(queued))['traceback']
+
+    def test_full_queue_drops_records(self):
+        handler = NonBlockingQueueHandler(queue.Queue(1))
+        before = dropped_records.value()
+        handler.handle(make_record())
+        handler.handle(make_record())
+        assert dropped_records.value() == before + 1
+
+    def test_traceback_sampling_per_status_class(self):
+        with mock.patch.multiple(settings, LOG_TRACEBACK_SAMPLE_4XX=0, LOG_TRACEBACK_SAMPLE_5XX=1):
+            before = suppressed_tracebacks.value(status_class='4xx')
+            assert not traceback_sampled(403)
+            assert not traceback_sampled(404)
+            assert traceback_sampled(502)
+            assert suppressed_tracebacks.value(status_class='4xx') == before + 2
+            assert suppressed_tracebacks.value(status_class='5xx') == 0
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,34 @@
+import unittest
+from unittest import mock
+
+from core.lru import LruCache
+
+
+class LruCacheTest(unittest.TestCase):
+
+    def test_least_recently_used_goes_first(self):
+        cache = LruCache(2)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        assert cache.get('a') == 1
+        cache.put('c', 3)
+        assert cache.get('b') is None
+        assert (cache.get('a'), cache.get('c'), len(cache)) == (1, 3, 2)
+
+    def test_entries_expire(self):
+        cache = LruCache(2)
+        cache.put('a', 1, ttl=10)
+        with mock.patch('core.lru.time.monotonic', return_value=1e12):
+            assert cache.get('a') is None
+        assert len(cache) == 0
+
+    def test_evict(self):
+        cache = LruCache(2)
+        cache.put('a', 1)
+        cache.evict('a')
+        cache.evict('missing')
+        assert cache.get('a') is None
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+import asyncio
+import threading
+import time
+import tracemalloc
+import unittest
+
+from core.deadlines import RequestScope, enter_scope, leave_scope
+from core.executor import run_sdk_call
+from core.memory import MB, MemoryBudget, MemoryBudgetExceeded, tracemalloc_top
+
+
+class MemoryBudgetTest(unittest.TestCase):
+
+    def test_accounting_per_kind(self):
+        budget = MemoryBudget(0, 0)
+        with budget.hold('segysdk'), budget.hold('openzgy'), budget.hold('openzgy'):
+            usage = budget.usage()
+            assert usage['handles']['openzgy']['open'] == 2
+            assert usage['used_bytes'] == usage['handles']['segysdk']['bytes'] + usage['handles']['openzgy']['bytes']
+        assert budget.usage()['used_bytes'] == 0
+        assert budget.usage()['handles']['openzgy'] == {'open': 0, 'bytes': 0}
+
+    def test_open_waits_for_memory(self):
+        budget = MemoryBudget(100 * MB, 5)
+        budget.acquire('openzgy', 80 * MB)
+        threading.Timer(0.1, budget.release, ('openzgy', 80 * MB)).start()
+
+        started = time.monotonic()
+        budget.acquire('openzgy', 50 * MB)
+        assert 0.05 < time.monotonic() - started < 5
+        assert budget.used == 50 * MB
+
+    def test_open_is_rejected_after_waiting(self):
+        budget = MemoryBudget(100 * MB, 0.05)
+        budget.acquire('openzgy', 80 * MB)
+        with self.assertRaises(MemoryBudgetExceeded) as raised:
+            budget.acquire('segysdk', 50 * MB)
+        assert raised.exception.status_code == 503
+        assert budget.used == 80 * MB
+
+    def test_sdk_threads_wait_briefly(self):
+        budget = MemoryBudget(100 * MB, 30, 0.2)
+        budget.acquire('openzgy', 80 * MB)
+
+        started = time.monotonic()
+        with self.assertRaises(MemoryBudgetExceeded):
+            asyncio.run(run_sdk_call(budget.acquire, 'segysdk', 50 * MB))
+        assert 0.15 < time.monotonic() - started < 1
+        assert budget.used == 80 * MB
+
+        threading.Timer(0.05, budget.release, ('openzgy', 80 * MB)).start()
+        asyncio.run(run_sdk_call(budget.acquire, 'segysdk', 50 * MB))
+        assert budget.used == 50 * MB
+
+    def test_wait_is_capped_by_the_deadline(self):
+        budget = MemoryBudget(100 * MB, 30)
+        budget.acquire('openzgy', 80 * MB)
+        token = enter_scope(RequestScope(0.05))
+        try:
+            started = time.monotonic()
+            with self.assertRaises(MemoryBudgetExceeded):
+                budget.acquire('segysdk', 50 * MB)
+            assert time.monotonic() - started < 1
+        finally:
+            leave_scope(token)
+
+    def test_oversized_handle_opens_alone(self):
+        budget = MemoryBudget(10 * MB, 0)
+        budget.acquire('openzgy-writer', 500 * MB)
+        with self.assertRaises(MemoryBudgetExceeded):
+            budget.acquire('openzgy', 1 * MB)
+
+    def test_tracemalloc_top(self):
+        assert tracemalloc_top(5) is None or tracemalloc.is_tracing()
+        tracemalloc.start()
+        try:
+            kept = [bytearray(1000) for _ in range(100)]
+            assert len(tracemalloc_top(5)) <= 5
+            assert all('size_diff_bytes' in line for line in tracemalloc_top(5, compare=True))
+            del kept
+        finally:
+            tracemalloc.stop()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,169 @@
+import unittest
+from unittest import mock
+
+import requests_mock
+
+from core import access, metadata_store
+from core.access import AccessCache
+from core.config import settings
+from core.metadata_store import dataset_version, persisted
+from core.shared_cache import LocalCacheBackend, TieredCache
+
+SDMS_URL = "https://sdms.unit-tests.com/api/v3"
+DATASET_URL = SDMS_URL + "/dataset/tenant/opendes/subproject/test/dataset/example.sgy"
+SDPATH = "sd://opendes/test/example.sgy"
+DATASET = {'gcsurl': 'container/prefix', 'ctag': 'abc', 'filemetadata': {'nobjects': 1, 'size': 3600, 'type': 'GENERIC'}}
+TOKEN_URL = SDMS_URL + "/utility/gcs-access-token"
+OBJECT_URL = "https://storage.googleapis.com/container/prefix/0"
+VERSION = dataset_version(DATASET, '"1"')
+
+
+def mock_storage(mocker, etag='"1"'):
+    mocker.get(TOKEN_URL, json={'access_token': 'storage', 'token_type': 'Bearer', 'expires_in': 3600})
+    mocker.head(OBJECT_URL, headers={'ETag': etag})
+    mocker.head("https://storage.googleapis.com/container/other/0", headers={'ETag': etag})
+
+
+def dataset_requests(mocker):
+    return [request.method for request in mocker.request_history if request.url.startswith(DATASET_URL)]
+
+
+# waits for the results written back in the background
+def written():
+    metadata_store._writer.submit(lambda: None).result()
+
+
+class MetadataStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        patcher = mock.patch.multiple(settings, SDMS_URL=SDMS_URL, PERSIST_METADATA=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        cache = mock.patch.object(access, 'access_cache', AccessCache(100, 60, 5))
+        cache.start()
+        self.addCleanup(cache.stop)
+        self.calls = []
+
+        @persisted("segy/revision")
+        def read_revision(bearer, api_key, sdpath):
+            self.calls.append(sdpath)
+            return 1
+        self.read_revision = read_revision
+
+    def test_computed_result_is_written_through(self):
+        with requests_mock.Mocker() as mocker:
+            mock_storage(mocker)
+            mocker.get(DATASET_URL, json=DATASET)
+            mocker.patch(DATASET_URL, json={})
+            assert self.read_revision('Bearer token', 'key', SDPATH) == 1
+            written()
+
+            record = mocker.request_history[-1].json()
+            assert record['filemetadata']['size'] == 3600
+            assert record['filemetadata']['extracted'] == {'version': VERSION,
+                                                           'results': {'segy/revision': 1}}
+        assert self.calls == [SDPATH]
+
+    def test_stored_result_is_served(self):
+        stored = dict(DATASET, ctag='def')
+        stored['filemetadata'] = dict(DATASET['filemetadata'], extracted={
+            'version': VERSION, 'results': {'segy/revision': 2}})
+        with requests_mock.Mocker() as mocker:
+            mock_storage(mocker)
+            mocker.get(DATASET_URL, json=stored)
+            assert self.read_revision('Bearer token', 'key', SDPATH) == 2
+            assert dataset_requests(mocker) == ['GET']
+        assert self.calls == []
+
+    def test_rewritten_content_is_recomputed(self):
+        stored = dict(DATASET)
+        stored['filemetadata'] = dict(DATASET['filemetadata'], extracted={
+            'version': VERSION, 'results': {'segy/revision': 2}})
+        with requests_mock.Mocker() as mocker:
+            mock_storage(mocker, etag='"2"')
+            mocker.get(DATASET_URL, json=stored)
+            mocker.patch(DATASET_URL, json={})
+            assert self.read_revision('Bearer token', 'key', SDPATH) == 1
+            written()
+            assert mocker.request_history[-1].json()['filemetadata']['extracted'] == {
+                'version': dataset_version(DATASET, '"2"'), 'results': {'segy/revision': 1}}
+
+    def test_stale_result_is_recomputed(self):
+        stored = dict(DATASET)
+        stored['filemetadata'] = dict(DATASET['filemetadata'], size=7200, extracted={
+            'version': VERSION, 'results': {'segy/revision': 2, 'segy/is3D': True}})
+        with requests_mock.Mocker() as mocker:
+            mock_storage(mocker)
+            mocker.get(DATASET_URL, json=stored)
+            mocker.patch(DATASET_URL, json={})
+            assert self.read_revision('Bearer token', 'key', SDPATH) == 1
+            written()
+            assert mocker.request_history[-1].json()['filemetadata']['extracted']['results'] == {'segy/revision': 1}
+
+    def test_results_stored_while_computing_are_kept(self):
+        stored = dict(DATASET, ctag='def')
+        stored['filemetadata'] = dict(DATASET['filemetadata'], extracted={
+            'version': VERSION, 'results': {'segy/is3D': True}})
+        with requests_mock.Mocker() as mocker:
+            mock_storage(mocker)
+            mocker.get(DATASET_URL, [{'json': DATASET}, {'json': stored}])
+            mocker.patch(DATASET_URL, json={})
+            assert self.read_revision('Bearer token', 'key', SDPATH) == 1
+            written()
+            assert mocker.request_history[-1].json()['filemetadata']['extracted']['results'] == \
+                {'segy/is3D': True, 'segy/revision': 1}
+
+    def test_edited_dataset_is_not_written(self):
+        for edited in (dict(DATASET, gcsurl='container/other'),
+                       dict(DATASET, filemetadata=dict(DATASET['filemetadata'], owner='someone'))):
+            with requests_mock.Mocker() as mocker:
+                mock_storage(mocker)
+                mocker.get(DATASET_URL, [{'json': DATASET}, {'json': edited}])
+                mocker.patch(DATASET_URL, json={})
+                assert self.read_revision('Bearer token', 'key', SDPATH) == 1
+                written()
+                assert dataset_requests(mocker) == ['GET', 'GET']
+
+    def test_failed_write_is_tolerated(self):
+        with requests_mock.Mocker() as mocker:
+            mock_storage(mocker)
+            mocker.get(DATASET_URL, json=DATASET)
+            mocker.patch(DATASET_URL, status_code=403, text='forbidden')
+            assert self.read_revision('Bearer token', 'key', SDPATH) == 1
+            written()
+
+    def test_disabled(self):
+        with mock.patch.object(settings, 'PERSIST_METADATA', False), requests_mock.Mocker() as mocker:
+            assert self.read_revision('Bearer token', 'key', SDPATH) == 1
+            assert mocker.call_count == 0
+
+    def test_replicas_share_results(self):
+        far = LocalCacheBackend(100)
+        replicas = [TieredCache(LocalCacheBackend(10), far) for _ in range(2)]
+        with mock.patch.object(settings, 'PERSIST_METADATA', False), requests_mock.Mocker() as mocker:
+            mock_storage(mocker)
+            mocker.get(DATASET_URL, json=DATASET)
+            for replica in replicas:
+                with mock.patch('core.metadata_store.get_metadata_cache', return_value=replica):
+                    assert self.read_revision('Bearer token', 'key', SDPATH) == 1
+            assert self.calls == [SDPATH]
+
+            # a new version of the file is computed again
+            mocker.get(DATASET_URL, json=dict(DATASET, gcsurl='container/other'))
+            with mock.patch('core.metadata_store.get_metadata_cache', return_value=replicas[0]):
+                assert self.read_revision('Bearer token', 'key', SDPATH) == 1
+            assert self.calls == [SDPATH, SDPATH]
+
+    def test_cache_does_not_skip_the_access_check(self):
+        cache = TieredCache(LocalCacheBackend(10), LocalCacheBackend(10))
+        with mock.patch('core.metadata_store.get_metadata_cache', return_value=cache), \
+                requests_mock.Mocker() as mocker:
+            mock_storage(mocker)
+            mocker.get(DATASET_URL, json=DATASET)
+            mocker.patch(DATASET_URL, json={})
+            self.read_revision('Bearer token', 'key', SDPATH)
+
+            mocker.get(DATASET_URL, status_code=403, text='forbidden')
+            self.read_revision('Bearer other', 'key', SDPATH)
+        # the read without access went to the reader, which fails on its own in real life
+        assert self.calls == [SDPATH, SDPATH]
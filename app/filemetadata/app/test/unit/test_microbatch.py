@@ -0,0 +1,97 @@
+import asyncio
+import json
+import unittest
+from unittest import mock
+
+from fastapi import HTTPException
+
+from core.config import settings
+from core.microbatch import TraceHeaderBatcher, batched_requests, merge_ranges
+
+
+def trace_headers(first, count, last_trace=100000):
+    traces = [{"TraceNo": trace, "Traces": [trace]} for trace in range(first, min(first + count, last_trace + 1))]
+    return {"header": json.dumps({"Metadata": {"ColumnHeaders": [], "StartTrace": first, "TraceCount": len(traces)},
+                                  "TraceData": traces})}
+
+
+class MicroBatchTest(unittest.TestCase):
+
+    def setUp(self):
+        patcher = mock.patch.multiple(settings, TRACE_HEADER_BATCH_WINDOW=0.02, TRACE_HEADER_BATCH_MAX_TRACES=5000)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.calls = []
+
+    def read(self, bearer, api_key, sdpath, first, count):
+        self.calls.append((sdpath, first, count))
+        return trace_headers(first, count, 2500)
+
+    def gather(self, *requests, read=None):
+        batcher = TraceHeaderBatcher()
+
+        async def run():
+            return await asyncio.gather(*(batcher.read(read or self.read, 'Bearer token', 'key', sdpath, first, count)
+                                          for sdpath, first, count in requests), return_exceptions=True)
+        return asyncio.run(run())
+
+    def test_merge_ranges(self):
+        requests = [(1001, 1000, 'b'), (1, 1000, 'a'), (500, 10, 'c'), (3001, 10, 'd'), (2001, 4000, 'e')]
+        groups = [[request[2] for request in group] for group in merge_ranges(requests, 5000)]
+        assert groups == [['a', 'c', 'b'], ['e', 'd']]
+        assert [[request[2] for request in group] for group in merge_ranges(requests, 10000)] == \
+            [['a', 'c', 'b', 'e', 'd']]
+
+    def test_adjacent_pages_share_one_read(self):
+        before = batched_requests.value()
+        pages = self.gather(*[("sd://a/b/c.segy", first, 1000) for first in (1, 1001, 2001, 3001)])
+        # the first page is read at once, the pages asked for while it is read wait for one read
+        assert self.calls == [("sd://a/b/c.segy", 1, 1000), ("sd://a/b/c.segy", 1001, 3000)]
+        assert batched_requests.value() == before + 3
+
+        headers = [json.loads(page["header"]) for page in pages]
+        assert [[trace["TraceNo"] for trace in header["TraceData"]][::999] for header in headers] == \
+            [[1, 1000], [1001, 2000], [2001], []]
+        assert [header["Metadata"]["TraceCount"] for header in headers] == [1000, 1000, 500, 0]
+        assert headers[1]["Metadata"]["StartTrace"] == 1001
+
+    def test_lone_request_does_not_wait(self):
+        with mock.patch.object(settings, 'TRACE_HEADER_BATCH_WINDOW', 60):
+            assert self.gather(("sd://a/b/c.segy", 1, 100)) == [trace_headers(1, 100)]
+        assert self.calls == [("sd://a/b/c.segy", 1, 100)]
+
+    def test_failed_merged_read_is_read_apart(self):
+        def read(bearer, api_key, sdpath, first, count):
+            if count > 1000:
+                raise HTTPException(status_code=500, detail="too large")
+            return self.read(bearer, api_key, sdpath, first, count)
+
+        before = batched_requests.value()
+        pages = self.gather(*[("sd://a/b/c.segy", first, 1000) for first in (1, 1001, 2001)], read=read)
+        assert sorted(self.calls) == [("sd://a/b/c.segy", 1, 1000), ("sd://a/b/c.segy", 1001, 1000),
+                                      ("sd://a/b/c.segy", 2001, 1000)]
+        assert pages[1] == trace_headers(1001, 1000, 2500)
+        assert batched_requests.value() == before
+
+    def test_datasets_and_gaps_are_read_apart(self):
+        pages = self.gather(("sd://a/b/c.segy", 1, 100), ("sd://a/b/d.segy", 101, 100), ("sd://a/b/c.segy", 500, 10))
+        assert sorted(self.calls) == [("sd://a/b/c.segy", 1, 100), ("sd://a/b/c.segy", 500, 10),
+                                      ("sd://a/b/d.segy", 101, 100)]
+        # a request read alone gets the response of the reader untouched
+        assert pages[0] == trace_headers(1, 100)
+
+    def test_errors_reach_every_request(self):
+        def failing(*args):
+            raise HTTPException(status_code=403, detail="forbidden")
+        self.read = failing
+        pages = self.gather(("sd://a/b/c.segy", 1, 100), ("sd://a/b/c.segy", 101, 100), ("sd://a/b/c.segy", 201, 100))
+        assert all(isinstance(page, HTTPException) and page.status_code == 403 for page in pages)
+
+    def test_disabled(self):
+        with mock.patch.object(settings, 'TRACE_HEADER_BATCH_WINDOW', 0):
+            self.gather(("sd://a/b/c.segy", 1, 100), ("sd://a/b/c.segy", 101, 100))
+        assert len(self.calls) == 2
+
+
+if __name__ == '__main__':
+    unittest.main()
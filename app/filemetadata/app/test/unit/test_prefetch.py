@@ -0,0 +1,134 @@
+import sys
+from unittest.mock import Mock
+
+sys.modules['segysdk'] = Mock()
+sys.modules['openzgycpp'] = Mock()
+
+import threading
+import time
+import unittest
+from unittest import mock
+
+import requests_mock
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+
+from api.routes.route_batch import MetadataKind
+from api.routes.route_prefetch import default_kinds, router
+from core.config import Settings, settings
+from core.prefetch import PRIORITY_POLLED, PrefetchQueue, Prefetcher, RateLimiter
+from unit.util import apply_test_settings
+
+client = TestClient(router)
+
+TEST_HEADERS = {'content': 'application/json', 'Authorization': 'Bearer token', 'x-admin-key': 'admin'}
+SDMS_URL = "https://sdms.unit-tests.com/api/v3"
+TOKEN_URL = "https://login.unit-tests.com/oauth2/token"
+
+apply_test_settings()
+
+
+class PrefetchQueueTest(unittest.TestCase):
+
+    def test_priority_order(self):
+        queue = PrefetchQueue(10)
+        queue.put('sd://t/s/polled.sgy', 'a', PRIORITY_POLLED)
+        queue.put('sd://t/s/first.sgy', 'b', 0)
+        queue.put('sd://t/s/second.sgy', 'c', 0)
+        assert [queue.get(0)[0] for _ in range(3)] == ['sd://t/s/first.sgy', 'sd://t/s/second.sgy',
+                                                       'sd://t/s/polled.sgy']
+        assert queue.get(0) is None
+
+    def test_queued_once_at_the_best_priority(self):
+        queue = PrefetchQueue(10)
+        assert queue.put('sd://t/s/a.sgy', 'polled', PRIORITY_POLLED)
+        assert not queue.put('sd://t/s/a.sgy', 'again', PRIORITY_POLLED)
+        assert queue.put('sd://t/s/a.sgy', 'requested', 0)
+        assert len(queue) == 1
+        assert queue.get(0) == ('sd://t/s/a.sgy', 'requested')
+        assert queue.get(0) is None
+
+    def test_capacity(self):
+        queue = PrefetchQueue(1)
+        assert queue.put('sd://t/s/a.sgy', None, 0)
+        assert not queue.put('sd://t/s/b.sgy', None, 0)
+
+    def test_rate_limiter(self):
+        limiter = RateLimiter(50)
+        started = time.monotonic()
+        for _ in range(4):
+            limiter.acquire()
+        assert time.monotonic() - started >= 0.05
+
+
+class PrefetcherTest(unittest.TestCase):
+
+    def test_waits_for_interactive_calls(self):
+        done = threading.Event()
+        prefetcher = Prefetcher(lambda bearer, api_key, sdpath, kinds: done.set())
+        busy = [True, True, False]
+        with mock.patch.multiple(settings, PREFETCH_YIELD_SECONDS=0.01, PREFETCH_RATE=1000), \
+                mock.patch('core.prefetch.interactive_busy', side_effect=lambda: busy.pop(0) if busy else False):
+            prefetcher.enqueue('sd://t/s/a.sgy', None, 'Bearer token', None)
+            assert done.wait(2)
+        assert busy == []
+
+    def test_poll_queues_new_datasets(self):
+        url = SDMS_URL + "/dataset/tenant/t/subproject/s"
+        prefetcher = Prefetcher(lambda *args: None)
+        with requests_mock.Mocker() as mocker, mock.patch.object(prefetcher, '_start'), \
+                mock.patch.multiple(settings, SDMS_URL=SDMS_URL, SERVICE_TOKEN_URL=TOKEN_URL), \
+                mock.patch('core.sdms._service_token', None):
+            mocker.post(TOKEN_URL, json={'access_token': 'service', 'expires_in': 3600})
+            mocker.get(url, json=[{'name': 'old.sgy', 'path': '/', 'last_modified_date': '1'}])
+            prefetcher.watch('sd://t/s', None, None)
+            assert mocker.last_request.headers['Authorization'] == 'Bearer service'
+            mocker.get(url, json=[{'name': 'old.sgy', 'path': '/', 'last_modified_date': '1'},
+                                  {'name': 'new.zgy', 'path': '/folder/', 'last_modified_date': '2'}])
+            prefetcher.poll()
+            sdpath, (kinds, bearer, api_key) = prefetcher.queue.get(0)
+            assert sdpath == 'sd://t/s/folder/new.zgy' and bearer is None
+            assert prefetcher.queue.get(0) is None
+
+            # an expired service token is refreshed and the watch goes on
+            mocker.get(url, [{'status_code': 401, 'text': 'expired'}, {'json': []}])
+            prefetcher.poll()
+            assert prefetcher.watched() == ['sd://t/s']
+            assert len([r for r in mocker.request_history if r.url == TOKEN_URL]) == 2
+
+            # the service losing access to the subproject ends the watch
+            mocker.get(url, status_code=403, text='forbidden')
+            prefetcher.poll()
+            assert prefetcher.watched() == []
+
+
+class RoutePrefetchTest(unittest.TestCase):
+
+    def test_default_kinds(self):
+        assert default_kinds('sd://t/s/a.ZGY') == [MetadataKind.openzgy_headers, MetadataKind.openzgy_bingrid]
+        assert MetadataKind.segy_binary_header in default_kinds('sd://t/s/a.sgy')
+
+    def test_admin_key_is_required(self):
+        url = Settings.BASE_URL + Settings.API_PATH + "admin/prefetch"
+        # refused while no key is set and with a key that is not the one set
+        for configured in ('', 'other'):
+            with mock.patch.object(settings, 'ADMIN_API_KEY', configured), \
+                    self.assertRaises(HTTPException) as context:
+                client.get(url, headers=TEST_HEADERS)
+            assert context.exception.status_code == 403
+        with mock.patch.object(settings, 'ADMIN_API_KEY', 'admin'):
+            assert client.get(url, headers=TEST_HEADERS).status_code == 200
+
+    def test_post_prefetch(self):
+        with mock.patch('api.routes.route_prefetch.prefetcher.enqueue', side_effect=[True, False]) as enqueue, \
+                mock.patch.object(settings, 'ADMIN_API_KEY', 'admin'):
+            response = client.post(Settings.BASE_URL + Settings.API_PATH + "admin/prefetch",
+                                   json={"sdpaths": ["sd://t/s/a.sgy", "sd://t/s/a.sgy"], "priority": 3},
+                                   headers=TEST_HEADERS)
+        assert response.status_code == 202
+        assert response.json()['accepted'] == ["sd://t/s/a.sgy"]
+        assert enqueue.call_args[0][4] == 3
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,189 @@
+import threading
+import time
+import unittest
+from unittest import mock
+
+from fastapi import HTTPException
+
+from core.config import settings
+from core.deadlines import DeadlineExceeded, RequestScope, current_scope, enter_scope, leave_scope
+from core.executor import on_sdk_thread
+from core.memory import MB, MemoryBudget, MemoryBudgetExceeded
+from core.metrics import registry
+from core.resilience import resilient, get_circuit_breaker, is_backend_failure, CircuitOpenError, hedges, \
+    hedges_skipped, hedge_wins, OPEN, CLOSED
+
+
+class SdkError(Exception):
+    pass
+
+
+# raises the HTTPException a route makes of an SDK error, the way the routes do it
+def wrapped(error, status_code=500):
+    try:
+        raise error
+    except Exception:
+        raise HTTPException(status_code=status_code, detail=str(error))
+
+
+class ResilienceTest(unittest.TestCase):
+
+    def setUp(self):
+        patcher = mock.patch.multiple(settings, BREAKER_MIN_CALLS=4, BREAKER_ERROR_RATE=0.5, BREAKER_WINDOW=30,
+                                      BREAKER_OPEN_SECONDS=30, HEDGE_READS=False, HEDGE_MIN_DELAY=0.05,
+                                      HEDGE_PERCENTILE=95)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_circuit_opens_on_backend_failures_only(self):
+        @resilient("breaking")
+        def read(status_code):
+            raise HTTPException(status_code=status_code)
+
+        for _ in range(4):
+            with self.assertRaises(HTTPException):
+                read(404)
+        assert get_circuit_breaker("breaking").state == CLOSED
+
+        for _ in range(4):
+            with self.assertRaises(HTTPException):
+                read(502)
+        assert get_circuit_breaker("breaking").state == OPEN
+        with self.assertRaises(CircuitOpenError):
+            read(200)
+
+    def test_backend_failures(self):
+        def failure(error, status_code=500):
+            try:
+                wrapped(error, status_code)
+            except HTTPException as e:
+                return is_backend_failure(e)
+
+        assert failure(SdkError("Read failed with HTTP 503 from the blob store"))
+        assert failure(SdkError("Connection reset by peer"))
+        assert failure(SdkError("Read failed with HTTP 502"), 502)
+        assert failure(TimeoutError("read timed out"))
+        assert not failure(SdkError("Not a SEG-Y file, bad sample format 9"))
+        assert not failure(ValueError("Expecting value: line 1 column 1"))
+        assert not failure(MemoryError())
+        assert not failure(SdkError("HTTP 404 Not Found"), 404)
+
+    def test_circuits_of_other_tenants_stay_closed(self):
+        @resilient("tenants")
+        def read(bearer, api_key, sdpath):
+            if sdpath.startswith('sd://failing/'):
+                raise IOError("storage unavailable")
+            return 'ok'
+
+        for _ in range(4):
+            with self.assertRaises(IOError):
+                read('bearer', 'key', 'sd://failing/test/a.segy')
+        assert get_circuit_breaker("tenants", "failing").state == OPEN
+        with self.assertRaises(CircuitOpenError):
+            read('bearer', 'key', 'sd://failing/test/b.segy')
+        assert read('bearer', 'key', sdpath='sd://healthy/test/a.segy') == 'ok'
+        assert get_circuit_breaker("tenants", "healthy").state == CLOSED
+
+    def test_trial_call_closes_the_circuit(self):
+        calls = []
+
+        @resilient("recovering")
+        def read(fail):
+            calls.append(fail)
+            if fail:
+                raise IOError("storage unavailable")
+            return 'ok'
+
+        for _ in range(4):
+            with self.assertRaises(IOError):
+                read(True)
+        with mock.patch.object(settings, 'BREAKER_OPEN_SECONDS', 0):
+            assert read(False) == 'ok'
+        assert get_circuit_breaker("recovering").state == CLOSED
+
+    def test_slow_read_is_hedged(self):
+        first_call = threading.Event()
+
+        @resilient("slow")
+        def read():
+            if not first_call.is_set():
+                first_call.set()
+                time.sleep(1)
+                return 'slow'
+            return 'fast'
+
+        with mock.patch.object(settings, 'HEDGE_READS', True):
+            started = time.monotonic()
+            assert read() == 'fast'
+        assert time.monotonic() - started < 0.5
+        assert hedges.value(backend="slow") == 1
+        assert hedge_wins.value(backend="slow") == 1
+
+    def test_no_hedge_while_calls_are_queued(self):
+        calls = []
+
+        @resilient("queued")
+        def read():
+            calls.append(1)
+            time.sleep(0.2)
+            return 'slow'
+
+        load = {"workers": 16, "in_flight": 16, "queued": 3, "queue_delay_seconds": 1.0}
+        with mock.patch.object(settings, 'HEDGE_READS', True), \
+                mock.patch('core.resilience.sdk_load', return_value=load):
+            assert read() == 'slow'
+        assert len(calls) == 1
+        assert hedges.value(backend="queued") == 0
+        assert hedges_skipped.value(backend="queued") == 1
+
+    def in_scope(self, scope, fn):
+        token = enter_scope(scope)
+        try:
+            return fn()
+        finally:
+            leave_scope(token)
+
+    def test_hedged_read_runs_in_the_request_scope(self):
+        scope = RequestScope(30)
+        budget = MemoryBudget(100 * MB, 30, 0.01)
+        budget.acquire('openzgy', 80 * MB)
+        seen = []
+
+        @resilient("scoped")
+        def read():
+            seen.append((current_scope(), on_sdk_thread()))
+            with budget.hold('openzgy'):
+                return 'read'
+
+        with mock.patch.object(settings, 'HEDGE_READS', True):
+            started = time.monotonic()
+            with self.assertRaises(MemoryBudgetExceeded):
+                self.in_scope(scope, read)
+        assert time.monotonic() - started < 2
+        assert seen and set(seen) == {(scope, True)}
+
+    def test_hedged_read_gives_up_at_the_deadline(self):
+        release = threading.Event()
+        self.addCleanup(release.set)
+
+        @resilient("deadline")
+        def read():
+            release.wait(5)
+            return 'late'
+
+        with mock.patch.object(settings, 'HEDGE_READS', True):
+            started = time.monotonic()
+            with self.assertRaises(DeadlineExceeded):
+                self.in_scope(RequestScope(0.2), read)
+        assert time.monotonic() - started < 1
+        assert get_circuit_breaker("deadline").state == CLOSED
+
+    def test_metrics_are_rendered(self):
+        @resilient("rendered")
+        def read():
+            return 1
+
+        read()
+        text = registry.render()
+        assert 'filemetadata_backend_read_seconds_count{backend="rendered"} 1' in text
+        assert '# TYPE filemetadata_backend_read_seconds histogram' in text
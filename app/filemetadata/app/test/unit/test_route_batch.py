@@ -0,0 +1,90 @@
+import sys
+from unittest.mock import Mock
+
+sys.modules['segysdk'] = Mock()
+sys.modules['openzgycpp'] = Mock()
+
+import json
+import threading
+import time
+import unittest
+from unittest import mock
+
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+from api.routes.route_batch import router, MetadataKind
+from core.config import Settings, settings
+from unit.util import apply_test_settings
+
+client = TestClient(router)
+
+TEST_HEADERS = {
+    'content': 'application/json',
+    'Authorization': 'AAAAAAAAAAAAAAAAAAAAAMLheAAAAAAA0%2BuSeid%2BULvsea4JtiGRiSDSJSI%3DEUifiRBkKG5E2XzMDjRfl76ZC9Ub0wnz4XsNiRVBChTYbJcE3F',
+}
+
+apply_test_settings()
+
+
+def read_revision(bearer, api_key, sdpath):
+    if sdpath.endswith('missing.sgy'):
+        raise HTTPException(status_code=404, detail=f"{sdpath} does not exist")
+    return 1
+
+
+def read_bingrid(bearer, api_key, sdpath):
+    return '{"P6BinGridOriginI": 1}'
+
+
+class RouteBatchTest(unittest.TestCase):
+
+    def post(self, body):
+        response = client.post(Settings.BASE_URL + Settings.API_PATH + "metadata/batch", json=body,
+                               headers=TEST_HEADERS)
+        return response, [json.loads(line) for line in response.text.splitlines()]
+
+    @mock.patch.dict('api.routes.route_batch.READERS', {MetadataKind.segy_revision: read_revision,
+                                                        MetadataKind.openzgy_bingrid: read_bingrid})
+    def test_batch_results_per_item(self):
+        response, items = self.post({"sdpaths": ["sd://opendes/test/a.sgy", "sd://opendes/test/missing.sgy"],
+                                     "kinds": ["segy/revision", "openzgy/bingrid"]})
+        assert response.status_code == 200
+        assert response.headers['content-type'] == 'application/x-ndjson'
+
+        results = {(item['sdpath'], item['kind']): item for item in items}
+        assert len(results) == 4
+        assert results[("sd://opendes/test/a.sgy", "segy/revision")] == {
+            "sdpath": "sd://opendes/test/a.sgy", "kind": "segy/revision", "status": 200, "result": 1}
+        assert results[("sd://opendes/test/missing.sgy", "segy/revision")]["status"] == 404
+        assert results[("sd://opendes/test/missing.sgy", "openzgy/bingrid")]["result"] == '{"P6BinGridOriginI": 1}'
+
+    @mock.patch.dict('api.routes.route_batch.READERS', {MetadataKind.segy_revision: read_revision})
+    def test_denied_items_revoke_their_grant(self):
+        with mock.patch('api.routes.route_batch.revoke_on_denial') as revoke:
+            self.post({"sdpaths": ["sd://opendes/test/missing.sgy"], "kinds": ["segy/revision"]})
+        revoke.assert_called_once_with(TEST_HEADERS['Authorization'], "sd://opendes/test/missing.sgy", 404)
+
+    def test_batch_concurrency_is_bounded(self):
+        lock = threading.Lock()
+        running = [0, 0]
+
+        def slow_revision(bearer, api_key, sdpath):
+            with lock:
+                running[0] += 1
+                running[1] = max(running)
+            time.sleep(0.02)
+            with lock:
+                running[0] -= 1
+            return 0
+
+        with mock.patch.dict('api.routes.route_batch.READERS', {MetadataKind.segy_revision: slow_revision}):
+            response, items = self.post({"sdpaths": [f"sd://opendes/test/{i}.sgy" for i in range(12)],
+                                         "kinds": ["segy/revision"], "max_concurrency": 3})
+        assert len(items) == 12
+        assert all(item["status"] == 200 for item in items)
+        assert running[1] <= 3
+
+    def test_batch_too_large(self):
+        with mock.patch.object(settings, 'BATCH_MAX_ITEMS', 2), self.assertRaises(HTTPException) as context:
+            self.post({"sdpaths": ["sd://a/b/c", "sd://a/b/d"], "kinds": ["segy/revision", "segy/is3D"]})
+        assert context.exception.status_code == 400
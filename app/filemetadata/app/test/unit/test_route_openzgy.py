@@ -0,0 +1,192 @@
+import sys
+from unittest.mock import Mock
+
+sys.modules['openzgycpp'] = Mock()
+
+import json
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+from api.routes.route_openzgy import router
+from core.config import Settings, settings
+from unit.test_bricks import MemoryZgyReader, make_volume
+from unit.util import apply_test_settings
+
+client = TestClient(router)
+
+TEST_HEADERS = {
+    'content': 'application/json',
+    'appkey': 'xvz1evFS4wEEPTGEFPHBog',
+    'Authorization': 'AAAAAAAAAAAAAAAAAAAAAMLheAAAAAAA0%2BuSeid%2BULvsea4JtiGRiSDSJSI%3DEUifiRBkKG5E2XzMDjRfl76ZC9Ub0wnz4XsNiRVBChTYbJcE3F',
+}
+
+apply_test_settings()
+
+
+class MockZgyReader:
+
+    def __init__(self):
+        self.touched = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def __getattr__(self, name):
+        self.touched.append(name)
+        values = {'size': (10, 20, 30), 'datatype': 'SampleDataType.float', 'annotstart': (1, 1),
+                  'annotinc': (1, 1), 'statistics': (1, 2.0, 3.0, 4.0, 5.0), 'histogram': (6, 0.0, 1.0, [1, 2, 3])}
+        return values.get(name, 0)
+
+
+class RouteOpenZgyTest(unittest.TestCase):
+
+    def get_headers(self, reader, **params):
+        with mock.patch('api.routes.route_openzgy.zgy.ZgyReader', return_value=reader):
+            response = client.get(Settings.BASE_URL + Settings.API_PATH + "openzgy/headers",
+                                  params=dict(sdpath="sd://opendes/test/a.zgy", **params), headers=TEST_HEADERS)
+        assert response.status_code == 200
+        return response.json()
+
+    def test_all_headers(self):
+        headers = json.loads(self.get_headers(MockZgyReader()))
+        assert headers['Size'] == [10, 20, 30]
+        assert headers['Histogram']['Bins'] == [1, 2, 3]
+        assert len(headers) == 24
+
+    def test_selected_fields_only_touch_their_properties(self):
+        reader = MockZgyReader()
+        text = self.get_headers(reader, fields="Size,DataType")
+        assert json.loads(text) == {'Size': [10, 20, 30], 'DataType': 'SampleDataType.float'}
+        assert reader.touched == ['size', 'datatype']
+        assert '\n' not in text
+
+    def test_histogram_without_bins(self):
+        headers = json.loads(self.get_headers(MockZgyReader(), fields="Histogram", histogram_bins=False))
+        assert headers == {'Histogram': {'Count': 6, 'Minimum': 0.0, 'Maximum': 1.0}}
+
+    def test_pretty(self):
+        assert self.get_headers(MockZgyReader(), fields="Size", pretty=True).startswith('{\n  "Size"')
+
+    def test_unknown_field(self):
+        with self.assertRaises(HTTPException) as context:
+            client.get(Settings.BASE_URL + Settings.API_PATH + "openzgy/headers",
+                       params={"sdpath": "sd://opendes/test/a.zgy", "fields": "Size,Nope"}, headers=TEST_HEADERS)
+        assert context.exception.status_code == 400
+
+
+class RouteOpenZgyBinGridTest(unittest.TestCase):
+
+    def test_footprint_is_recorded_also_from_the_cache(self):
+        reader = MockZgyReader()
+        reader.__dict__.update(indexcorners=[(0, 0), (9, 0), (0, 19), (9, 19)],
+                               annotcorners=[(1, 1), (10, 1), (1, 20), (10, 20)],
+                               corners=[(0.0, 0.0), (90.0, 0.0), (0.0, 190.0), (90.0, 190.0)])
+        url = Settings.BASE_URL + Settings.API_PATH + "openzgy/bingrid"
+        params = {"sdpath": "sd://opendes/test/bingrid.zgy"}
+        with mock.patch('api.routes.route_openzgy.zgy.ZgyReader', return_value=reader), \
+                mock.patch('api.routes.route_openzgy.record_footprint') as record:
+            values = json.loads(client.get(url, params=params, headers=TEST_HEADERS).json())
+            with mock.patch('api.routes.route_openzgy.read_bingrid_values', return_value=values):
+                client.get(url, params=params, headers=TEST_HEADERS)
+        assert record.call_args_list == [mock.call("sd://opendes/test/bingrid.zgy", reader.corners)] * 2
+
+
+class RouteOpenZgyTransformTest(unittest.TestCase):
+
+    def post_transform(self, headers=TEST_HEADERS, **kwargs):
+        reader = MockZgyReader()
+        reader.__dict__.update(indexcorners=[(0, 0), (9, 0), (0, 19), (9, 19)],
+                               annotcorners=[(100, 10), (109, 10), (100, 29), (109, 29)],
+                               corners=[(0.0, 0.0), (90.0, 0.0), (0.0, 190.0), (90.0, 190.0)])
+        with mock.patch('api.routes.route_openzgy.zgy.ZgyReader', return_value=reader):
+            response = client.post(Settings.BASE_URL + Settings.API_PATH + "openzgy/transform",
+                                   params={"sdpath": "sd://opendes/test/transform.zgy", "source": "annotation",
+                                           "target": "world"}, headers=headers, **kwargs)
+        assert response.status_code == 200
+        return response
+
+    def test_json_points(self):
+        response = self.post_transform(json={"points": [[100, 10], [105, 12]]})
+        assert np.allclose(response.json()["points"], [[0, 0], [50, 20]])
+
+    def test_binary_points(self):
+        body = np.array([[109, 29], [101, 11]], dtype='<f8').tobytes()
+        response = self.post_transform(dict(TEST_HEADERS, **{'content-type': 'application/octet-stream'}), data=body)
+        assert np.allclose(np.frombuffer(response.content, dtype='<f8').reshape(-1, 2), [[90, 190], [10, 10]])
+
+    def test_too_many_points(self):
+        with mock.patch.object(settings, 'TRANSFORM_MAX_POINTS', 1), self.assertRaises(HTTPException) as context:
+            self.post_transform(json={"points": [[100, 10], [105, 12]]})
+        assert context.exception.status_code == 400
+
+
+def post_volume_request(route, reader_size=(10, 12, 5), **kwargs):
+    reader = MemoryZgyReader(make_volume(reader_size))
+    reader.indexcorners = [(0, 0), (9, 0), (0, 11), (9, 11)]
+    reader.annotcorners = [(100, 10), (109, 10), (100, 21), (109, 21)]
+    reader.corners = [(0.0, 0.0), (90.0, 0.0), (0.0, 110.0), (90.0, 110.0)]
+    reader.zstart, reader.zinc, reader.nlods = 1000.0, 4.0, 2
+    with mock.patch('api.routes.route_openzgy.zgy.ZgyReader', return_value=mock.MagicMock(
+            __enter__=mock.Mock(return_value=reader))):
+        return client.post(Settings.BASE_URL + Settings.API_PATH + route, **kwargs)
+
+
+class RouteOpenZgyArbitraryLineTest(unittest.TestCase):
+
+    def post_arbitrary_line(self, points, **params):
+        return post_volume_request("openzgy/arbitraryLine", params=dict(sdpath="sd://opendes/test/line.zgy", **params),
+                                   json={"points": points}, headers=TEST_HEADERS)
+
+    def test_annotation_polyline(self):
+        response = self.post_arbitrary_line([[100, 10], [103, 14]], source="annotation", zstart=2)
+        assert response.status_code == 200
+        assert response.headers['X-Trace-Count'] == '6'
+        assert response.headers['X-Samples-Per-Trace'] == '3'
+        traces = np.frombuffer(response.content, dtype='<f4').reshape(6, 3)
+        assert np.allclose(traces[0], 0) and np.allclose(traces[-1], 304)
+
+    def test_samples_outside_the_volume(self):
+        with self.assertRaises(HTTPException) as context:
+            self.post_arbitrary_line([[0, 0], [90, 110]], zstart=4, zcount=2)
+        assert context.exception.status_code == 400
+
+    def test_long_line_is_refused_before_densifying(self):
+        with mock.patch('api.routes.route_openzgy.densify_polyline') as densify, \
+                self.assertRaises(HTTPException) as context:
+            self.post_arbitrary_line([[0, 0], [1e12, 1e12]])
+        assert context.exception.status_code == 400
+        densify.assert_not_called()
+
+
+class RouteOpenZgyGatherTest(unittest.TestCase):
+
+    def post_gather(self, positions, **params):
+        body = np.asarray(positions, dtype='<f8').tobytes()
+        return post_volume_request("openzgy/gather", params=dict(sdpath="sd://opendes/test/gather.zgy", **params),
+                                   data=body, headers=dict(TEST_HEADERS, **{'content-type': 'application/octet-stream'}))
+
+    def test_world_positions(self):
+        response = self.post_gather([[30.0, 20.0, 1002.0], [0.0, 0.0, 2000.0]], source="world")
+        assert response.status_code == 200
+        assert response.headers['X-Point-Count'] == '2'
+        samples = np.frombuffer(response.content, dtype='<f4')
+        assert samples[0] == 302 and np.isnan(samples[1])
+
+    def test_level_of_detail_out_of_range(self):
+        with self.assertRaises(HTTPException) as context:
+            self.post_gather([[0, 0, 0]], lod=2)
+        assert context.exception.status_code == 400
+
+    def test_truncated_positions(self):
+        with self.assertRaises(HTTPException) as context:
+            post_volume_request("openzgy/gather", params={"sdpath": "sd://opendes/test/gather.zgy"}, data=b"x" * 16,
+                                headers=dict(TEST_HEADERS, **{'content-type': 'application/octet-stream'}))
+        assert context.exception.status_code == 400
+
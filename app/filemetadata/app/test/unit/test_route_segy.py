@@ -3,12 +3,20 @@ from unittest.mock import Mock
 
 sys.modules['segysdk'] = Mock()
 
+import json
+import time
 import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
 from unittest import mock
 
 from fastapi.testclient import TestClient
+from api.routes import route_segy
 from api.routes.route_segy import router
 from core.config import Settings
+from core.segy import SegyFileHeader
+from unit.test_segy import make_file_header, make_trace, MemoryReader
 from unit.util import apply_test_settings
 
 client = TestClient(router)
@@ -126,3 +134,117 @@ class RouteSegyTest(unittest.TestCase):
             headers=TEST_HEADERS)
         assert response.status_code == 200
         assert response.json() == {"header": "scaledTraceHeadersValue"}
+
+
+@mock.patch('api.routes.route_segy.__create_segy_session')
+@mock.patch('api.routes.route_segy.__read_file_header')
+class RouteSegyNativeHeaderTest(unittest.TestCase):
+
+    def test_segy_revision(self, mock_read_file_header, mock_create_segy_session):
+        mock_read_file_header.return_value = SegyFileHeader(make_file_header(revision_number=0x0200))
+        response = client.get(
+            Settings.BASE_URL + Settings.API_PATH + "segy/revision?sdpath=sd%3A%2F%2Fopendes%2Fkt-demo%2Fexample.sgy",
+            headers=TEST_HEADERS)
+        assert response.status_code == 200
+        assert response.text == '2'
+        mock_create_segy_session.assert_not_called()
+
+    def test_segy_textualHeader(self, mock_read_file_header, mock_create_segy_session):
+        mock_read_file_header.return_value = SegyFileHeader(make_file_header(text='C 1 NATIVE'))
+        response = client.get(
+            Settings.BASE_URL + Settings.API_PATH + "segy/textualHeader?sdpath=sd%3A%2F%2Fopendes%2Fkt-demo%2Fexample.sgy",
+            headers=TEST_HEADERS)
+        assert response.status_code == 200
+        assert response.json()["header"].startswith("C 1 NATIVE ")
+        mock_create_segy_session.assert_not_called()
+
+    def test_segy_extendedTextualHeaders(self, mock_read_file_header, mock_create_segy_session):
+        mock_read_file_header.return_value = SegyFileHeader(make_file_header())
+        response = client.get(
+            Settings.BASE_URL + Settings.API_PATH + "segy/extendedTextualHeaders?sdpath=sd%3A%2F%2Fopendes%2Fkt-demo%2Fexample.sgy",
+            headers=TEST_HEADERS)
+        assert response.status_code == 200
+        assert response.json() == {"header": "{}"}
+        mock_create_segy_session.assert_not_called()
+
+    def test_segy_extendedTextualHeaders_fallback(self, mock_read_file_header, mock_create_segy_session):
+        mock_read_file_header.return_value = SegyFileHeader(make_file_header(extended_headers=1))
+        mock_create_segy_session.return_value = MockSegySession()
+        response = client.get(
+            Settings.BASE_URL + Settings.API_PATH + "segy/extendedTextualHeaders?sdpath=sd%3A%2F%2Fopendes%2Fkt-demo%2Fexample.sgy",
+            headers=TEST_HEADERS)
+        assert response.status_code == 200
+        assert response.json() == {"header": "ExtendedTextualHeadersValue"}
+
+    def test_segy_binaryHeader(self, mock_read_file_header, mock_create_segy_session):
+        mock_read_file_header.return_value = SegyFileHeader(make_file_header())
+        response = client.get(
+            Settings.BASE_URL + Settings.API_PATH + "segy/binaryHeader?sdpath=sd%3A%2F%2Fopendes%2Fkt-demo%2Fexample.sgy",
+            headers=TEST_HEADERS)
+        assert response.status_code == 200
+        header = json.loads(response.json()["header"])
+        assert header["metadata"] == {"Filenames": ["sd://opendes/kt-demo/example.sgy"], "SegyRevision": 1}
+        assert header["BinaryHeaders"][7] == {"End": 3222, "Id": "SamplesPerTrace", "Start": 3221, "Value": 1000.0}
+        mock_create_segy_session.assert_not_called()
+
+
+class RouteSegyTracesTest(unittest.TestCase):
+
+    def setUp(self):
+        content = make_file_header(sample_format=5, samples_per_trace=2) + b''.join(
+            make_trace(inline, crossline, [inline, crossline]) for inline in (1, 2) for crossline in (1, 2, 3))
+        patchers = [mock.patch('api.routes.route_segy.open_dataset_reader', return_value=MemoryReader(content)),
+                    mock.patch('api.routes.route_segy.settings.SDMS_URL', 'https://sdms.unit-tests.com')]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def get_traces(self, query):
+        response = client.get(
+            Settings.BASE_URL + Settings.API_PATH + "segy/traces?sdpath=sd%3A%2F%2Fopendes%2Fkt-demo%2Fexample.sgy&"
+            + query, headers=TEST_HEADERS)
+        assert response.status_code == 200
+        return response, np.frombuffer(response.content, dtype='<f4').reshape(-1, 2).tolist()
+
+    def test_trace_range(self):
+        with mock.patch('api.routes.route_segy.settings.TRACE_READ_CHUNK_BYTES', 1):
+            response, traces = self.get_traces("start_trace=3&traces_to_dump=10")
+        assert traces == [[1.0, 3.0], [2.0, 1.0], [2.0, 2.0], [2.0, 3.0]]
+        assert response.headers["X-Start-Trace"] == "3"
+        assert response.headers["X-Trace-Count"] == "4"
+
+    def test_inline_and_crossline(self):
+        assert self.get_traces("inline=2")[1] == [[2.0, 1.0], [2.0, 2.0], [2.0, 3.0]]
+        assert self.get_traces("inline=1&crossline=2")[1] == [[1.0, 2.0]]
+
+
+# Process wide credentials like those of segysdk, read when a session is created
+class GlobalCredentialsSegySdk:
+
+    class SegyException(Exception):
+        pass
+
+    def __init__(self):
+        self.bearer = None
+
+    def segy_configure_remote_access(self, url, api_key, bearer):
+        self.bearer = bearer
+        # another thread configuring now would replace the credentials of this one
+        time.sleep(0.01)
+
+    def create_session(self, sdpath, options):
+        return (sdpath, self.bearer)
+
+
+class RouteSegySessionTest(unittest.TestCase):
+
+    def test_concurrent_sessions_use_their_own_bearer(self):
+        sdk = GlobalCredentialsSegySdk()
+        create_session = getattr(route_segy, '__create_segy_session')
+        requests = [(f"Bearer {n % 2}", f"sd://opendes/test/{n % 2}.sgy") for n in range(8)]
+        with mock.patch('api.routes.route_segy.segysdk', sdk), \
+                mock.patch('api.dependencies.authentication.segysdk', sdk), \
+                ThreadPoolExecutor(8) as pool:
+            sessions = list(pool.map(lambda request: create_session(request[0], None, request[1]), requests))
+        assert sessions == [(sdpath, bearer) for bearer, sdpath in requests]
+
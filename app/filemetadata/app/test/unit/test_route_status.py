@@ -1,8 +1,15 @@
+import sys
+from unittest.mock import Mock
+
+sys.modules['segysdk'] = Mock()
+
 import unittest
+from unittest import mock
 
+from fastapi import HTTPException
 from fastapi.testclient import TestClient
 from api.routes.route_status import router
-from core.config import Settings
+from core.config import Settings, settings
 from unit.util import apply_test_settings
 
 client = TestClient(router)
@@ -15,3 +22,34 @@ class RouteStatusTest(unittest.TestCase):
         response = client.get(Settings.BASE_URL + Settings.API_PATH + "service-status")
         assert response.status_code == 200
         assert response.json() == {'status': 'ok'}
+
+    def test_route_memory_diagnostics(self):
+        apply_test_settings()
+        url = Settings.BASE_URL + Settings.API_PATH + "diagnostics/memory"
+        with mock.patch.object(settings, 'ADMIN_API_KEY', 'admin'):
+            response = client.get(url, headers={'x-admin-key': 'admin'})
+            assert response.status_code == 200
+            assert set(response.json()) == {'resident_bytes', 'native', 'tracemalloc'}
+
+            for headers, params, status_code in (({}, {}, 403), ({'x-admin-key': 'other'}, {}, 403),
+                                                 ({'x-admin-key': 'admin'}, {'top': 0}, 400),
+                                                 ({'x-admin-key': 'admin'}, {'top': 100000}, 400)):
+                with self.assertRaises(HTTPException) as context:
+                    client.get(url, headers=headers, params=params)
+                assert context.exception.status_code == status_code
+
+    def test_route_service_readiness(self):
+        apply_test_settings()
+        response = client.get(Settings.BASE_URL + Settings.API_PATH + "service-readiness")
+        assert response.status_code == 200
+        assert response.json()['ready']
+        assert {'in_flight', 'queued', 'queue_delay_seconds', 'p95_seconds', 'cache_hit_ratio'} <= set(response.json())
+
+    def test_route_service_readiness_saturated(self):
+        apply_test_settings()
+        load = {"workers": 16, "in_flight": 16, "queued": 40, "queue_delay_seconds": 5.0}
+        with mock.patch('api.routes.route_status.sdk_load', return_value=load):
+            response = client.get(Settings.BASE_URL + Settings.API_PATH + "service-readiness")
+        assert response.status_code == 503
+        assert not response.json()['ready']
+        assert response.json()['queued'] == 40
@@ -0,0 +1,155 @@
+import sys
+from unittest.mock import Mock
+
+sys.modules['segysdk'] = Mock()
+sys.modules['openzgycpp'] = Mock()
+
+import asyncio
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import grpc
+from fastapi import HTTPException
+from grpc_tools import protoc
+
+from core.config import settings
+from unit.util import apply_test_settings
+
+# the stubs are generated from rpc/filemetadata.proto like the image build does
+APP_PATH = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if protoc.main(['protoc', '-I', APP_PATH, f'--python_out={APP_PATH}', f'--grpc_python_out={APP_PATH}',
+                os.path.join(APP_PATH, 'rpc', 'filemetadata.proto')]) != 0:
+    raise RuntimeError("Generating the gRPC stubs failed")
+
+from rpc import server
+
+apply_test_settings()
+
+
+class AbortError(Exception):
+    def __init__(self, code, details):
+        super().__init__(details)
+        self.code = code
+
+
+class MockContext:
+    def __init__(self, bearer='Bearer token', time_remaining=None):
+        self.metadata = [('authorization', bearer), ('appkey', 'key')] if bearer else []
+        self.remaining = time_remaining
+
+    def invocation_metadata(self):
+        return self.metadata
+
+    def time_remaining(self):
+        return self.remaining
+
+    async def abort(self, code, details):
+        raise AbortError(code, details)
+
+
+def raw_trace_headers(first, count):
+    return {"header": json.dumps({
+        "Metadata": {"ColumnHeaders": [{"Id": "TRACE_SEQUENCE_LINE", "Start": 1, "End": 4}]},
+        "TraceData": [{"TraceNo": trace, "Traces": [trace]} for trace in range(first, first + count)]})}
+
+
+class RpcServerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.servicer = server.FileMetadataServicer()
+
+    def call(self, method, request, context=None):
+        return asyncio.run(method(request, context or MockContext()))
+
+    def stream(self, method, request, context=None):
+        async def collect():
+            return [message async for message in method(request, context or MockContext())]
+        return asyncio.run(collect())
+
+    def test_segy_revision(self):
+        with mock.patch('api.routes.route_segy.read_revision', return_value=2) as read:
+            response = self.call(self.servicer.GetSegyRevision, server.pb.DatasetRequest(sdpath="sd://a/b/c.segy"))
+        assert response.value == 2
+        read.assert_called_once_with('Bearer token', 'key', "sd://a/b/c.segy")
+
+    def test_missing_authorization(self):
+        with self.assertRaises(AbortError) as raised:
+            self.call(self.servicer.GetSegyIs3D, server.pb.DatasetRequest(sdpath="sd://a/b/c.segy"), MockContext(None))
+        assert raised.exception.code == grpc.StatusCode.UNAUTHENTICATED
+
+    def test_http_errors_map_to_status_codes(self):
+        with mock.patch('api.routes.route_segy.read_is_3d', side_effect=HTTPException(status_code=404, detail="gone")):
+            with self.assertRaises(AbortError) as raised:
+                self.call(self.servicer.GetSegyIs3D, server.pb.DatasetRequest(sdpath="sd://a/b/c.segy"))
+        assert raised.exception.code == grpc.StatusCode.NOT_FOUND
+
+    def test_stream_trace_headers_in_chunks(self):
+        def read(bearer, api_key, sdpath, first, count):
+            return raw_trace_headers(first, min(count, 2500 - first + 1))
+
+        with mock.patch.object(settings, 'JOB_TRACES_PER_CHUNK', 1000), \
+                mock.patch('api.routes.route_segy.read_raw_trace_headers', side_effect=read) as reads:
+            chunks = self.stream(self.servicer.StreamSegyTraceHeaders,
+                                 server.pb.TraceHeadersRequest(sdpath="sd://a/b/c.segy", start_trace=1,
+                                                               traces_to_dump=5000))
+        assert [len(chunk.traces) for chunk in chunks] == [1000, 1000, 500]
+        assert len(chunks[0].columns) == 1 and not chunks[1].columns
+        assert chunks[2].traces[-1].trace_no == 2500
+        assert reads.call_count == 3
+
+    def test_segy_binary_header(self):
+        header = {'BinaryHeaders': [{'Id': 'JobIdNumber', 'Start': 3201, 'End': 3204, 'Value': 7.0}],
+                  'metadata': {'Filenames': ["sd://a/b/c.segy"], 'SegyRevision': 1}}
+        with mock.patch('api.routes.route_segy.read_binary_header_values', return_value=header):
+            response = self.call(self.servicer.GetSegyBinaryHeader, server.pb.DatasetRequest(sdpath="sd://a/b/c.segy"))
+        assert response.fields[0].id == 'JobIdNumber' and response.fields[0].value == 7
+        assert response.segy_revision == 1
+
+    def test_zgy_headers_subset(self):
+        headers = {'Size': [10, 20, 30], 'WorldCorners': [[0, 0], [1, 0], [0, 1], [1, 1]]}
+        with mock.patch('api.routes.route_openzgy.read_header_values', return_value=headers) as read:
+            response = self.call(self.servicer.GetZgyHeaders,
+                                 server.pb.ZgyHeadersRequest(sdpath="sd://a/b/c.zgy", fields=['Size', 'WorldCorners']))
+        assert list(response.size) == [10, 20, 30]
+        assert response.world_corners[1].x == 1
+        read.assert_called_once_with('Bearer token', 'key', "sd://a/b/c.zgy", ['Size', 'WorldCorners'], True)
+
+    def test_zgy_headers_unknown_field(self):
+        with self.assertRaises(AbortError) as raised:
+            self.call(self.servicer.GetZgyHeaders, server.pb.ZgyHeadersRequest(sdpath="sd://a/b/c.zgy", fields=['Nope']))
+        assert raised.exception.code == grpc.StatusCode.INVALID_ARGUMENT
+
+
+class StartServerTest(unittest.TestCase):
+
+    def start(self):
+        grpc_server = mock.Mock(start=mock.AsyncMock())
+        with mock.patch('rpc.server.grpc.aio.server', return_value=grpc_server):
+            asyncio.run(server.start_server(50051))
+        return grpc_server
+
+    def test_plain_text(self):
+        grpc_server = self.start()
+        grpc_server.add_insecure_port.assert_called_once_with("[::]:50051")
+        grpc_server.add_secure_port.assert_not_called()
+
+    def test_tls(self):
+        with tempfile.TemporaryDirectory() as directory:
+            paths = {}
+            for name in ('cert', 'key'):
+                paths[name] = os.path.join(directory, f'{name}.pem')
+                with open(paths[name], 'wb') as f:
+                    f.write(f'{name} pem'.encode())
+            with mock.patch.multiple(settings, GRPC_TLS_CERT_FILE=paths['cert'], GRPC_TLS_KEY_FILE=paths['key']), \
+                    mock.patch('rpc.server.grpc.ssl_server_credentials', return_value='credentials') as credentials:
+                grpc_server = self.start()
+        credentials.assert_called_once_with([(b'key pem', b'cert pem')])
+        grpc_server.add_secure_port.assert_called_once_with("[::]:50051", 'credentials')
+        grpc_server.add_insecure_port.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
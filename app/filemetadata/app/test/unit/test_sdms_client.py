@@ -0,0 +1,130 @@
+import asyncio
+import unittest
+
+import requests
+import requests_mock
+from urllib3.exceptions import MaxRetryError, NewConnectionError, ProtocolError
+
+from client.seismic_store import SeismicStoreClient
+from client.storage import RECORDS_PER_PUT, StorageClient
+from client.sdpath import SdmsError
+
+SDMS_URL = "http://sdms/api/v3"
+DATASET_URL = f"{SDMS_URL}/dataset/tenant/opendes/subproject/test/dataset/"
+STORAGE_URL = "http://storage/api/storage/v2"
+
+
+def run(coroutine_function):
+    return asyncio.run(coroutine_function())
+
+
+class SeismicStoreClientTest(unittest.TestCase):
+
+    def client(self, token="Bearer token", **kwargs):
+        return SeismicStoreClient(SDMS_URL, token, api_key="key", backoff=0.001, **kwargs)
+
+    def test_get_dataset(self):
+        async def get():
+            async with self.client() as sdms:
+                return await sdms.get_dataset("sd://opendes/test/folder/a.segy")
+
+        with requests_mock.Mocker() as mocker:
+            mocker.get(DATASET_URL + "a.segy", json={"name": "a.segy"})
+            assert run(get) == {"name": "a.segy"}
+            request = mocker.request_history[0]
+            assert request.headers["Authorization"] == "Bearer token" and request.headers["appkey"] == "key"
+            assert request.qs["path"] == ["/folder/"]
+
+    def test_retries_throttled_requests(self):
+        async def patch():
+            async with self.client() as sdms:
+                return await sdms.patch_dataset("sd://opendes/test/a.segy", {"filemetadata": {}})
+
+        with requests_mock.Mocker() as mocker:
+            mocker.patch(DATASET_URL + "a.segy", [{"status_code": 429}, {"status_code": 502}, {"json": {"ok": True}}])
+            assert run(patch) == {"ok": True}
+            assert mocker.call_count == 3
+
+    def test_create_is_not_repeated_after_a_server_error(self):
+        async def create():
+            async with self.client() as sdms:
+                return await sdms.create_dataset("sd://opendes/test/a.segy")
+
+        with requests_mock.Mocker() as mocker:
+            mocker.post(DATASET_URL + "a.segy", status_code=500, text="failed")
+            with self.assertRaises(SdmsError) as raised:
+                run(create)
+            assert raised.exception.status_code == 500
+            assert mocker.call_count == 1
+
+    def test_create_is_repeated_only_when_never_sent(self):
+        async def create():
+            async with self.client() as sdms:
+                return await sdms.create_dataset("sd://opendes/test/a.segy")
+
+        refused = requests.ConnectionError(MaxRetryError(None, DATASET_URL, NewConnectionError(None, "refused")))
+        with requests_mock.Mocker() as mocker:
+            mocker.post(DATASET_URL + "a.segy", [{"exc": requests.ConnectTimeout}, {"exc": refused},
+                                                 {"json": {"name": "a.segy"}}])
+            assert run(create) == {"name": "a.segy"}
+            assert mocker.call_count == 3
+
+        reset = requests.ConnectionError(ProtocolError("Connection aborted.", ConnectionResetError()))
+        for failure in (reset, requests.ReadTimeout):
+            with requests_mock.Mocker() as mocker:
+                mocker.post(DATASET_URL + "a.segy", [{"exc": failure}, {"json": {"name": "a.segy"}}])
+                with self.assertRaises(SdmsError) as raised:
+                    run(create)
+                assert raised.exception.status_code == 503
+                assert mocker.call_count == 1
+
+    def test_token_refresh(self):
+        tokens = iter(["Bearer old", "Bearer new"])
+
+        async def refresh():
+            return next(tokens)
+
+        async def get():
+            async with self.client(refresh) as sdms:
+                return await asyncio.gather(*(sdms.get_dataset(f"sd://opendes/test/{n}.segy") for n in range(3)))
+
+        def respond(request, context):
+            context.status_code = 200 if request.headers["Authorization"] == "Bearer new" else 401
+            return {}
+
+        with requests_mock.Mocker() as mocker:
+            mocker.get(requests_mock.ANY, json=respond)
+            assert run(get) == [{}, {}, {}]
+            # the rejected bearer is refreshed once for all requests that saw it
+            assert next(tokens, None) is None
+
+    def test_bulk_create_reports_each_dataset(self):
+        async def create():
+            async with self.client(concurrency=2) as sdms:
+                return await sdms.create_datasets((f"sd://opendes/test/{n}.segy", {"type": "GENERIC"})
+                                                  for n in range(5))
+
+        with requests_mock.Mocker() as mocker:
+            mocker.post(requests_mock.ANY, json={})
+            mocker.post(DATASET_URL + "3.segy", status_code=409, text="exists")
+            results = run(create)
+            assert results[:3] == [{}, {}, {}] and results[4] == {}
+            assert isinstance(results[3], SdmsError) and results[3].status_code == 409
+
+
+class StorageClientTest(unittest.TestCase):
+
+    def test_put_records_in_batches(self):
+        async def put():
+            async with StorageClient(STORAGE_URL, "Bearer token", "opendes") as storage:
+                return await storage.put_records({"id": n} for n in range(RECORDS_PER_PUT + 1))
+
+        with requests_mock.Mocker() as mocker:
+            mocker.put(STORAGE_URL + "/records", json={"recordCount": 1})
+            assert len(run(put)) == 2
+            assert sorted(len(request.json()) for request in mocker.request_history) == [1, RECORDS_PER_PUT]
+            assert mocker.request_history[0].headers["data-partition-id"] == "opendes"
+
+
+if __name__ == '__main__':
+    unittest.main()
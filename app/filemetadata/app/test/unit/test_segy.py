@@ -0,0 +1,106 @@
+import struct
+import unittest
+
+import numpy as np
+
+from core.segy import SegyFileHeader, to_styled_json, decode_textual_header, decode_traces, find_traces, \
+    ibm_to_float32, FILE_HEADER_SIZE, TRACE_HEADER_SIZE
+
+
+def make_file_header(text='C 1 CLIENT TEST', encoding='cp037', byte_order='>', sample_format=1,
+                     samples_per_trace=1000, revision_number=0x0100, extended_headers=0):
+    textual = ''.join(f"{line:<80}" for line in [text] + [f"C{i:2d}" for i in range(2, 41)])
+    binary = struct.pack(byte_order + '3i24h', 1, 2, 3, 4, 0, 2000, 0, samples_per_trace, 0, sample_format,
+                         *([0] * 17)).ljust(300, b'\0')
+    binary += struct.pack(byte_order + 'Hhh', revision_number, 1, extended_headers)
+    return (textual.encode(encoding) + binary).ljust(FILE_HEADER_SIZE, b'\0')
+
+
+def make_trace(inline, crossline, samples, byte_order='>', sample_format='f'):
+    header = bytearray(TRACE_HEADER_SIZE)
+    struct.pack_into(byte_order + 'ii', header, 188, inline, crossline)
+    return bytes(header) + struct.pack(f"{byte_order}{len(samples)}{sample_format}", *samples)
+
+
+class MemoryReader:
+
+    def __init__(self, content):
+        self.content = content
+        self.size = len(content)
+
+    def read(self, offset, length):
+        return self.content[offset:offset + length]
+
+
+class SegyTest(unittest.TestCase):
+
+    def test_ebcdic_and_ascii_textual_headers(self):
+        ebcdic = SegyFileHeader(make_file_header(encoding='cp037'))
+        ascii = SegyFileHeader(make_file_header(encoding='ascii'))
+        assert ebcdic.textual_header == ascii.textual_header
+        assert ebcdic.textual_header.startswith('C 1 CLIENT TEST ')
+        assert len(ebcdic.textual_header) == 3200
+
+    def test_decode_textual_header_is_byte_for_byte(self):
+        assert decode_textual_header('C 1 ABC  '.encode('cp037')) == 'C 1 ABC  '
+
+    def test_binary_header_values(self):
+        header = SegyFileHeader(make_file_header(extended_headers=2))
+        assert header.byte_order == '>'
+        assert header.revision == 1
+        assert header.sample_format == 1
+        assert header.samples_per_trace == 1000
+        assert header.extended_textual_header_count == 2
+
+        values = {h['Id']: h['Value'] for h in header.binary_header('sd://t/s/a.sgy')['BinaryHeaders']}
+        assert values['JobIdentificationNumber'] == 1.0
+        assert values['SampleInterval'] == 2000.0
+        assert values['SEGYFormatRevisionNumber'] == 256.0
+
+    def test_little_endian_binary_header(self):
+        header = SegyFileHeader(make_file_header(byte_order='<', sample_format=5))
+        assert header.byte_order == '<'
+        assert header.sample_format == 5
+        assert header.samples_per_trace == 1000
+
+    def test_short_file_header(self):
+        with self.assertRaises(ValueError):
+            SegyFileHeader(b'\0' * 100)
+
+    def test_styled_json_matches_segysdk_layout(self):
+        value = {"b": [{"End": 4, "Value": 1.0}], "a": {"Names": ["x"], "Empty": {}}}
+        assert to_styled_json(value) == (
+            '{\n\t"a" : \n\t{\n\t\t"Empty" : {},\n\t\t"Names" : \n\t\t[\n\t\t\t"x"\n\t\t]\n\t},'
+            '\n\t"b" : \n\t[\n\t\t{\n\t\t\t"End" : 4,\n\t\t\t"Value" : 1.0\n\t\t}\n\t]\n}\n')
+
+    def test_ibm_to_float32(self):
+        words = np.array([0x42640000, 0xC276A000, 0x00000000, 0x41100000, 0x3F800000], dtype=np.uint32)
+        assert ibm_to_float32(words).tolist() == [100.0, -118.625, 0.0, 1.0, 0.03125]
+
+    def test_decode_ibm_traces(self):
+        header = SegyFileHeader(make_file_header(sample_format=1, samples_per_trace=2))
+        raw = make_trace(1, 1, [0x42640000, 0xC276A000], sample_format='I') + make_trace(1, 2, [0, 0x41100000],
+                                                                                         sample_format='I')
+        assert decode_traces(raw, header).tolist() == [[100.0, -118.625], [0.0, 1.0]]
+
+    def test_decode_integer_traces(self):
+        little = SegyFileHeader(make_file_header(byte_order='<', sample_format=3, samples_per_trace=3))
+        raw = make_trace(1, 1, [-2, 0, 300], byte_order='<', sample_format='h')
+        assert decode_traces(raw, little).dtype == np.float32
+        assert decode_traces(raw, little).tolist() == [[-2.0, 0.0, 300.0]]
+
+        three_byte = SegyFileHeader(make_file_header(sample_format=15, samples_per_trace=2))
+        raw = make_trace(1, 1, [], sample_format='i') + b'\xff\xff\xfe' + b'\x01\x00\x00'
+        assert decode_traces(raw, three_byte).tolist() == [[-2.0, 65536.0]]
+
+    def test_find_traces(self):
+        header = SegyFileHeader(make_file_header(sample_format=5, samples_per_trace=1))
+        keys = [(inline, crossline) for inline in (10, 11, 12) for crossline in range(5)]
+        content = make_file_header(sample_format=5, samples_per_trace=1) + \
+            b''.join(make_trace(inline, crossline, [0.0]) for inline, crossline in keys)
+        reader = MemoryReader(content)
+        count = header.trace_count(reader.size)
+        assert count == 15
+        assert find_traces(reader, header, count, 11) == (5, 5)
+        assert find_traces(reader, header, count, 12, 3) == (13, 1)
+        assert find_traces(reader, header, count, 13)[1] == 0
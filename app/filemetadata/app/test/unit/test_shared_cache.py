@@ -0,0 +1,48 @@
+import unittest
+from unittest import mock
+
+from core.config import settings
+from core.shared_cache import LocalCacheBackend, TieredCache, cache_key, create_backend, decode, encode
+
+
+class SharedCacheTest(unittest.TestCase):
+
+    def test_round_trip(self):
+        value = {"header": "C 1 CLIENT" * 100, "Size": [10, 20, 30], "is3D": True}
+        data = encode(value)
+        assert isinstance(data, bytes) and len(data) < len(str(value))
+        assert decode(data) == value
+
+    def test_versioned_keys(self):
+        key = cache_key("segy/revision", "sd://a/b/c.segy", "v1")
+        assert key.startswith("filemetadata:v1:segy/revision:")
+        assert key != cache_key("segy/revision", "sd://a/b/c.segy", "v2")
+        assert key != cache_key("segy/revision", "sd://a/b/c.segy", "v1", (["Size"],))
+
+    def test_local_backend_expiry_and_capacity(self):
+        backend = LocalCacheBackend(2)
+        backend.set('a', b'1', 60)
+        backend.set('b', b'2', 60)
+        backend.get('a')
+        backend.set('c', b'3', 60)
+        assert backend.get('b') is None and backend.get('a') == b'1'
+        with mock.patch('time.monotonic', return_value=10 ** 9):
+            assert backend.get('a') is None
+
+    def test_far_hits_fill_the_near_tier(self):
+        far = LocalCacheBackend(10)
+        TieredCache(LocalCacheBackend(10), far).put('key', [1, 2])
+        near = LocalCacheBackend(10)
+        assert TieredCache(near, far).get('key') == (True, [1, 2])
+        assert near.get('key') is not None
+        assert TieredCache(LocalCacheBackend(10), LocalCacheBackend(10)).get('key') == (False, None)
+
+    def test_backends(self):
+        with mock.patch.object(settings, 'SHARED_CACHE_SIZE', 5):
+            assert create_backend('memory://').capacity == 5
+        with self.assertRaises(ValueError):
+            create_backend('memcached://cache:11211')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+import unittest
+
+import requests_mock
+
+from core import sdms
+from core.config import settings
+from core.storage import DatasetObjectReader, StorageError
+
+SDMS_URL = "https://sdms.unit-tests.com/api/v3"
+BLOB_URL = "https://account.blob.core.windows.net"
+DATASET_URL = SDMS_URL + "/dataset/tenant/opendes/subproject/test/dataset/example.sgy"
+TOKEN_URL = SDMS_URL + "/utility/gcs-access-token"
+CONTENT = bytes(range(256)) * 40
+
+
+def mock_objects(mocker, objects):
+    mocker.get(DATASET_URL, json={'gcsurl': 'container/prefix',
+                                  'filemetadata': {'nobjects': len(objects), 'size': sum(map(len, objects))}})
+    mocker.get(TOKEN_URL, json={'access_token': BLOB_URL + '/container?sig=abc', 'expires_in': 3599,
+                                'token_type': 'SasUrl'})
+
+    for index, data in enumerate(objects):
+        def ranged(request, context, data=data):
+            start, end = map(int, request.headers['Range'][len('bytes='):].split('-'))
+            if start >= len(data):
+                context.status_code = 416
+                context.headers['Content-Range'] = f"bytes */{len(data)}"
+                return b''
+            context.status_code = 206
+            context.headers['Content-Range'] = f"bytes {start}-{min(end, len(data) - 1)}/{len(data)}"
+            return data[start:end + 1]
+
+        mocker.get(f"{BLOB_URL}/container/prefix/{index}?sig=abc", content=ranged)
+
+
+class StorageTest(unittest.TestCase):
+
+    def setUp(self):
+        self.sdms_url = settings.SDMS_URL
+        settings.SDMS_URL = SDMS_URL
+        sdms._storage_tokens.clear()
+
+    def tearDown(self):
+        settings.SDMS_URL = self.sdms_url
+
+    def test_read_within_first_object(self):
+        with requests_mock.Mocker() as mocker:
+            mock_objects(mocker, [CONTENT[:6000], CONTENT[6000:]])
+            reader = DatasetObjectReader('Bearer token', 'sd://opendes/test/example.sgy')
+            assert reader.read(0, 3600) == CONTENT[:3600]
+            assert mocker.call_count == 3
+
+    def test_read_across_objects(self):
+        with requests_mock.Mocker() as mocker:
+            mock_objects(mocker, [CONTENT[:3000], CONTENT[3000:5000], CONTENT[5000:]])
+            reader = DatasetObjectReader('Bearer token', 'sd://opendes/test/example.sgy')
+            assert reader.read(0, 3600) == CONTENT[:3600]
+            assert reader.read(4000, 3000) == CONTENT[4000:7000]
+
+    def test_read_past_end(self):
+        with requests_mock.Mocker() as mocker:
+            mock_objects(mocker, [CONTENT])
+            reader = DatasetObjectReader('Bearer token', 'sd://opendes/test/example.sgy')
+            with self.assertRaises(StorageError):
+                reader.read(len(CONTENT) - 10, 20)
+
+    def test_dataset_lookup_error(self):
+        with requests_mock.Mocker() as mocker:
+            mocker.get(DATASET_URL, status_code=403, text='forbidden')
+            with self.assertRaises(sdms.SdmsError) as context:
+                DatasetObjectReader('Bearer token', 'sd://opendes/test/example.sgy')
+            assert context.exception.status_code == 403
+
+    def test_parse_sdpath(self):
+        sdpath = sdms.SdPath.parse('sd://opendes/test/a/b/example.sgy')
+        assert (sdpath.tenant, sdpath.subproject, sdpath.path, sdpath.name) == ('opendes', 'test', '/a/b/', 'example.sgy')
+        assert sdms.SdPath.parse('sd://opendes/test/example.sgy').path == '/'
+        with self.assertRaises(sdms.SdmsError):
+            sdms.SdPath.parse('sd://opendes/test')
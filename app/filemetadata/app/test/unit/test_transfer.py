@@ -0,0 +1,126 @@
+import base64
+import hashlib
+import os
+import re
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from client.transfer import BlobTransfer, TransferError
+
+
+# Stand-in for a blob store: block blobs with staged blocks, block lists and range reads
+class BlobHandler(BaseHTTPRequestHandler):
+    blobs = {}
+    staged = {}
+    requests = []
+    fail_next = []
+
+    def log_message(self, *args):
+        pass
+
+    def _answer(self, status, body=b'', headers=None):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_PUT(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        self.requests.append(('PUT', query.get('comp', [''])[0], len(body)))
+        if self.fail_next:
+            return self._answer(self.fail_next.pop())
+        if 'Content-MD5' in self.headers and \
+                self.headers['Content-MD5'] != base64.b64encode(hashlib.md5(body).digest()).decode():
+            return self._answer(400)
+
+        if query.get('comp') == ['block']:
+            self.staged[(url.path, query['blockid'][0])] = body
+        elif query.get('comp') == ['blocklist']:
+            ids = re.findall(r'<Latest>(.*?)</Latest>', body.decode())
+            self.blobs[url.path] = (b''.join(self.staged.pop((url.path, i)) for i in ids),
+                                    self.headers['x-ms-blob-content-md5'])
+        else:
+            self.blobs[url.path] = (body, self.headers['Content-MD5'])
+        self._answer(201)
+
+    def do_GET(self):
+        content, md5 = self.blobs[urlparse(self.path).path]
+        self.requests.append(('GET', self.headers.get('Range'), 0))
+        start, end = map(int, re.match(r'bytes=(\d+)-(\d+)', self.headers['Range']).groups())
+        end = min(end, len(content) - 1)
+        self._answer(206, content[start:end + 1], {'Content-Range': f'bytes {start}-{end}/{len(content)}',
+                                                   'x-ms-blob-content-md5': md5})
+
+
+class TransferTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), BlobHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.url = f"http://127.0.0.1:{cls.server.server_port}/container/blob?sig=signed"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        BlobHandler.requests.clear()
+        BlobHandler.fail_next.clear()
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_round_trip_in_blocks(self):
+        content = os.urandom(10 * 1000 + 7)
+        source = os.path.join(self.directory.name, 'source')
+        with open(source, 'wb') as file:
+            file.write(content)
+
+        progress = []
+        with BlobTransfer(block_size=1000, concurrency=3, progress=lambda done, total: progress.append(done)) as transfer:
+            uploaded = transfer.upload(self.url, source)
+            assert uploaded['blocks'] == 11
+            assert uploaded['md5'] == base64.b64encode(hashlib.md5(content).digest()).decode()
+            assert progress[-1] == len(content)
+
+            target = os.path.join(self.directory.name, 'target')
+            downloaded = transfer.download(self.url, target)
+        assert downloaded == uploaded
+        with open(target, 'rb') as file:
+            assert file.read() == content
+        # a probe and one ranged read per block
+        assert len([r for r in BlobHandler.requests if r[0] == 'GET']) == 12
+
+    def test_small_content_is_one_put(self):
+        with BlobTransfer(block_size=1000) as transfer:
+            transfer.upload(self.url, b'small')
+            target = os.path.join(self.directory.name, 'target')
+            assert transfer.download(self.url, target)['size'] == 5
+        assert BlobHandler.requests[0] == ('PUT', '', 5)
+
+    def test_failed_blocks_are_retried(self):
+        BlobHandler.fail_next.extend([503, 500])
+        with BlobTransfer(block_size=100, backoff=0.001) as transfer:
+            transfer.upload(self.url, bytes(range(256)) * 2)
+        assert len([r for r in BlobHandler.requests if r[1] == 'block']) == 6 + 2
+
+    def test_checksum_mismatch(self):
+        with BlobTransfer(block_size=1000) as transfer:
+            transfer.upload(self.url, b'x' * 3000)
+            BlobHandler.blobs['/container/blob'] = (b'y' * 3000, BlobHandler.blobs['/container/blob'][1])
+            with self.assertRaises(TransferError):
+                transfer.download(self.url, os.path.join(self.directory.name, 'target'))
+
+
+if __name__ == '__main__':
+    unittest.main()